@@ -0,0 +1,111 @@
+from threading import Lock
+from typing import Dict, Iterable, List, Tuple
+
+# Shared registry of chemical elements, which defines (1) a single, deterministic element -> column index layout
+# used for all composition vectors and matrices in PyQAlloy and (2) precomputed IUPAC ordering ranks used to order
+# elements in formula strings. The layout starts with the ULTERA V1 composition vector order, followed by all other
+# elements by atomic number, and can be extended at runtime (e.g. with isotopes like D). Indices are never
+# reassigned, so matrices persisted or cached with this layout remain valid across runs and processes.
+
+# Order of the ULTERA database (V1 of the Composition Vector). Do not change, as it defines the stored vectors.
+ULTERA_V1_ELEMENTS: Tuple[str, ...] = (
+    'Ni', 'Co', 'Cr', 'Fe', 'Al', 'Ti', 'Mo', 'Zr', 'Nb', 'V', 'W', 'Ta', 'Hf', 'Cu', 'Mn', 'Si', 'B',
+    'Re', 'Ru', 'Sn', 'Zn', 'Mg', 'Li', 'Y', 'Ca', 'Pd', 'Sc', 'Ir', 'Be', 'Nd', 'U', 'Er', 'Dy', 'Gd',
+    'Sm', 'Pr', 'Ce', 'La', 'Ag', 'Ga', 'Bi', 'Pu', 'Th', 'Pb', 'Au', 'Pt', 'Os', 'Yb', 'Ho', 'Ba', 'In',
+    'Cd', 'Sr', 'C', 'O', 'N', 'S')
+
+# All elements by atomic number.
+ELEMENTS_BY_Z: Tuple[str, ...] = (
+    'H', 'He', 'Li', 'Be', 'B', 'C', 'N', 'O', 'F', 'Ne', 'Na', 'Mg', 'Al', 'Si', 'P', 'S', 'Cl', 'Ar', 'K', 'Ca',
+    'Sc', 'Ti', 'V', 'Cr', 'Mn', 'Fe', 'Co', 'Ni', 'Cu', 'Zn', 'Ga', 'Ge', 'As', 'Se', 'Br', 'Kr', 'Rb', 'Sr', 'Y',
+    'Zr', 'Nb', 'Mo', 'Tc', 'Ru', 'Rh', 'Pd', 'Ag', 'Cd', 'In', 'Sn', 'Sb', 'Te', 'I', 'Xe', 'Cs', 'Ba', 'La', 'Ce',
+    'Pr', 'Nd', 'Pm', 'Sm', 'Eu', 'Gd', 'Tb', 'Dy', 'Ho', 'Er', 'Tm', 'Yb', 'Lu', 'Hf', 'Ta', 'W', 'Re', 'Os', 'Ir',
+    'Pt', 'Au', 'Hg', 'Tl', 'Pb', 'Bi', 'Po', 'At', 'Rn', 'Fr', 'Ra', 'Ac', 'Th', 'Pa', 'U', 'Np', 'Pu', 'Am', 'Cm',
+    'Bk', 'Cf', 'Es', 'Fm', 'Md', 'No', 'Lr', 'Rf', 'Db', 'Sg', 'Bh', 'Hs', 'Mt', 'Ds', 'Rg', 'Cn', 'Nh', 'Fl',
+    'Mc', 'Lv', 'Ts', 'Og')
+
+# IUPAC ordering ranks of elements, equivalent to pymatgen's Element.iupac_ordering.
+IUPAC_ORDERING: Dict[str, int] = {
+    'H': 92, 'He': 5, 'Li': 11, 'Be': 17, 'B': 81, 'C': 86, 'N': 91, 'O': 97, 'F': 102, 'Ne': 4, 'Na': 10, 'Mg': 16,
+    'Al': 80, 'Si': 85, 'P': 90, 'S': 96, 'Cl': 101, 'Ar': 3, 'K': 9, 'Ca': 15, 'Sc': 49, 'Ti': 52, 'V': 55,
+    'Cr': 58, 'Mn': 61, 'Fe': 64, 'Co': 67, 'Ni': 70, 'Cu': 73, 'Zn': 76, 'Ga': 79, 'Ge': 84, 'As': 89, 'Se': 95,
+    'Br': 100, 'Kr': 2, 'Rb': 8, 'Sr': 14, 'Y': 48, 'Zr': 51, 'Nb': 54, 'Mo': 57, 'Tc': 60, 'Ru': 63, 'Rh': 66,
+    'Pd': 69, 'Ag': 72, 'Cd': 75, 'In': 78, 'Sn': 83, 'Sb': 88, 'Te': 94, 'I': 99, 'Xe': 1, 'Cs': 7, 'Ba': 13,
+    'La': 47, 'Ce': 46, 'Pr': 45, 'Nd': 44, 'Pm': 43, 'Sm': 42, 'Eu': 41, 'Gd': 40, 'Tb': 39, 'Dy': 38, 'Ho': 37,
+    'Er': 36, 'Tm': 35, 'Yb': 34, 'Lu': 33, 'Hf': 50, 'Ta': 53, 'W': 56, 'Re': 59, 'Os': 62, 'Ir': 65, 'Pt': 68,
+    'Au': 71, 'Hg': 74, 'Tl': 77, 'Pb': 82, 'Bi': 87, 'Po': 93, 'At': 98, 'Rn': 0, 'Fr': 6, 'Ra': 12, 'Ac': 32,
+    'Th': 31, 'Pa': 30, 'U': 29, 'Np': 28, 'Pu': 27, 'Am': 26, 'Cm': 25, 'Bk': 24, 'Cf': 23, 'Es': 22, 'Fm': 21,
+    'Md': 20, 'No': 19, 'Lr': 18}
+
+# Pauling electronegativities of elements, equivalent to pymatgen's Element.X (elements without a defined value, like
+# noble gases, are omitted). Used for the electronegativity ordering of reduced formulas.
+ELECTRONEGATIVITY: Dict[str, float] = {
+    'H': 2.2, 'Li': 0.98, 'Be': 1.57, 'B': 2.04, 'C': 2.55, 'N': 3.04, 'O': 3.44, 'F': 3.98, 'Na': 0.93, 'Mg': 1.31,
+    'Al': 1.61, 'Si': 1.9, 'P': 2.19, 'S': 2.58, 'Cl': 3.16, 'K': 0.82, 'Ca': 1, 'Sc': 1.36, 'Ti': 1.54, 'V': 1.63,
+    'Cr': 1.66, 'Mn': 1.55, 'Fe': 1.83, 'Co': 1.88, 'Ni': 1.91, 'Cu': 1.9, 'Zn': 1.65, 'Ga': 1.81, 'Ge': 2.01,
+    'As': 2.18, 'Se': 2.55, 'Br': 2.96, 'Kr': 3, 'Rb': 0.82, 'Sr': 0.95, 'Y': 1.22, 'Zr': 1.33, 'Nb': 1.6,
+    'Mo': 2.16, 'Tc': 1.9, 'Ru': 2.2, 'Rh': 2.28, 'Pd': 2.2, 'Ag': 1.93, 'Cd': 1.69, 'In': 1.78, 'Sn': 1.96,
+    'Sb': 2.05, 'Te': 2.1, 'I': 2.66, 'Xe': 2.6, 'Cs': 0.79, 'Ba': 0.89, 'La': 1.1, 'Ce': 1.12, 'Pr': 1.13,
+    'Nd': 1.14, 'Pm': 1.13, 'Sm': 1.17, 'Eu': 1.2, 'Gd': 1.2, 'Tb': 1.1, 'Dy': 1.22, 'Ho': 1.23, 'Er': 1.24,
+    'Tm': 1.25, 'Yb': 1.1, 'Lu': 1.27, 'Hf': 1.3, 'Ta': 1.5, 'W': 2.36, 'Re': 1.9, 'Os': 2.2, 'Ir': 2.2, 'Pt': 2.28,
+    'Au': 2.54, 'Hg': 2, 'Tl': 1.62, 'Pb': 2.33, 'Bi': 2.02, 'Po': 2, 'At': 2.2, 'Rn': 2.2, 'Fr': 0.7, 'Ra': 0.9,
+    'Ac': 1.1, 'Th': 1.3, 'Pa': 1.5, 'U': 1.38, 'Np': 1.36, 'Pu': 1.28, 'Am': 1.3, 'Cm': 1.3, 'Bk': 1.3, 'Cf': 1.3,
+    'Es': 1.3, 'Fm': 1.3, 'Md': 1.3, 'No': 1.3, 'Lr': 1.3}
+
+
+class ElementRegistry:
+    '''Append-only registry of elements assigning each a stable column index.
+
+    Args:
+        elements: Initial elements in the order of their indices. Defaults to the ULTERA V1 composition vector order
+            followed by all other elements by atomic number.
+    '''
+
+    def __init__(self, elements: Iterable[str] = None):
+        if elements is None:
+            elements = ULTERA_V1_ELEMENTS + tuple(el for el in ELEMENTS_BY_Z if el not in ULTERA_V1_ELEMENTS)
+        self._lock = Lock()
+        self._index: Dict[str, int] = {}
+        self._elements: List[str] = []
+        self.register(elements)
+
+    @property
+    def elements(self) -> Tuple[str, ...]:
+        '''All registered elements in the order of their indices.'''
+        return tuple(self._elements)
+
+    def register(self, elements: Iterable[str]) -> None:
+        '''Registers new elements at the end of the layout. Elements already registered are skipped.'''
+        with self._lock:
+            for el in elements:
+                if el not in self._index:
+                    self._index[el] = len(self._elements)
+                    self._elements.append(el)
+
+    def index(self, el: str) -> int:
+        '''Returns the column index of the element, registering it first if it is not yet known.'''
+        if el not in self._index:
+            self.register([el])
+        return self._index[el]
+
+    def order(self, elements: Iterable[str]) -> List[str]:
+        '''Returns the elements (deduplicated) ordered by their column indices, registering unknown ones.'''
+        return sorted(set(elements), key=self.index)
+
+    def __contains__(self, el: str) -> bool:
+        return el in self._index
+
+    def __len__(self) -> int:
+        return len(self._elements)
+
+
+def iupacRank(el: str) -> int:
+    '''Returns the IUPAC ordering rank of the element (or species) symbol, falling back to pymatgen for the symbols
+    not in the precomputed table.'''
+    if el not in IUPAC_ORDERING:
+        from pymatgen.core.periodic_table import get_el_sp
+        IUPAC_ORDERING[el] = get_el_sp(el).iupac_ordering
+    return IUPAC_ORDERING[el]
+
+
+elementRegistry = ElementRegistry()
@@ -1,21 +1,24 @@
 import bson.json_util
-import requests
 import json
+import math
+import time
 from importlib import resources
 from urllib.parse import urlparse
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from typing import Union, Tuple, List, Dict, Any
+from typing import Union, Tuple, List, Dict, Any, Iterator, TYPE_CHECKING
 
-import pandas as pd
 import bson
-from montydb import MontyClient
-from montydb.types.bson import init as bson_init
-from pymongo import MongoClient
-from pymongo.collection import Collection
+import numpy as np
 
 from pyqalloy.core.utils import datapoint2entry
 
+# Heavy dependencies (openpyxl, MontyDB, pymongo, requests) are imported inside the functions using them, so that
+# importing PyQAlloy stays fast for short-lived processes which do not need all of them.
+if TYPE_CHECKING:
+    import requests
+    from pymongo.collection import Collection
+
 __version__ = '0.3.5'
 __authors__ = [["Adam Krajewski", "ak@psu.edu"]]
 __name__ = 'PyQAlloy'
@@ -85,11 +88,382 @@ def setCredentialsFromURI(
     uri = urlparse(uri)
     setCredentials(uri.username, uri.password, uri.netloc.split('@')[-1])
 
-def parseTemplate(
+# Cell strings recognized as missing values (the default na_values of pandas.read_excel, which was used to read the templates
+# before), so that e.g. "N/A" in a template is treated the same way as an empty cell
+_NA_STRINGS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL',
+    'NaN', 'None', 'n/a', 'nan', 'null'])
+
+
+def _cellValue(value: Any) -> Any:
+    """Normalize the value of a template cell read by openpyxl, i.e., map missing values to None and integral floats to ints."""
+    if isinstance(value, str):
+        return None if value in _NA_STRINGS else value
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if value.is_integer():
+            return int(value)
+    return value
+
+
+def _readLegacyTemplateRows(template: str) -> Iterator[Tuple[Any, ...]]:
+    """Read the rows (columns A:N) of a legacy Excel 97-2003 (.xls) template, which openpyxl does not support, with pandas and
+    the optional xlrd dependency, as the templates were read before the streaming reader. The whole sheet is loaded at once."""
+    try:
+        import xlrd  # noqa: F401
+    except ImportError:
+        raise ValueError(f'{template} is a legacy Excel 97-2003 (.xls) file, which can only be read with the optional xlrd '
+                         f'dependency ("pip install xlrd" or "pip install pyqalloy[xls]"). Please install it or save the '
+                         f'template as .xlsx.') from None
+    import pandas as pd
+    # The missing values are recognized by _cellValue, as for the .xlsx templates
+    df = pd.read_excel(template, header=None, usecols='A:N', dtype=object, keep_default_na=False)
+    for row in df.itertuples(index=False, name=None):
+        yield tuple(row) + (None,) * (14 - len(row))
+
+
+def _readTemplate(
         template: str,
-        targetCollection: Collection,
         verbose: bool = True
-    ) -> None:
+    ) -> Iterator[Union[Dict[str, Any], Tuple[int, Dict[str, Any]]]]:
+    """Read an ULTERA template XLSX file in a single, read-only, streaming pass. The first item yielded is the metadata
+    dictionary (as stored under ``meta`` in each entry), followed lazily by pairs of the Excel spreadsheet line number and the
+    raw datapoint row (dictionary keyed by the column names), for all non-empty rows of the data block without any cap on
+    their number. The metadata block occupies lines 2-5 (columns A:F), the data column names line 9, and the data lines 10+
+    (columns A:N). Legacy .xls templates are read the same way, but loaded at once (see _readLegacyTemplateRows)."""
+    workbook = None
+    if str(template).lower().endswith('.xls'):
+        rows = _readLegacyTemplateRows(template)
+    else:
+        from openpyxl import load_workbook
+        workbook = load_workbook(template, read_only=True, data_only=True)
+        rows = workbook.worksheets[0].iter_rows(min_row=1, max_col=14, values_only=True)
+    try:
+
+        #Import metadata
+        print('Reading the metadata.')
+        metaParsed = [[_cellValue(v) for v in row] for _, row in zip(range(5), rows)][1:]
+        metaParsed += [[None]*14 for _ in range(4 - len(metaParsed))]
+
+        # Format metadata into a dictionary
+        metaData = {
+            'source': 'LIT',
+            'name': metaParsed[0][1],
+            'email': metaParsed[1][1],
+            'directFetch': metaParsed[2][1],
+            'handFetch': metaParsed[3][1],
+            'comment': metaParsed[0][5],
+            'timeStamp': datetime.now(ZoneInfo('America/New_York')),
+            'dataSheetName': template
+        }
+        print('Data credited to: '+metaParsed[0][1])
+        print('Contact email: '+metaParsed[1][1])
+        yield metaData
+
+        # Import data, with the column names following the pandas conventions for the empty and duplicate ones
+        if verbose: print('\nImporting data.')
+        columns = []
+        for _, row in zip(range(4), rows):
+            columns = list(row)
+        for i, column in enumerate(columns):
+            column = f'Unnamed: {i}' if _cellValue(column) is None else str(column)
+            name, n = column, 0
+            while name in columns[:i]:
+                n += 1
+                name = f'{column}.{n}'
+            columns[i] = name
+
+        n = 0
+        for l, row in enumerate(rows, start=10):
+            values = [_cellValue(v) for v in row]
+            if all(v is None for v in values):
+                continue
+            n += 1
+            yield l, dict(zip(columns, values))
+        print('Imported '+str(n)+' datapoints.\n')
+    finally:
+        if workbook is not None:
+            workbook.close()
+
+
+def _iterTemplateEntries(
+        template: str,
+        summary: Dict[str, Any],
+        verbose: bool = True
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Iterate over the ULTERA database entries parsed from an ULTERA template XLSX file, yielding pairs of the Excel
+    spreadsheet line number and the entry. Lines which could not be parsed are reported and appended to the ``errors``
+    list of the ``summary`` dictionary, while the ``datapoints`` count in it is updated as the rows are read."""
+    reader = _readTemplate(template, verbose=verbose)
+    metaData = next(reader)
+
+    # Convert metadata and data into database datapoints
+    for l, datapoint in reader:
+        summary['datapoints'] += 1
+        try:
+            if 'Composition' not in datapoint:
+                raise ValueError('At minimum, the Composition field is required to establish the material entry.')
+            elif  datapoint['Composition'] == '' or datapoint['Composition'] is None:
+                raise ValueError('At minimum, the Composition field is required to establish the material entry but the Composition field provided is empty.')
+            else:
+                uploadEntry = datapoint2entry(metaData, datapoint)
+        except ValueError as e:
+            exceptionMessage = str(e)
+            if verbose: print(f'L{l:<3} [ ] Upload failed! ---> {exceptionMessage}\n')
+            summary['errors'].append(l)
+            continue
+        if verbose: print(f'L{l:<3} [x] {datapoint["Composition"]}')
+        yield l, uploadEntry
+
+
+def _insertBatch(
+        targetCollection: 'Collection',
+        batch: List[Dict[str, Any]]
+    ) -> Tuple[int, List[Tuple[int, str]]]:
+    """Insert a batch of entries into the ``targetCollection`` with a single unordered ``insert_many`` call. Returns the number
+    of inserted entries and the list of (index in the batch, error message) pairs for the entries which failed to insert."""
+    try:
+        result = targetCollection.insert_many(batch, ordered=False)
+        return len(result.inserted_ids), []
+    except Exception as e:
+        # Both pymongo and MontyDB report per-document failures of bulk writes through the details of the exception
+        details = getattr(e, 'details', None)
+        if not isinstance(details, dict) or 'writeErrors' not in details:
+            raise
+        failed = [(writeError['index'], writeError.get('errmsg', 'Write error.')) for writeError in details['writeErrors']]
+        return details.get('nInserted', len(batch) - len(failed)), failed
+
+
+class _EntryWriter:
+    """Streaming writer of ULTERA database entries to a BSON, JSON, or JSON Lines (optionally gzip-compressed) file. Every
+    entry is given an ``_id`` as its first field (the way MongoDB stores it), serialized exactly once, and written right
+    away, so the memory use does not depend on the number of entries. The ``count`` attribute tracks the written entries."""
+
+    def __init__(
+            self,
+            target: str,
+            fileFormat: str,
+            indent: Union[int, str, None] = None,
+            compress: bool = False
+        ) -> None:
+        assert fileFormat in ['bson', 'json', 'jsonl'], 'The fileFormat has to be one of "bson", "json", or "jsonl".'
+        self.target = target
+        self.fileFormat = fileFormat
+        self.indent = indent
+        self.count = 0
+        mode = 'wb' if fileFormat == 'bson' else 'wt'
+        if compress:
+            import gzip
+            self.fp = gzip.open(target, mode, encoding=None if fileFormat == 'bson' else 'utf-8')
+        else:
+            self.fp = open(target, mode, encoding=None if fileFormat == 'bson' else 'utf-8')
+        if fileFormat == 'json':
+            self.fp.write('[')
+
+    @staticmethod
+    def inferFormat(target: str) -> Tuple[str, bool]:
+        """Infer the file format and the gzip compression from the extension of the ``target`` path."""
+        compress = target.endswith('.gz')
+        extension = target[:-3] if compress else target
+        extension = extension.rsplit('.', 1)[-1].lower()
+        if extension == 'ndjson':
+            extension = 'jsonl'
+        assert extension in ['bson', 'json', 'jsonl'], \
+            f'Unrecognized target file extension of {target}. Use .bson, .json, .jsonl, or .ndjson (optionally followed by .gz).'
+        return extension, compress
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        entry = {'_id': bson.ObjectId(), **entry}
+        if self.fileFormat == 'bson':
+            self.fp.write(bson.encode(entry))
+        elif self.fileFormat == 'jsonl':
+            self.fp.write(bson.json_util.dumps(entry) + '\n')
+        elif self.indent is None:
+            # One entry per line of the JSON array
+            self.fp.write((',\n  ' if self.count else '\n  ') + bson.json_util.dumps(entry))
+        else:
+            # Pretty print with the indent specified by the user, nested in the JSON array
+            prefix = ' ' * self.indent if isinstance(self.indent, int) else self.indent
+            serialized = bson.json_util.dumps(entry, indent=self.indent)
+            self.fp.write((',\n' if self.count else '\n') + prefix + serialized.replace('\n', '\n' + prefix))
+        self.count += 1
+
+    def close(self) -> None:
+        if self.fileFormat == 'json':
+            if self.indent is None:
+                self.fp.write('\n]\n')
+            else:
+                self.fp.write('\n]' if self.count else ']')
+        self.fp.close()
+
+    def __enter__(self) -> '_EntryWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class _ArrowEntryWriter:
+    """Streaming writer of ULTERA database entries to a columnar Parquet or Arrow IPC file. The nested entries are flattened into
+    typed columns, with the composition stored as a fixed-width fraction matrix (a fixed-size list column, with the element order
+    stored in the ``elements`` schema metadata), and written in record batches of ``batchSize`` entries."""
+
+    def __init__(
+            self,
+            target: str,
+            fileFormat: str,
+            elements: Union[List[str], None] = None,
+            batchSize: int = 10000
+        ) -> None:
+        assert fileFormat in ['parquet', 'arrow'], 'The fileFormat has to be one of "parquet" or "arrow".'
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError('The Parquet and Arrow exports require pyarrow. Install it with "pip install pyarrow" or '
+                              '"pip install pyqalloy[arrow]".')
+        from pyqalloy.core.elements import elementRegistry
+
+        self.pa = pa
+        self.target = target
+        self.fileFormat = fileFormat
+        self.elements = list(elements) if elements is not None else list(elementRegistry.elements)
+        self.elementIndex = {el: i for i, el in enumerate(self.elements)}
+        self.batchSize = batchSize
+        self.count = 0
+        self.columns = {name: [] for name in self._fields()}
+        self.fractions = []
+
+        self.schema = pa.schema([
+            ('_id', pa.string()),
+            ('name', pa.string()),
+            ('timeStamp', pa.timestamp('ms', tz='UTC')),
+            ('dataSheetName', pa.string()),
+            ('rawFormula', pa.string()),
+            ('formula', pa.string()),
+            ('reducedFormula', pa.string()),
+            ('system', pa.string()),
+            ('nComponents', pa.int32()),
+            ('compositionFractions', pa.list_(pa.float64(), len(self.elements))),
+            ('structure', pa.list_(pa.string())),
+            ('processes', pa.list_(pa.string())),
+            ('observationTemperature', pa.float64()),
+            ('propertyName', pa.string()),
+            ('propertyValue', pa.float64()),
+            ('propertyTemperature', pa.float64()),
+            ('propertySource', pa.string()),
+            ('propertyUnit', pa.string()),
+            ('doi', pa.string()),
+            ('pointer', pa.string()),
+        ], metadata={'elements': json.dumps(self.elements)})
+
+        if fileFormat == 'parquet':
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(target, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(target, self.schema)
+
+    @staticmethod
+    def _fields() -> List[str]:
+        return ['_id', 'name', 'timeStamp', 'dataSheetName', 'rawFormula', 'formula', 'reducedFormula', 'system', 'nComponents',
+                'structure', 'processes', 'observationTemperature', 'propertyName', 'propertyValue', 'propertyTemperature',
+                'propertySource', 'propertyUnit', 'doi', 'pointer']
+
+    @staticmethod
+    def _optionalStr(value: Any) -> Union[str, None]:
+        return None if value is None else str(value)
+
+    @staticmethod
+    def _optionalStrList(values: Union[List[Any], None]) -> Union[List[str], None]:
+        return None if values is None else [None if v is None else str(v) for v in values]
+
+    @staticmethod
+    def _optionalNumber(name: str, value: Any, numberType: type = float) -> Union[float, int, None]:
+        if value is None:
+            return None
+        try:
+            return numberType(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'The {name} value {value!r} is not a number.') from None
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        # Elements outside of the fixed-width matrix would be silently lost, so the entry is rejected instead
+        fractions = [0.0]*len(self.elements)
+        for el, fraction in entry['material']['compositionDictionary'].items():
+            if el not in self.elementIndex:
+                raise ValueError(f'Element {el} is not among the elements of the composition fraction matrix.')
+            fractions[self.elementIndex[el]] = self._optionalNumber('composition fraction', fraction)
+
+        # Every value is converted to the type of its column here, so that an entry which does not fit the schema is
+        # rejected on its own (e.g., a numeric unit or source cell is coerced to a string, while a non-numeric
+        # temperature is an error) and the batches written later cannot fail on it
+        meta, material = entry['meta'], entry['material']
+        prop, reference = entry.get('property', {}), entry.get('reference', {})
+        toStr, toStrList, toNumber = self._optionalStr, self._optionalStrList, self._optionalNumber
+        timeStamp = meta.get('timeStamp')
+        if timeStamp is not None and not isinstance(timeStamp, datetime):
+            raise ValueError(f'The timeStamp value {timeStamp!r} is not a datetime.')
+        row = {
+            '_id': str(bson.ObjectId()),
+            'name': toStr(meta.get('name')),
+            'timeStamp': timeStamp,
+            'dataSheetName': toStr(meta.get('dataSheetName')),
+            'rawFormula': toStr(material['rawFormula']),
+            'formula': toStr(material['formula']),
+            'reducedFormula': toStr(material['reducedFormula']),
+            'system': toStr(material['system']),
+            'nComponents': toNumber('nComponents', material['nComponents'], int),
+            'structure': toStrList(material.get('structure')),
+            'processes': toStrList(material.get('processes')),
+            'observationTemperature': toNumber('observationTemperature', material.get('observationTemperature')),
+            'propertyName': toStr(prop.get('name')),
+            'propertyValue': toNumber('property value', prop.get('value')),
+            'propertyTemperature': toNumber('property temperature', prop.get('temperature')),
+            'propertySource': toStr(prop.get('source')),
+            'propertyUnit': toStr(prop.get('unitName')),
+            'doi': toStr(reference.get('doi')),
+            'pointer': toStr(reference.get('pointer')),
+        }
+        for name, value in row.items():
+            self.columns[name].append(value)
+        self.fractions.append(fractions)
+        self.count += 1
+        if len(self.fractions) >= self.batchSize:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self.fractions:
+            return
+        pa = self.pa
+        arrays = []
+        for field in self.schema:
+            if field.name == 'compositionFractions':
+                matrix = np.asarray(self.fractions, dtype=np.float64).reshape(-1)
+                arrays.append(pa.FixedSizeListArray.from_arrays(pa.array(matrix), len(self.elements)))
+            else:
+                arrays.append(pa.array(self.columns[field.name], type=field.type))
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+        # The batch is only cleared once it has been written, so that the entries of a failed write are not silently lost
+        self.columns = {name: [] for name in self._fields()}
+        self.fractions = []
+
+    def close(self) -> None:
+        self._flush()
+        self.writer.close()
+
+    def __enter__(self) -> '_ArrowEntryWriter':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def parseTemplate(
+        template: str,
+        targetCollection: 'Collection',
+        verbose: bool = True,
+        batchSize: int = 1000
+    ) -> Dict[str, Any]:
     """Parse an ULTERA template XLSX file and persist the data ainto the ``targetCollection``. The template file should be
     in the ULTERA format (at least version 4) and contain all the required fields (e.g. "composition"). Please note that running this
     will only create a dataset of raw ULTERA upload entries which will (a) miss several fields, (b) not be validated, (c) only 
@@ -101,61 +475,67 @@ def parseTemplate(
         template: The path to the template file in the XLSX format.
         target: The MongoDB-compatible ``Collection`` object where the parsed data will be stored. It's quite flexible and can
             be pointed to both in-memory ``mongomock`` or ``MontyDB`` databases, or to a real MongoDB database in the cloud or on-premises.
+        verbose: If True, the parsing and upload result is printed for every line of the template. Defaults to True.
+        batchSize: Number of entries sent to the ``targetCollection`` in a single unordered ``insert_many`` call, i.e., in a single
+            network round trip for remote databases. Entries failing to insert do not stop the rest of the batch and are reported
+            by their spreadsheet line numbers like any parsing errors. Defaults to 1000.
 
     Returns:
-        None. It persists the parsed data to the target collection.
+        A summary dictionary with the number of ``datapoints`` read from the template, the number of entries ``inserted`` into the
+        ``targetCollection``, the list of spreadsheet lines which failed to parse or insert (``errors``), and the total ``elapsed``
+        time in seconds.
     """
+    assert batchSize > 0, 'The batchSize has to be a positive integer.'
+    startTime = time.perf_counter()
+    summary = {'datapoints': 0, 'inserted': 0, 'errors': [], 'elapsed': 0.0}
+
+    def flush(batch, batchLines):
+        inserted, failed = _insertBatch(targetCollection, batch)
+        summary['inserted'] += inserted
+        for i, exceptionMessage in failed:
+            if verbose: print(f'L{batchLines[i]:<3} [ ] Upload failed! ---> {exceptionMessage}\n')
+            summary['errors'].append(batchLines[i])
+
+    batch, batchLines = [], []
+    for l, uploadEntry in _iterTemplateEntries(template, summary, verbose=verbose):
+        batch.append(uploadEntry)
+        batchLines.append(l)
+        if len(batch) >= batchSize:
+            flush(batch, batchLines)
+            batch, batchLines = [], []
+    if batch:
+        flush(batch, batchLines)
+
+    summary['errors'].sort()
+    if summary['errors']:
+        print(f'\nUpload failed for {len(summary["errors"])} entries on Excel spreadsheet lines: {summary["errors"]}.\n')
+
+    summary['elapsed'] = time.perf_counter() - startTime
+    if verbose: print(f'Inserted {summary["inserted"]} of {summary["datapoints"]} datapoints in {summary["elapsed"]:.2f}s.')
+    return summary
+
+
+def _parseTemplateToFile(
+        template: str,
+        writer: _EntryWriter,
+        verbose: bool = True
+    ) -> None:
+    """Stream the entries parsed from the ``template`` into the ``writer`` and report the errors and the document count."""
+    summary = {'datapoints': 0, 'inserted': 0, 'errors': [], 'elapsed': 0.0}
+    with writer:
+        for l, uploadEntry in _iterTemplateEntries(template, summary, verbose=verbose):
+            try:
+                writer.write(uploadEntry)
+            except ValueError as e:
+                if verbose: print(f'L{l:<3} [ ] Upload failed! ---> {e}\n')
+                summary['errors'].append(l)
+
+    if summary['errors']:
+        print(f'\nUpload failed for {len(summary["errors"])} entries on Excel spreadsheet lines: {summary["errors"]}.\n')
+    print(f'Serialized the data into {writer.fileFormat.upper()}. Document count:', writer.count)
+
+    print('Persisted the data to the target file: ', writer.target)
 
-    #Import metadata
-    print('Reading the metadata.')
-    metaDF = pd.read_excel(template, usecols="A:F", nrows=4)
-    meta = metaDF.to_json(orient="split")
-    metaParsed = json.loads(meta, strict=False)['data']
-
-    # Format metadata into a dictionary
-    metaData = {
-        'source': 'LIT',
-        'name': metaParsed[0][1],
-        'email': metaParsed[1][1],
-        'directFetch': metaParsed[2][1],
-        'handFetch': metaParsed[3][1],
-        'comment': metaParsed[0][5],
-        'timeStamp': datetime.now(ZoneInfo('America/New_York')),
-        'dataSheetName': template
-    }
-    print('Data credited to: '+metaParsed[0][1])
-    print('Contact email: '+metaParsed[1][1])
-
-    # Import data
-    if verbose: print('\nImporting data.')
-    df2 = pd.read_excel(template, usecols="A:N", nrows=10000, skiprows=8)
-    result = df2.to_json(orient="records")
-    parsed = json.loads(result, strict=False)
-    print('Imported '+str(parsed.__len__())+' datapoints.\n')
-
-    # Convert metadata and data into database datapoints and upload
-    l = 10
-    errors: List[int] = []
-    for datapoint in parsed:
-        try:
-            if 'Composition' not in datapoint:
-                raise ValueError('At minimum, the Composition field is required to establish the material entry.')
-            elif  datapoint['Composition'] == '' or datapoint['Composition'] is None:
-                raise ValueError('At minimum, the Composition field is required to establish the material entry but the Composition field provided is empty.')
-            else:
-                uploadEntry = datapoint2entry(metaData, datapoint)
-                targetCollection.insert_one(uploadEntry)
-                if verbose: print(f'L{l:<3} [x] {datapoint["Composition"]}')
-                l += 1
-        except ValueError as e:
-            exceptionMessage = str(e)
-            if verbose: print(f'L{l:<3} [ ] Upload failed! ---> {exceptionMessage}\n')
-            errors.append(l)
-            l += 1
-            pass
-    
-    if errors:
-        print(f'\nUpload failed for {len(errors)} entries on Excel spreadsheet lines: {errors}.\n')
 
 def parseTemplateToBSON(
         template: str,
@@ -171,28 +551,14 @@ def parseTemplateToBSON(
 
     Args:
         template: The path to the template file in the XLSX format.
-        target: The path to the target file where the parsed data will be stored in the BSON format.
+        target: The path to the target file where the parsed data will be stored in the BSON format. The entries are encoded and
+            written one at a time as they are parsed, in the same layout as ``mongodump`` and the ``examples/ULTERA_sample.bson``.
+        verbose: If True, the parsing result is printed for every line of the template. Defaults to True.
 
     Returns:
         None. It persists the parsed data to the target file.
     """
-    bson_init(use_bson=True)
-    mc = MontyClient(":memory:")
-    tempCollection = mc.temp.temp
-    parseTemplate(template, tempCollection, verbose=verbose)
-    print('Pushed the data to a temportary MontyDB collection in memory. Document count:', tempCollection.count_documents({}))
-    
-    raw = b""
-    for e in tempCollection.find():
-        raw += bson.BSON.encode(e)
-
-    mc.drop_database('temp')
-    mc.close()
-
-    with open(target, "wb") as fp:
-        fp.write(raw)
-
-    print('Persisted the data to the target file: ', target)
+    _parseTemplateToFile(template, _EntryWriter(target, 'bson'), verbose=verbose)
 
 
 def parseTemplateToJSON(
@@ -213,42 +579,225 @@ def parseTemplateToJSON(
         template: The path to the template file in the XLSX format.
         target: The path to the target file where the parsed data will be stored in the JSON format. Please note it may not be able to accomodate
     all data types stored in ULTERA MongoDB now or in the future (e.g. binary data of images or raw experimental data).
+        indent: The indentation of the pretty-printed JSON (4 by default). If None, each entry is written on a separate line
+            of the JSON array. In both cases, the entries are written one at a time as they are parsed.
+        verbose: If True, the parsing result is printed for every line of the template. Defaults to True.
 
     Returns:
         None. It persists the parsed data to the target file.
     """
-    bson_init(use_bson=True)
-    mc = MontyClient(":memory:")
-    tempCollection = mc.temp.temp
-    parseTemplate(template, tempCollection, verbose=verbose)
-    print('Pushed the data to a temportary MontyDB collection in memory. Document count:', tempCollection.count_documents({}))
-
-    with open(target, "w") as fp:
-        dataDicts = []
-        for e in tempCollection.find():
-            # Serialize
-            serialized = bson.json_util.dumps(e)
-            dataDicts.append(json.loads(serialized))
-        # Pretty print with indent specified by the user (4 by default) or one entry per line if indent is None
-        if indent is None:
-            fp.write('[\n')
-            # Write each item on a new line
-            for i, item in enumerate(dataDicts):
-                line = json.dumps(item)
-                if i < len(dataDicts) - 1:
-                    line += ','
-                fp.write('  ' + line + '\n')
-            fp.write(']\n')
-        else:
-            json.dump(dataDicts, fp, indent=indent)
+    _parseTemplateToFile(template, _EntryWriter(target, 'json', indent=indent), verbose=verbose)
+
+
+def parseTemplateToJSONL(
+        template: str,
+        target: str = 'data.jsonl',
+        compress: Union[bool, None] = None,
+        verbose: bool = True
+    ) -> None:
+    """Parse an ULTERA template XLSX file and persist the data as JSON Lines (one Extended JSON document per line) in the target 
+    file, optionally compressed with gzip. Each entry is serialized exactly once, as soon as it is parsed, so the memory use does not
+    depend on the template size, and the result can be appended to, concatenated, or imported directly with ``mongoimport``. The
+    same limitations as for ``parseTemplateToJSON`` apply to the data types and the raw ULTERA upload entries it produces.
+
+    Args:
+        template: The path to the template file in the XLSX format.
+        target: The path to the target file where the parsed data will be stored in the JSON Lines format.
+        compress: If True, the target file is compressed with gzip. If None (default), the compression is enabled when the 
+            target path ends with ``.gz``.
+        verbose: If True, the parsing result is printed for every line of the template. Defaults to True.
 
-    mc.drop_database('temp')
-    mc.close()
+    Returns:
+        None. It persists the parsed data to the target file.
+    """
+    if compress is None:
+        compress = target.endswith('.gz')
+    _parseTemplateToFile(template, _EntryWriter(target, 'jsonl', compress=compress), verbose=verbose)
+
+
+def parseTemplateToParquet(
+        template: str,
+        target: str = 'data.parquet',
+        elements: Union[List[str], None] = None,
+        batchSize: int = 10000,
+        verbose: bool = True
+    ) -> None:
+    """Parse an ULTERA template XLSX file and persist the data in a columnar format, either Parquet or Arrow IPC (Feather V2),
+    depending on the target file extension (``.parquet`` or ``.arrow``). The nested entries are flattened into typed columns,
+    which can be loaded directly by ``pandas``, ``polars``, ``pyarrow``, or Spark without any re-flattening: the ``_id``, the
+    ``name``, ``timeStamp``, and ``dataSheetName`` metadata, the formulas, the ``structure`` and ``processes`` lists, the property
+    name, value, temperature, source, and unit, the ``doi`` and ``pointer``, and the composition as a fixed-width fraction matrix
+    (``compositionFractions``) with the element order stored in the ``elements`` metadata of the schema. Entries are written in
+    record batches, so the memory use is bounded by the ``batchSize``. Requires the optional ``pyarrow`` dependency. The same
+    remarks as for ``parseTemplate`` apply to the produced raw ULTERA upload entries.
+
+    Args:
+        template: The path to the template file in the XLSX format.
+        target: The path to the target file with the ``.parquet`` or ``.arrow`` extension.
+        elements: The elements (columns) of the composition fraction matrix. If None (default), all elements are included,
+            starting with the ULTERA V1 composition vector order (see ``pyqalloy.core.elements``). Entries with elements outside
+            of this list are reported as errors.
+        batchSize: Number of entries in a single record batch (Parquet row group). Defaults to 10000.
+        verbose: If True, the parsing result is printed for every line of the template. Defaults to True.
+
+    Returns:
+        None. It persists the parsed data to the target file.
+
+    """
+    fileFormat = target.rsplit('.', 1)[-1].lower()
+    assert fileFormat in ['parquet', 'arrow'], f'Unrecognized target file extension of {target}. Use .parquet or .arrow.'
+    _parseTemplateToFile(template, _ArrowEntryWriter(target, fileFormat, elements=elements, batchSize=batchSize), verbose=verbose)
+
+
+def parseTemplates(
+        templates: Union[str, List[str]],
+        target: Union['Collection', str],
+        workers: Union[int, None] = None,
+        batchSize: Union[int, None] = None,
+        indent: Union[int, str, None] = None,
+        verbose: bool = False
+    ) -> Dict[str, Any]:
+    """Parse many ULTERA template XLSX files in parallel and persist all the data into a single ``target``, which can be either a
+    MongoDB-compatible ``Collection`` (like in ``parseTemplate``) or a path to a BSON, JSON, or JSON Lines file (like in the
+    ``parseTemplateToBSON``, ``parseTemplateToJSON``, and ``parseTemplateToJSONL``). The templates are read and parsed in a pool
+    of worker processes, while the main process writes the entries to the ``target`` in batches in the order of the templates,
+    so the result does not depend on the number of workers. The same remarks as for ``parseTemplate`` apply to the produced
+    raw ULTERA upload entries.
 
-    print('Persisted the data to the target file: ', target)
+    Args:
+        templates: A list of paths to the template files in the XLSX format or a path to a directory with them, in which case all
+            the ``.xlsx`` files in it (excluding the temporary ``~$`` lock files) are parsed in alphabetical order.
+        target: The MongoDB-compatible ``Collection`` object or the path to the target file, with the format inferred from its
+            extension (``.bson``, ``.json``, ``.jsonl``, or ``.ndjson``, optionally followed by ``.gz`` for gzip compression, or the
+            columnar ``.parquet`` and ``.arrow`` described in ``parseTemplateToParquet``).
+        workers: Number of worker processes. If None (default), the number of CPUs is used. If 1, everything runs in the current
+            process.
+        batchSize: Number of entries sent to the ``target`` collection in a single unordered ``insert_many`` call, or written in
+            a single record batch (Parquet row group) of the ``.parquet`` and ``.arrow`` targets. Batches can span many templates.
+            Defaults to None, meaning 1000 for collections and 10000 for the columnar files (see ``parseTemplateToParquet``).
+            It has no effect on the other file targets.
+        indent: The indentation of the JSON target file. If None (default), each entry is written on a separate line.
+        verbose: If True, the parsing printout of every template (including every line of it) is printed, template by template,
+            after it has been parsed. Otherwise, only a one-line summary per template is printed. Defaults to False.
 
+    Returns:
+        A summary dictionary with the total number of ``datapoints`` read and entries ``inserted`` (written), the dictionary of
+        the spreadsheet lines which failed to parse or insert (``errors``) keyed by the template path (only for templates with
+        errors), the error messages of the templates which could not be read at all keyed by their paths (``failedTemplates``),
+        the per-template summaries (``templates``), and the total ``elapsed`` time in seconds.
+    """
+    import os
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from pyqalloy.core.workers import parseTemplateWorker
+
+    assert batchSize is None or batchSize > 0, 'The batchSize has to be a positive integer.'
+    startTime = time.perf_counter()
+    if isinstance(templates, str):
+        assert os.path.isdir(templates), f'{templates} is not a directory. Provide a directory or a list of template paths.'
+        templates = [os.path.join(templates, f) for f in sorted(os.listdir(templates))
+                     if f.lower().endswith('.xlsx') and not f.startswith('~$')]
+    templates = list(templates)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(templates) or 1))
+    print(f'Parsing {len(templates)} templates with {workers} worker processes.')
+
+    templateSummaries = {}
+    summary = {'datapoints': 0, 'inserted': 0, 'errors': {}, 'failedTemplates': {}, 'templates': templateSummaries, 'elapsed': 0.0}
+
+    writer = None
+    if isinstance(target, str) and target.lower().endswith(('.parquet', '.arrow')):
+        writer = _ArrowEntryWriter(target, target.rsplit('.', 1)[-1].lower(), batchSize=batchSize or 10000)
+    elif isinstance(target, str):
+        fileFormat, compress = _EntryWriter.inferFormat(target)
+        writer = _EntryWriter(target, fileFormat, indent=indent, compress=compress)
+
+    if batchSize is None:
+        batchSize = 1000
+    batch, batchRefs = [], []
+    def flush():
+        inserted, failed = _insertBatch(target, batch)
+        summary['inserted'] += inserted
+        for template, _ in batchRefs:
+            templateSummaries[template]['inserted'] += 1
+        for i, exceptionMessage in failed:
+            template, l = batchRefs[i]
+            if verbose: print(f'{template} L{l:<3} [ ] Upload failed! ---> {exceptionMessage}\n')
+            templateSummaries[template]['inserted'] -= 1
+            templateSummaries[template]['errors'].append(l)
+        batch.clear()
+        batchRefs.clear()
+
+    def collect(template, getResult):
+        try:
+            entries, templateSummary, printout = getResult()
+        except Exception as e:
+            # A template which cannot be read at all does not stop the others from being persisted
+            print(f'Parsing {template} failed! ---> {e}')
+            summary['failedTemplates'][template] = str(e)
+            return
+        if verbose:
+            print(f'\n{template}\n{printout}')
+        templateSummaries[template] = templateSummary
+        summary['datapoints'] += templateSummary['datapoints']
+        for l, uploadEntry in entries:
+            if writer is not None:
+                try:
+                    writer.write(uploadEntry)
+                except ValueError as e:
+                    if verbose: print(f'{template} L{l:<3} [ ] Upload failed! ---> {e}\n')
+                    templateSummary['errors'].append(l)
+                    continue
+                templateSummary['inserted'] += 1
+                summary['inserted'] += 1
+            else:
+                batch.append(uploadEntry)
+                batchRefs.append((template, l))
+                if len(batch) >= batchSize:
+                    flush()
+        print(f'Parsed {template}: {len(entries)} of {templateSummary["datapoints"]} datapoints in '
+              f'{templateSummary["elapsed"]:.2f}s.')
 
-def showDocs(headless=False) -> Tuple[Union[int, requests.models.Response, str], str]:
+    try:
+        if workers == 1:
+            for template in templates:
+                collect(template, lambda: parseTemplateWorker(template, verbose))
+        else:
+            # Templates are submitted in a bounded window and collected in order, so that at most a few parsed templates
+            # are held in memory at any time, regardless of the number of templates
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for template in templates:
+                    pending.append((template, executor.submit(parseTemplateWorker, template, verbose)))
+                    if len(pending) >= 2 * workers:
+                        template, future = pending.popleft()
+                        collect(template, future.result)
+                while pending:
+                    template, future = pending.popleft()
+                    collect(template, future.result)
+        if batch:
+            flush()
+    finally:
+        if writer is not None:
+            writer.close()
+
+    for template, templateSummary in templateSummaries.items():
+        templateSummary['errors'].sort()
+        if templateSummary['errors']:
+            summary['errors'][template] = templateSummary['errors']
+    if summary['errors']:
+        print(f'\nUpload failed for {sum(len(e) for e in summary["errors"].values())} entries on Excel spreadsheet lines:')
+        for template, errors in summary['errors'].items():
+            print(f'  {template}: {errors}')
+
+    summary['elapsed'] = time.perf_counter() - startTime
+    print(f'Persisted {summary["inserted"]} of {summary["datapoints"]} datapoints from {len(templates)} templates in '
+          f'{summary["elapsed"]:.2f}s.')
+    return summary
+
+
+def showDocs(headless=False) -> Tuple[Union[int, 'requests.models.Response', str], str]:
     """Open the offline documentation in a web browser, if the documentation is available locally, i.e. when you are
     in the cloned pySIPFENN GitHub repository you've installed in editable mode. It should work as expected if you do
     remote development in VS Code. Note the function doesn't use importlib since docs are not part of the package.
@@ -264,6 +813,7 @@ def showDocs(headless=False) -> Tuple[Union[int, requests.models.Response, str],
         with the response object from the online documentation and the type of documentation that was opened.
     """
     import os
+    import requests
     if os.path.isfile('docs/_build/index.html') and not headless:
         print('Found the local documentation. Opening it now...')
         return os.system('open docs/_build/index.html'), 'local'
@@ -1,6 +1,13 @@
-from pymatgen.core import Composition
-from pymatgen.core.periodic_table import get_el_sp
-from typing import Union, Dict, List
+import math
+import re
+import numpy as np
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from types import MappingProxyType
+from typing import Union, Dict, List, NamedTuple, Mapping, Iterable, Tuple
+
+from pyqalloy.core.elements import elementRegistry, iupacRank, ULTERA_V1_ELEMENTS, ELECTRONEGATIVITY, IUPAC_ORDERING
 
 # Modify composition string from the template into a unified
 # representation of (1) IUPAC standardized formula, (2) pymatgen dictionary
@@ -10,35 +17,331 @@ from typing import Union, Dict, List
 def percentileFormula(
         cd: dict
         ) -> str:
-    order = sorted(cd.keys(), key=lambda s: get_el_sp(s).iupac_ordering)
+    order = sorted(cd.keys(), key=iupacRank)
     return ' '.join([f'{el}{round(100*cd[el], 1):g}' for el in order])
 
 def relationalFormula(
         cd: dict
         ) -> str:
-    order = sorted(cd.keys(), key=lambda s: get_el_sp(s).iupac_ordering)
+    order = sorted(cd.keys(), key=iupacRank)
     lowest = min([v for v in cd.values() if v>0.005])
     return ' '.join([f'{el}{round(cd[el]/lowest, 2):g}' for el in order])
 
-def compStr2compList(
+# Result of a single parse of a raw formula string, as held by the composition cache. The compList is the
+# immutable form of the compStr2compList output (tuple with a read-only compositionDictionary and elements), of
+# which compStr2compList hands every caller a plain copy, and amounts are the (unreduced) element amounts in the
+# order of the formula string. If the formula could not be parsed, compList is None and the error message is
+# retained, so that it is reported the same way on every call. The path records whether the string was handled
+# by the native tokenizer ('native') or by pymatgen ('pymatgen').
+
+class _ParsedComposition(NamedTuple):
+    valid: bool
+    compList: Union[None, tuple]
+    amounts: Union[None, Mapping[str, float]]
+    error: Union[None, str]
+    path: str = 'pymatgen'
+
+def _parseComposition(
         s: str
-        ) -> list:
+        ) -> _ParsedComposition:
+    # pymatgen is imported on the first fallback parse, as the native tokenizer handles most of the formulas
+    from pymatgen.core import Composition
     try:
-        compObj = Composition(s).reduced_composition
-        if not compObj.valid:
-            print("Composition invalid")
-        return [compObj.iupac_formula,
-                dict(compObj.fractional_composition.as_dict()),
-                percentileFormula(dict(compObj.fractional_composition.as_dict())),
-                relationalFormula(dict(compObj.fractional_composition.as_dict())),
-                compObj.anonymized_formula,
-                compObj.reduced_formula,
-                compObj.chemical_system,
-                compObj.chemical_system.split('-'),
-                compObj.__len__()]
+        rawObj = Composition(s)
     except Exception as e:
-        print(e)
+        return _ParsedComposition(False, None, None, str(e))
+    try:
+        compObj = rawObj.reduced_composition
+        fracDict = dict(compObj.fractional_composition.as_dict())
+        compList = (compObj.iupac_formula,
+                    MappingProxyType(fracDict),
+                    percentileFormula(fracDict),
+                    relationalFormula(fracDict),
+                    compObj.anonymized_formula,
+                    compObj.reduced_formula,
+                    compObj.chemical_system,
+                    tuple(compObj.chemical_system.split('-')),
+                    compObj.__len__())
+        return _ParsedComposition(rawObj.valid, compList, MappingProxyType(rawObj.get_el_amt_dict()), None)
+    except Exception as e:
+        return _ParsedComposition(rawObj.valid, None, None, str(e))
+
+# Native tokenizer for the plain "El<number>" grammar covering most of the alloy formulas, e.g. "Al0.5CoCrFeNi" or
+# "Ni60 Cr20 Fe20". It reproduces the pymatgen Composition outputs used by compStr2compList (reduction, IUPAC and
+# electronegativity orderings, polyanion grouping of reduced formulas, and number formatting) without constructing
+# any pymatgen objects. Anything outside of that grammar, e.g. parenthesized groups, hydrates, scientific notation,
+# zero amounts, elements without tabulated data, or pymatgen's "special" formulas (like O2 or Li2O2), returns None
+# so that the string is passed to pymatgen instead.
+
+_AMOUNT_TOLERANCE = 1e-8
+_SPECIAL_FORMULAS = {'LiO', 'NaO', 'KO', 'HO', 'CsO', 'RbO', 'O', 'N', 'F', 'Cl', 'H'}
+_NATIVE_FORMULA_RE = re.compile(r'\s*(?:[A-Z][a-z]*\s*(?:\d+(?:\.\d*)?|\.\d+)?\s*)+')
+_NATIVE_TOKEN_RE = re.compile(r'([A-Z][a-z]*)\s*(\d+(?:\.\d*)?|\.\d+)?')
+
+def _formulaDoubleFormat(
+        afloat: float,
+        ignoreOnes: bool = True
+        ) -> Union[str, int, float]:
+    if ignoreOnes and math.isclose(afloat, 1, abs_tol=_AMOUNT_TOLERANCE):
+        return ''
+    if math.isclose(afloat, round(afloat), abs_tol=_AMOUNT_TOLERANCE, rel_tol=0):
+        return round(afloat)
+    return round(afloat, 8)
+
+def _reduceFormula(
+        symAmt: Dict[str, float]
+        ) -> Tuple[str, int]:
+    syms = sorted(symAmt, key=lambda el: [ELECTRONEGATIVITY[el], el])
+    syms = [el for el in syms if abs(symAmt[el]) > _AMOUNT_TOLERANCE]
+    factor = 1
+    if all(int(v) == v for v in symAmt.values()):
+        factor = abs(math.gcd(*(int(v) for v in symAmt.values())))
+    polyAnions = []
+    if len(syms) >= 3 and ELECTRONEGATIVITY[syms[-1]] - ELECTRONEGATIVITY[syms[-2]] < 1.65:
+        polyForm, polyFactor = _reduceFormula({syms[i]: symAmt[syms[i]] / factor for i in (-2, -1)})
+        if polyFactor != 1:
+            polyAnions.append(f'({polyForm}){polyFactor}')
+    syms = syms[:len(syms) - 2 if polyAnions else len(syms)]
+    reducedForm = []
+    for el in syms:
+        reducedForm.extend((el, str(_formulaDoubleFormat(symAmt[el] * 1.0 / factor))))
+    return ''.join(reducedForm + polyAnions), factor
+
+def _reducedFormulaAndFactor(
+        amounts: Dict[str, float]
+        ) -> Union[None, Tuple[str, int]]:
+    if not all(abs(v - round(v)) < _AMOUNT_TOLERANCE for v in amounts.values()):
+        syms = sorted(amounts, key=lambda el: [ELECTRONEGATIVITY[el], el])
+        return ''.join(f'{el}{_formulaDoubleFormat(amounts[el], ignoreOnes=False)}' for el in syms), 1
+    formula, factor = _reduceFormula({el: round(v) for el, v in amounts.items()})
+    if formula in _SPECIAL_FORMULAS:
+        return None
+    return formula, factor
+
+def _nativeParseComposition(
+        s: str
+        ) -> Union[None, _ParsedComposition]:
+    if not _NATIVE_FORMULA_RE.fullmatch(s):
+        return None
+    amounts: Dict[str, float] = {}
+    for el, amt in _NATIVE_TOKEN_RE.findall(s):
+        if el not in ELECTRONEGATIVITY or el not in IUPAC_ORDERING:
+            return None
+        amounts[el] = amounts.get(el, 0.0) + (float(amt) if amt else 1.0)
+    if any(v < _AMOUNT_TOLERANCE for v in amounts.values()):
+        return None
+
+    # Reduced composition
+    reduction = _reducedFormulaAndFactor(amounts)
+    if reduction is None:
+        return None
+    reduced = {el: v / reduction[1] for el, v in amounts.items()}
+    reducedFormula = _reducedFormulaAndFactor(reduced)
+    if reducedFormula is None:
+        return None
+
+    # Fractional composition
+    nAtoms = 0
+    for v in reduced.values():
+        nAtoms += v
+    fracDict = {el: v / nAtoms for el, v in reduced.items()}
+
+    # Anonymized formula
+    anonAmounts = list(reduced.values())
+    if all(v == int(v) for v in anonAmounts):
+        divisor = math.gcd(*(int(v) for v in anonAmounts))
+        anonAmounts = [v / divisor for v in anonAmounts]
+    anonymizedFormula = ''
+    for letter, amt in zip('ABCDEFGHIJKLMNOPQRSTUVWXYZ', sorted(anonAmounts)):
+        if amt == 1:
+            amtStr = ''
+        elif abs(amt % 1) < 1e-8:
+            amtStr = str(int(amt))
+        else:
+            amtStr = str(amt)
+        anonymizedFormula += f'{letter}{amtStr}'
+
+    chemicalSystem = '-'.join(sorted(reduced))
+    compList = (' '.join(f'{el}{_formulaDoubleFormat(reduced[el], ignoreOnes=False)}' for el in sorted(reduced, key=iupacRank)),
+                MappingProxyType(fracDict),
+                percentileFormula(fracDict),
+                relationalFormula(fracDict),
+                anonymizedFormula,
+                reducedFormula[0],
+                chemicalSystem,
+                tuple(chemicalSystem.split('-')),
+                len(reduced))
+    return _ParsedComposition(True, compList, MappingProxyType(amounts), None, 'native')
+
+class CompositionCache:
+    '''Process-wide, bounded, least-recently-used cache of parsed composition strings. Formula strings are keyed
+    after whitespace normalization (e.g. "Ni60 Cr20  Fe20 " and "Ni60 Cr20 Fe20" share an entry), so that a formula
+    repeated across template rows or database documents goes through pymatgen only once. Cached results are immutable
+    and safe to share between callers. It is thread-safe.
+
+    Args:
+        maxSize: Maximum number of formulas to retain. The least recently used entries are evicted once it is exceeded.
+            Defaults to 16384.
+        nativeParsing: If True, plain "El<number>" formulas are parsed by the native tokenizer and only the remaining
+            ones are passed to pymatgen. If False, all formulas are parsed with pymatgen. Defaults to True.
+    '''
+
+    def __init__(self, maxSize: int = 16384, nativeParsing: bool = True):
+        assert maxSize > 0, 'The maxSize of the composition cache has to be a positive integer.'
+        self.maxSize = maxSize
+        self.nativeParsing = nativeParsing
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(s: str) -> str:
+        '''Returns the cache key for a raw formula string, i.e., the string with its whitespace runs collapsed.'''
+        return ' '.join(s.split())
+
+    def get(self, s: str) -> _ParsedComposition:
+        '''Returns the parsed composition for the raw formula string ``s``, parsing it with pymatgen on a miss.'''
+        key = self.normalize(s)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        parsed = _nativeParseComposition(key) if self.nativeParsing else None
+        if parsed is None:
+            parsed = _parseComposition(key)
+        with self._lock:
+            self._entries[key] = parsed
+            self._entries.move_to_end(key)
+            self._evict()
+        return parsed
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def resize(self, maxSize: int) -> None:
+        '''Sets a new maximum size of the cache, evicting the least recently used entries if needed.'''
+        assert maxSize > 0, 'The maxSize of the composition cache has to be a positive integer.'
+        with self._lock:
+            self.maxSize = maxSize
+            self._evict()
+
+    def clear(self) -> None:
+        '''Removes all entries from the cache and resets the hit, miss, and eviction counters.'''
+        with self._lock:
+            self._entries.clear()
+            self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def info(self) -> Dict[str, int]:
+        '''Returns a dictionary with the current size, maximum size, and hit/miss/eviction counters of the cache.'''
+        with self._lock:
+            return {'size': len(self._entries),
+                    'maxSize': self.maxSize,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+compositionCache = CompositionCache()
+
+# Reports which parsing path ('native' or 'pymatgen') the composition string takes.
+
+def compStrParsingPath(
+        s: str
+        ) -> str:
+    return compositionCache.get(s).path
+
+def compStr2compList(
+        s: str
+        ) -> list:
+    parsed = compositionCache.get(s)
+    if parsed.compList is None:
+        print(parsed.error)
         raise ValueError("Warning! Can't parse composition!: "+s)
+    if not parsed.valid:
+        print("Composition invalid")
+    # The cached result is shared, so the callers get their own plain list, dictionary, and element list
+    compList = list(parsed.compList)
+    compList[1] = dict(compList[1])
+    compList[7] = list(compList[7])
+    return compList
+
+# Returns the (unreduced) element amounts of the composition string in the order they appear in it, e.g.
+# {'Mo': 7.0, 'Cr': 23.0, ...} for "Mo7 Cr23 Fe23 Co23 Ni23", using the composition cache.
+
+def compStr2amounts(
+        s: str
+        ) -> Mapping[str, float]:
+    parsed = compositionCache.get(s)
+    if parsed.amounts is None:
+        print(parsed.error)
+        raise ValueError("Warning! Can't parse composition!: "+s)
+    return parsed.amounts
+
+# Batch version of compStr2compList for bulk analysis. Converts an iterable of formula strings into a dense
+# (n_formulas, n_elements) matrix of atomic fractions, with columns following the returned element index, and
+# a boolean array flagging rows which could not be parsed (or contain elements outside of the requested index).
+# Flagged rows are left as zeros. If elements are not given, the index covers the elements present, ordered
+# by the shared element registry, so the same set of elements always results in the same column order. Each
+# unique formula is parsed (through the composition cache) only once and the matrix is filled with vectorized
+# NumPy indexing, so repeated formulas cost nothing.
+
+def compStrs2fracMatrix(
+        formulas: Iterable[str],
+        elements: Union[None, List[str]] = None
+        ) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    formulas = list(formulas)
+    uniqueIndex: Dict[str, int] = {}
+    rowToUnique = np.empty(len(formulas), dtype=np.int64)
+    for i, f in enumerate(formulas):
+        rowToUnique[i] = uniqueIndex.setdefault(f, len(uniqueIndex))
+
+    uniqueFracs = [None] * len(uniqueIndex)
+    for f, u in uniqueIndex.items():
+        parsed = compositionCache.get(f) if isinstance(f, str) else None
+        if parsed is not None and parsed.compList is not None:
+            uniqueFracs[u] = parsed.compList[1]
+
+    if elements is None:
+        elements = elementRegistry.order(el for fracs in uniqueFracs if fracs is not None for el in fracs)
+    else:
+        elements = list(elements)
+        elementSet = set(elements)
+        uniqueFracs = [fracs if fracs is not None and elementSet.issuperset(fracs) else None for fracs in uniqueFracs]
+    elementIndex = {el: i for i, el in enumerate(elements)}
+
+    uniqueErrors = np.array([fracs is None for fracs in uniqueFracs], dtype=bool)
+    rows, cols, vals = [], [], []
+    for u, fracs in enumerate(uniqueFracs):
+        if fracs is not None:
+            rows.extend([u] * len(fracs))
+            cols.extend([elementIndex[el] for el in fracs])
+            vals.extend(fracs.values())
+    uniqueMatrix = np.zeros((len(uniqueFracs), len(elements)), dtype=np.float64)
+    uniqueMatrix[rows, cols] = vals
+
+    return uniqueMatrix[rowToUnique], elements, uniqueErrors[rowToUnique]
+
+# Checks if a phase name is a valid composition (parsed the same way as the formulas, natively or with pymatgen).
+# Phase names (e.g. "BCC", "fcc_a1", "Laves") are cached separately in a small cache of their own, so that they do
+# not take the place of the formulas in the shared composition cache nor distort its statistics.
+
+@lru_cache(maxsize=1024)
+def _isCompositionString(
+        s: str
+        ) -> bool:
+    key = CompositionCache.normalize(s)
+    parsed = _nativeParseComposition(key)
+    if parsed is None:
+        parsed = _parseComposition(key)
+    return parsed.valid
 
 # Unifies phase names in the database
 # If composition -> keep as is
@@ -51,10 +354,7 @@ def phaseNameUnifier(
     exceptionToUpper = ['b0', 'b1', 'b2', 'a0', 'a1', 'a2']
     replaceDict = {'bulkmetallic\nglass' : 'amorphous', 'bcc' : 'BCC', 'fcc' : 'FCC', 'LAVES' : 'laves'}
 
-    try:
-        isComp = Composition(s).valid
-    except Exception as e:
-        isComp = False
+    isComp = _isCompositionString(s)
 
     if s in exceptionToUpper:
         return s.upper()
@@ -128,10 +428,7 @@ def compDict2Vec(
         compDict: Dict[str, Union[int, float]]
         ) -> Union[None, List[float]]:
     # A couple of constants fixes for the ULTERA database (V1 of Composition Vector)
-    elementOrder = ['Ni', 'Co', 'Cr', 'Fe', 'Al', 'Ti', 'Mo', 'Zr', 'Nb', 'V', 'W', 'Ta', 'Hf', 'Cu', 'Mn', 'Si', 'B',
-                'Re', 'Ru', 'Sn', 'Zn', 'Mg', 'Li', 'Y', 'Ca', 'Pd', 'Sc', 'Ir', 'Be', 'Nd', 'U', 'Er', 'Dy', 'Gd',
-                'Sm', 'Pr', 'Ce', 'La', 'Ag', 'Ga', 'Bi', 'Pu', 'Th', 'Pb', 'Au', 'Pt', 'Os', 'Yb', 'Ho', 'Ba', 'In',
-                'Cd', 'Sr', 'C', 'O', 'N', 'S']
+    elementOrder = list(ULTERA_V1_ELEMENTS)
 
     common = elementOrder[:20]
     metallic = elementOrder[:-4]
@@ -0,0 +1,22 @@
+import io
+import time
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Tuple
+
+# Functions run in the worker processes of pyqalloy.parseTemplates. They are kept in this separate module because
+# pyqalloy.core.pyqalloy overrides its __name__ (to 'PyQAlloy'), so the functions defined there cannot be located by pickle,
+# which sends functions to the worker processes by their module and qualified names.
+
+
+def parseTemplateWorker(template: str, verbose: bool = False) -> Tuple[List[Tuple[int, Dict[str, Any]]], Dict[str, Any], str]:
+    """Parse a single template in a worker process. Returns the list of (spreadsheet line, entry) pairs, the parsing summary,
+    and the captured printout, so that the printouts of templates parsed in parallel do not interleave."""
+    from pyqalloy.core.pyqalloy import _iterTemplateEntries
+
+    startTime = time.perf_counter()
+    summary = {'datapoints': 0, 'inserted': 0, 'errors': [], 'elapsed': 0.0}
+    output = io.StringIO()
+    with redirect_stdout(output):
+        entries = list(_iterTemplateEntries(template, summary, verbose=verbose))
+    summary['elapsed'] = time.perf_counter() - startTime
+    return entries, summary, output.getvalue()
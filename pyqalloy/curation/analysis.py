@@ -1,25 +1,56 @@
 from importlib import resources
 import json
-from pymongo import MongoClient
-from pymongo.collection import Collection
-from pymatgen.core import Composition
+import warnings
 
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
-from sklearn.manifold import TSNE
-from sklearn.decomposition import PCA
-from sklearn.cluster import DBSCAN
-
-from scipy.spatial import distance_matrix
-from statistics import mean
 
 from datetime import datetime
 
-import plotly.express as px
-
-import xlsxwriter
 from io import BytesIO
-from typing import List, Dict, Tuple, Union
+from typing import List, Dict, Tuple, Union, TYPE_CHECKING
+
+from pyqalloy.core.utils import compStr2compList, compStr2amounts, compStrs2fracMatrix
+from pyqalloy.curation.distances import distanceBackend, filterRadiusGraph
+
+# Heavy dependencies (scikit-learn, scipy, plotly, xlsxwriter, pymongo) are imported inside the methods using them, so that
+# importing the analysis module stays fast for short-lived processes which do not need all of them.
+if TYPE_CHECKING:
+    from pymongo.collection import Collection
+    from pyqalloy.curation.store import SnapshotCache, EmbeddingCache
+    from pyqalloy.curation.index import CompositionIndex
+
+
+def _newDOIRecord(doi: str) -> dict:
+    '''Returns an empty per-DOI record of SingleDOIAnalyzer.analyzeAllDOIs, to be filled with _addToDOIRecord.'''
+    return {'doi': doi, 'names': set(), 'parentDatabases': set(), 'pointers': set(), 'nDatapoints': 0, 'formulas': [],
+            'fStrings': [], 'uniqueFormulas': []}
+
+
+def _addToDOIRecord(record: dict, e: dict) -> None:
+    '''Adds the datapoint (document) e to the per-DOI record, in the same way SingleDOIAnalyzer.getCompVecs does.'''
+    record['nDatapoints'] += 1
+    reducedFormula = compStr2compList(e['material']['formula'])[5]
+    if reducedFormula not in record['formulas']:
+        record['formulas'].append(reducedFormula)
+        record['uniqueFormulas'].append(e['material']['formula'])
+        record['names'].add(e['meta']['name'])
+        if 'parentDatabase' in e['meta']:
+            record['parentDatabases'].add(e['meta']['parentDatabase'])
+        record['fStrings'].append(
+            f"F: {e['material']['formula']}<br>PF: {e['material']['percentileFormula']}<br>Raw: {e['material']['rawFormula']}<br>RF: {e['material']['relationalFormula']}")
+    if 'pointer' in e['reference']:
+        record['pointers'].add(e['reference']['pointer'])
+
+
+def _completeDOIRecord(record: dict, compVecs: np.ndarray, els: List[str]) -> dict:
+    '''Completes the per-DOI record with the composition vectors of its unique formulas (over the els) and their
+    nearest neighbor distances.'''
+    record['els'] = els
+    record['compVecs'] = compVecs
+    record['nnDistances'] = distanceBackend.nnDistances(compVecs)
+    for key in ['names', 'parentDatabases', 'pointers']:
+        record[key] = sorted(record[key])
+    return record
 
 
 class Analyzer:
@@ -35,17 +66,47 @@ class Analyzer:
             [MontyDB](https://github.com/davidlatwe/MontyDB) Collection class or
             [Mongomock](https://github.com/mongomock/mongomock) Collection class. Defaults to None and has no effect
             in that case.
+        credentialsFile: Path to the JSON file with the database credentials. Defaults to None, in which case the
+            credentials.json file in the pyqalloy package is used.
+        snapshotCache: If set, the analyses run on a local snapshot of the collection (see the SnapshotCache in the
+            pyqalloy.curation.store), which is synced incrementally, i.e., only the documents uploaded or changed since
+            the last run are fetched. It can be True (to use the default cache location), a path to the cache
+            directory, or a SnapshotCache object. Defaults to None, in which case the collection is queried directly.
 
     Note:
         The credentials for the database are stored in the credentials.json file in the pyqalloy package. This access
         credentials are not included in the public repository.
+
+    Note:
+        All analyses read the data through the _fetch method, which only requests the fields listed for the given
+        analysis in the analysisFields (rather than whole documents with all the property and metadata blobs) in
+        batches of fetchBatchSize documents. Custom analyses built on top of the Analyzer classes can register their
+        own fields by extending the analysisFields dictionary.
     '''
 
+    # Fields of the ULTERA documents needed by each analysis, used as the query projection in the _fetch method
+    analysisFields: Dict[str, List[str]] = {
+        'allDOIs': ['reference.doi'],
+        'compVecs': ['material.formula', 'material.percentileFormula', 'material.rawFormula',
+                     'material.relationalFormula', 'meta.name', 'meta.parentDatabase', 'reference.pointer'],
+        'scanCompositions': ['material.formula', 'material.percentileFormula', 'material.rawFormula',
+                             'material.relationalFormula', 'reference.doi', 'reference.pointer'],
+        'doiSweep': ['material.formula', 'material.percentileFormula', 'material.rawFormula',
+                     'material.relationalFormula', 'meta.name', 'meta.parentDatabase', 'reference.doi',
+                     'reference.pointer'],
+        'allComps': ['material.relationalFormula', 'meta.timeStamp'],
+        'outlierSources': ['material.percentileFormula', 'material.rawFormula', 'material.relationalFormula',
+                           'meta.name', 'reference.doi', 'reference.pointer'],
+    }
+    # Number of documents requested from the database per network round trip
+    fetchBatchSize: int = 1000
+
     def __init__(self,
                  database: str,
                  collection: str,
-                 collectionManualOverride: Collection = None,
-                 credentialsFile: str = None
+                 collectionManualOverride: 'Collection' = None,
+                 credentialsFile: str = None,
+                 snapshotCache: Union[bool, str, 'SnapshotCache'] = None
                  ):
         if collectionManualOverride is not None:
             self.collectionManualOverrideSet = True
@@ -54,6 +115,7 @@ class Analyzer:
             self.ultera_client = None
         else:
             self.collectionManualOverrideSet = False
+            self.credentialsFile = credentialsFile
             if credentialsFile is None:
                 path = resources.files('pyqalloy').joinpath('credentials.json')
                 print(f'Loading the database credentials from default location: {path}')
@@ -73,11 +135,123 @@ class Analyzer:
                                      'collection object to the "collectionManualOverride" argument of the Analyzer class.')
             self.ultera_database_uri = f"mongodb+srv://{self.credentials['name']}:{self.credentials['dbKey']}" \
                                        f"@{self.credentials['dataServer']}"
+            from pymongo import MongoClient
             self.ultera_client = MongoClient(self.ultera_database_uri)
             self.collection = self.ultera_client[database][collection]
             print(f'Connected to the {collection} in {database} with {self.collection.estimated_document_count()} data '
                   f'points detected.')
 
+        self.snapshotCache = None
+        if snapshotCache is not None and snapshotCache is not False:
+            from pyqalloy.curation.store import SnapshotCache
+            if isinstance(snapshotCache, SnapshotCache):
+                self.snapshotCache = snapshotCache
+            else:
+                self.snapshotCache = SnapshotCache(cacheDir=None if snapshotCache is True else snapshotCache)
+            self.syncSnapshot()
+
+    def syncSnapshot(self) -> None:
+        '''Syncs the local snapshot of the source collection (only fetching the documents uploaded or changed since the
+        last sync) and switches the analyzer to it. Requires the snapshotCache to be set at initialization. Useful for
+        long-lived analyzers to pick up the new uploads.'''
+        assert self.snapshotCache is not None, 'The snapshotCache has to be set at the initialization of the analyzer.'
+        if not hasattr(self, 'sourceCollection'):
+            self.sourceCollection = self.collection
+        if self.collectionManualOverrideSet:
+            server = type(self.sourceCollection).__module__.split('.')[0]
+        else:
+            server = self.credentials['dataServer']
+        # Only pymongo-style collections know their database, so the others (e.g., a BSONCollection, named after its file)
+        # are keyed by their class name instead
+        database = getattr(getattr(self.sourceCollection, 'database', None), 'name', None)
+        if database is None:
+            database = type(self.sourceCollection).__name__
+        self.collection = self.snapshotCache.sync(
+            self.sourceCollection, server, database, getattr(self.sourceCollection, 'name', 'collection'))
+
+    def _fetch(self,
+               analysis: str,
+               query: dict,
+               limit: int = 0,
+               sort: List[Tuple[str, int]] = None):
+        '''Queries the collection for the documents matching the query, returning only the fields needed by the
+        analysis (as listed in self.analysisFields). It only uses the parts of the find() interface shared by pymongo,
+        MontyDB, mongomock, and the BSONCollection, so that it works with all of them.
+
+        Args:
+            analysis: Name of the analysis in self.analysisFields, e.g., 'compVecs'.
+            query: MongoDB query filter.
+            limit: Maximum number of documents to return. Defaults to 0, meaning no limit.
+            sort: List of (field, direction) pairs to sort the results by. Defaults to None, meaning the natural order.
+
+        Returns:
+            Cursor over the matching documents, each including only the _id and the projected fields.
+        '''
+        cursor = self.collection.find(query, {field: 1 for field in self.analysisFields[analysis]})
+        if sort is not None:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        try:
+            cursor = cursor.batch_size(self.fetchBatchSize)
+        except (AttributeError, NotImplementedError):
+            # Batching is irrelevant for in-process collections, some of which (e.g., MontyDB) do not implement it
+            pass
+        return cursor
+
+    def _fetchOne(self, analysis: str, query: dict) -> Union[dict, None]:
+        '''Returns the first document matching the query with only the fields needed by the analysis (see _fetch) or
+        None if no document matches.'''
+        return self.collection.find_one(query, {field: 1 for field in self.analysisFields[analysis]})
+
+    @classmethod
+    def fromBSON(cls, path: str, **kwargs) -> 'Analyzer':
+        '''Creates the analyzer working on a BSON dump file of an ULTERA-compatible collection (e.g., the
+        examples/ULTERA_sample.bson, a mongodump output, or a file produced by pyqalloy.parseTemplateToBSON) without any
+        database. The file is memory-mapped and decoded document by document into a fast, read-only, in-process
+        BSONCollection (see pyqalloy.curation.store), which is then used as the collectionManualOverride.
+
+        Args:
+            path: Path to the BSON file.
+            **kwargs: Other arguments passed to the analyzer class constructor, e.g., the name of the researcher.
+
+        Returns:
+            Analyzer (of the class this method is called on) backed by the data from the BSON file.
+        '''
+        from pyqalloy.curation.store import BSONCollection
+        collection = BSONCollection.fromBSON(path)
+        print(f'Loaded {len(collection)} data points from {path}')
+        kwargs.setdefault('database', None)
+        kwargs.setdefault('collection', None)
+        return cls(collectionManualOverride=collection, **kwargs)
+
+    def getCompositionIndex(self, path: str = None) -> 'CompositionIndex':
+        '''Returns the nearest neighbor index of all unique compositions in the collection (see the CompositionIndex in
+        the pyqalloy.curation.index), which can be used to score new uploads against the whole database. If the path
+        is given and the index file exists, it is loaded and only the documents added to the collection since it was
+        saved are indexed. The up-to-date index is then saved back to the path.
+
+        Args:
+            path: Path to the .npz file persisting the index. Defaults to None, meaning the index is built from scratch
+                and not saved.
+
+        Returns:
+            CompositionIndex of the collection.
+        '''
+        import os
+        from pyqalloy.curation.index import CompositionIndex
+        if path is not None and os.path.isfile(path):
+            index = CompositionIndex.load(path)
+            added = index.updateFromCollection(self.collection)
+            print(f'Loaded the composition index from {path} and added {added} new compositions '
+                  f'({len(index)} in total).')
+        else:
+            index = CompositionIndex.fromCollection(self.collection)
+            print(f'Indexed {len(index)} unique compositions over {len(index.elements)} elements.')
+        if path is not None:
+            index.save(path)
+        return index
+
     def get_allDOIs(
             self,
             name: str = None
@@ -130,16 +304,235 @@ class Analyzer:
                 query.update({'meta.name': name})
             foundDOIs = set()
             allDOIs = list()
-            for e in self.collection.find(
-                    query, 
-                    {'reference.doi': 1}
-                    ).sort([('meta.timeStamp', 1), ('reference.doi', 1)]):
+            for e in self._fetch('allDOIs', query, sort=[('meta.timeStamp', 1), ('reference.doi', 1)]):
                 if e['reference']['doi'] not in foundDOIs:
                     allDOIs.append(e['reference']['doi'])
                     foundDOIs.add(e['reference']['doi'])
             return allDOIs
 
 
+class FigureSpec:
+    '''Lightweight specification of the 2D PCA scatter plot of a publication (see
+    SingleDOIAnalyzer.analyze_compVecs_2DPCA), holding only the data needed to build the plotly figure. It is cheap to
+    create, store, and send between processes, and can be rendered later, together with many others, using
+    renderFigures().
+
+    Args:
+        x: The first PCA coordinates of the compositions.
+        y: The second PCA coordinates of the compositions.
+        legend: Legend labels of the compositions.
+        hover: Hover labels of the compositions.
+        title: Title of the plot.
+        width: Width of the plot in pixels.
+        height: Height of the plot in pixels. Defaults to 400.
+        name: Name of the plot, e.g., the DOI. Defaults to None.
+    '''
+
+    def __init__(self,
+                 x: List[float],
+                 y: List[float],
+                 legend: List[str],
+                 hover: List[str],
+                 title: str,
+                 width: int,
+                 height: int = 400,
+                 name: str = None):
+        self.x = x
+        self.y = y
+        self.legend = legend
+        self.hover = hover
+        self.title = title
+        self.width = width
+        self.height = height
+        self.name = name
+
+    def toFigure(self):
+        '''Builds the plotly figure from the specification.'''
+        import plotly.express as px
+        fig = px.scatter(
+            x=self.x,
+            y=self.y,
+            color=self.legend,
+            hover_name=self.hover,
+            color_discrete_sequence=px.colors.qualitative.Dark24,
+            width=self.width, height=self.height,
+            title=self.title,
+            labels={'x': 'PCA1', 'y': 'PCA2', 'color': 'Alloy Reported (Parsed Formula)'},
+            template='plotly_white')
+        fig.update_layout(
+            font=dict(family='Consolas, monospace')
+        )
+        fig.update_traces(
+            marker=dict(size=12, line=dict(width=2, color='DarkSlateGrey')), selector=dict(mode='markers'))
+        return fig
+
+    def render(self, scale: float = 1, format: str = 'png') -> BytesIO:
+        '''Renders the figure into an image. See renderFigures for the arguments.'''
+        return renderFigures([self], scale=scale, format=format)[0]
+
+
+def renderFigures(figures: list, scale: float = 1, format: str = 'png') -> List[BytesIO]:
+    '''Renders many figures into images in a single batch, reusing one renderer (Kaleido browser) process for all of them
+    rather than starting one per figure.
+
+    Args:
+        figures: List of FigureSpec or plotly figure objects.
+        scale: Scale factor of the images relative to the figure sizes in pixels. Defaults to 1, which is the resolution
+            at which they are displayed in the report workbooks.
+        format: Image format supported by plotly, e.g., 'png' (default), 'svg', or 'pdf'.
+
+    Returns:
+        List of images in BytesIO format in the order of the figures.
+    '''
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    import plotly.io as pio
+
+    figures = [f.toFigure() if isinstance(f, FigureSpec) else f for f in figures]
+    if not figures:
+        return []
+    try:
+        from kaleido import Kaleido
+        from kaleido.errors import ChromeNotFoundError
+    except ImportError:
+        # Kaleido before v1 keeps its renderer process alive between the calls on its own
+        return [BytesIO(pio.to_image(fig, format=format, scale=scale)) for fig in figures]
+
+    async def renderAll():
+        async with Kaleido(n=min(4, len(figures))) as k:
+            return await asyncio.gather(*[
+                k.calc_fig(fig.to_dict(), opts=dict(format=format, width=fig.layout.width or pio.defaults.default_width,
+                                                    height=fig.layout.height or pio.defaults.default_height, scale=scale))
+                for fig in figures])
+
+    try:
+        # Run in a separate thread, as the event loop of the caller (e.g., Jupyter) may already be running
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return [BytesIO(image) for image in executor.submit(asyncio.run, renderAll()).result()]
+    except ChromeNotFoundError:
+        # Raises plotly error message explaining how to install the browser
+        return [BytesIO(pio.to_image(fig, format=format, scale=scale)) for fig in figures]
+
+
+class ReportWriter:
+    '''Writes a report Excel workbook incrementally, i.e., the plots and text rows are added one by one as the DOIs are
+    analyzed, rather than collected in a list first. The workbook is opened once in the xlsxwriter constant memory mode
+    and every image is spooled to a temporary file as soon as it is added, so the memory use does not grow with the
+    number of plots. The FigureSpec plots (see analyze_compVecs_2DPCA with render=False) are rendered in batches at the
+    resolution they are displayed at. It can be used as a context manager, which closes the workbook at the end.
+
+    Args:
+        workbookPath: Path to the report Excel workbook. Must be a .xlsx file and must not be open at the time of writing.
+        imageScale: Resolution at which the FigureSpec plots are rendered, relative to the size they are displayed at in
+            the workbook (the figure size in pixels). Defaults to 1.
+        renderBatchSize: Maximum number of FigureSpec plots waiting to be rendered together. Defaults to 16.
+        printOut: If True, prints the feedback to the console when the workbook is closed. Defaults to True.
+
+    Example:
+        with ReportWriter('report.xlsx') as report:
+            for doi in sD.get_allDOIs():
+                sD.setDOI(doi)
+                sD.get_compVecs_2DPCA()
+                plot = sD.analyze_compVecs_2DPCA(showFigure=False, render=False)
+                if plot is not None:
+                    report.addPlot(plot)
+    '''
+
+    def __init__(self,
+                 workbookPath: str,
+                 imageScale: float = 1,
+                 renderBatchSize: int = 16,
+                 printOut: bool = True):
+        assert workbookPath.endswith('.xlsx'), "The workbookPath must end with .xlsx extension (Excel file)."
+        assert renderBatchSize > 0, 'The renderBatchSize has to be a positive integer.'
+        import tempfile
+        import xlsxwriter
+        self.workbookPath = workbookPath
+        self.imageScale = imageScale
+        self.renderBatchSize = renderBatchSize
+        self.printOut = printOut
+        self.workbook = xlsxwriter.Workbook(workbookPath, {'constant_memory': True})
+        self.worksheet = self.workbook.add_worksheet()
+        self.imageDir = tempfile.TemporaryDirectory()
+        self.row = 0
+        self.plotCount = 0
+        self._spooledCount = 0
+        # Items waiting for the FigureSpec plots before them to be rendered, so that the order of the rows is retained
+        self._pending = []
+
+    def addPlot(self, plot: Union[BytesIO, bytes, 'FigureSpec'], label: str = None, scale: float = 5) -> None:
+        '''Adds the plot to the report, below the previous rows.
+
+        Args:
+            plot: The plot, either rendered (BytesIO or bytes with a PNG image, e.g., returned by analyze_compVecs_2DPCA)
+                or a FigureSpec to be rendered by the writer.
+            label: Label written in the row above the plot and set as the image description, e.g., the DOI. Defaults to
+                None, in which case the name (DOI) of the FigureSpec is used. Empty string skips the label.
+            scale: Scale at which the rendered plot was rendered relative to the size it should be displayed at.
+                Defaults to 5, which is the default of analyze_compVecs_2DPCA. Ignored for FigureSpec plots.
+        '''
+        if label is None:
+            label = plot.name if isinstance(plot, FigureSpec) else ''
+        if isinstance(plot, FigureSpec):
+            self._pending.append(('figure', plot, label, self.imageScale, plot.height))
+            if sum(1 for item in self._pending if item[0] == 'figure') >= self.renderBatchSize:
+                self.flush()
+        else:
+            self._pending.append(('image', self._spool(plot), label, scale, 400))
+            if all(item[0] != 'figure' for item in self._pending):
+                self.flush()
+        self.plotCount += 1
+
+    def addText(self, text: str) -> None:
+        '''Adds a row with the text (e.g., a message that the DOI has been skipped) to the report.'''
+        self._pending.append(('text', text))
+        if all(item[0] != 'figure' for item in self._pending):
+            self.flush()
+
+    def _spool(self, image: Union[BytesIO, bytes]) -> str:
+        '''Writes the image into a temporary file and returns its path.'''
+        import os
+        path = os.path.join(self.imageDir.name, f'plot{self._spooledCount}.png')
+        self._spooledCount += 1
+        with open(path, 'wb') as f:
+            f.write(image.getvalue() if isinstance(image, BytesIO) else image)
+        return path
+
+    def flush(self) -> None:
+        '''Renders the pending FigureSpec plots and writes all the pending rows to the workbook.'''
+        figures = [item[1] for item in self._pending if item[0] == 'figure']
+        images = iter(renderFigures(figures, scale=self.imageScale)) if figures else None
+        for item in self._pending:
+            if item[0] == 'text':
+                self.worksheet.write(self.row, 0, item[1])
+                self.row += 1
+                continue
+            kind, plot, label, scale, height = item
+            path = self._spool(next(images)) if kind == 'figure' else plot
+            if label:
+                self.worksheet.write(self.row, 0, label)
+                self.row += 1
+            self.worksheet.insert_image(self.row, 0, path, {'x_scale': 1 / scale, 'y_scale': 1 / scale,
+                                                            'description': label})
+            # Rows of the default height of 20 pixels covered by the image, plus one
+            self.row += int(np.ceil(height / 20)) + 1
+        self._pending.clear()
+
+    def close(self) -> None:
+        '''Writes the remaining rows and closes the workbook.'''
+        self.flush()
+        self.workbook.close()
+        self.imageDir.cleanup()
+        if self.printOut:
+            print(f'Report with {self.plotCount} plots written to {self.workbookPath}')
+
+    def __enter__(self) -> 'ReportWriter':
+        return self
+
+    def __exit__(self, excType, excValue, traceback) -> None:
+        self.close()
+
+
 class SingleDOIAnalyzer(Analyzer):
     '''Extends the Analyzer class. It is used to assess the data coming from a single publication based on the DOI string.
 
@@ -155,6 +548,8 @@ class SingleDOIAnalyzer(Analyzer):
             [MontyDB](https://github.com/davidlatwe/MontyDB) Collection class or
             [Mongomock](https://github.com/mongomock/mongomock) Collection class. Defaults to None and has no effect
             in that case.
+        snapshotCache: If set, the analyses run on a local, incrementally synced snapshot of the collection. See the
+            Analyzer class for details. Defaults to None.
 
     '''
 
@@ -163,9 +558,11 @@ class SingleDOIAnalyzer(Analyzer):
                  name: str = None,
                  database: str = 'ULTERA_internal',
                  collection: str = 'CURATED_Dec2022',
-                 collectionManualOverride: Collection = None,
-                 credentialsFile: str = None):
-        super().__init__(database=database, collection=collection, collectionManualOverride=collectionManualOverride, credentialsFile=credentialsFile)
+                 collectionManualOverride: 'Collection' = None,
+                 credentialsFile: str = None,
+                 snapshotCache: Union[bool, str, 'SnapshotCache'] = None):
+        super().__init__(database=database, collection=collection, collectionManualOverride=collectionManualOverride,
+                         credentialsFile=credentialsFile, snapshotCache=snapshotCache)
         self.name = name
         self.doi = doi
         self.resetVariables()
@@ -180,13 +577,14 @@ class SingleDOIAnalyzer(Analyzer):
         self.nn_distances = list()
         self.names = set()
         self.parentDatabases = set()
-        self.els = set()
+        self.els = list()
         self.compVecs = list()
         self.fStrings = list()
         self.printLog = str()
 
         self.compVecs_2DPCA = list()
         self.compVecs_2DPCA_plot = None
+        self.compVecs_2DPCA_figure = None
         self.compVecs_2DPCA_minRangeInDim = None
 
     def setDOI(self, doi: str) -> None:
@@ -202,51 +600,242 @@ class SingleDOIAnalyzer(Analyzer):
         """Wrapper for the parent class method to get all DOIs in the collection. Passes the name argument to the parent method."""
         return super().get_allDOIs(name=self.name)
 
-    def getCompVecs(self) -> List[List[float]]:
-        '''Returns a list of composition vectors for all unique formulas in the publication. The composition vectors are
-        normalized to sum to 1.0.
+    def getCompVecs(self) -> np.ndarray:
+        '''Returns an array of composition vectors for all unique formulas in the publication. The composition vectors are
+        normalized to sum to 1.0 and their columns follow the order of elements in self.els.
 
         Returns:
-            List of composition vectors in order determined by the database read.
+            Array of composition vectors (one row per unique formula) in order determined by the database read.
         '''
         if self.doi is None:
             raise ValueError('DOI has not been set. Please set the DOI before calling this method.')
         # Reset **selected** variables: formulas, els, etc
-        self.formulas, self.els, self.names, self.compVecs, self.fStrings, self.parentDatabases = list(), set(), set(), list(), list(), set()
-        # Find a set of unique formulas from DOI and a set of all elements present in them
-        for e in self.collection.find({'reference.doi': self.doi}):
-            c = Composition(e['material']['formula'])
-            reducedFormula = c.reduced_formula
+        self.formulas, self.els, self.names, self.compVecs, self.fStrings, self.parentDatabases = list(), list(), set(), list(), list(), set()
+        uniqueFormulas = list()
+        # Find a set of unique formulas from DOI
+        for e in self._fetch('compVecs', {'reference.doi': self.doi}):
+            reducedFormula = compStr2compList(e['material']['formula'])[5]
             if reducedFormula not in self.formulas:
                 self.formulas.append(reducedFormula)
+                uniqueFormulas.append(e['material']['formula'])
                 self.names.add(e['meta']['name'])
                 if 'parentDatabase' in e['meta']:
                     self.parentDatabases.add(e['meta']['parentDatabase'])
-                self.els.update(list(c.get_el_amt_dict().keys()))
                 self.fStrings.append(
                     f"F: {e['material']['formula']}<br>PF: {e['material']['percentileFormula']}<br>Raw: {e['material']['rawFormula']}<br>RF: {e['material']['relationalFormula']}")
             if 'pointer' in e['reference']:
                 self.pointers.add(e['reference']['pointer'])
-        # Vectorize based on a list of elements
-        self.els = list(self.els)
-        for f in self.formulas:
-            cd = dict(Composition(f).fractional_composition.get_el_amt_dict())
-            compVec = [cd[el] if el in cd else 0 for el in self.els]
-            self.compVecs.append(compVec)
+        # Vectorize all unique formulas at once, which also establishes the list of elements
+        self.compVecs, self.els, _ = compStrs2fracMatrix(uniqueFormulas)
         return self.compVecs
 
     def analyze_nnDistances(self) -> None:
         '''Calculates the nearest neighbor distances for all unique composition vectors in the publication. The distances
-        are calculated using the L1 metric and the k-d tree algorithm.'''
+        are calculated using the L1 metric with the algorithm (brute force, k-d tree, or ball tree) selected by the
+        distance backend (see pyqalloy.curation.distances) based on the number of compositions and elements.'''
         self.getCompVecs()
 
-        nn = NearestNeighbors(n_neighbors=2, metric='l1', algorithm='kd_tree')
-        
         if len(self.compVecs) > 1:
-            self.nn_distances = [l[1] for l in nn.fit(self.compVecs).kneighbors(self.compVecs)[0]]
+            self.nn_distances = list(distanceBackend.nnDistances(self.compVecs))
         else:
             self.nn_distances = [0]
 
+    def analyzeAllDOIs(self, dois: List[str] = None) -> List[dict]:
+        '''Performs the nearest neighbor analysis (see analyze_nnDistances) for many publications at once. All the data
+        is retrieved in a single query and grouped by DOI, all unique formulas are vectorized together, and the
+        distances are calculated by the distance backend (typically with a vectorized brute force for the few alloys of
+        a publication), which is orders of magnitude faster than calling setDOI and analyze_nnDistances for every DOI.
+        The state of the analyzer (e.g., the current DOI) is not modified.
+
+        Args:
+            dois: List of DOIs to analyze. Defaults to None, in which case all DOIs returned by get_allDOIs() are
+                analyzed, i.e., the ones uploaded by the researcher set with setName or all of them if the name is not set.
+
+        Returns:
+            List of dictionaries (one per DOI, in the order of the DOIs) with the doi, names, parentDatabases, and
+            pointers (sorted lists), nDatapoints (number of datapoints in the collection), formulas (unique reduced
+            formulas), fStrings, els, compVecs (array over the els), and nnDistances (array of nearest neighbor L1
+            distances aligned with the formulas). The values are the same as the ones set on the analyzer by
+            getCompVecs and analyze_nnDistances, except that the sets are sorted lists and the compVecs are numpy arrays.
+        '''
+        import time
+        startTime = time.perf_counter()
+        if dois is None:
+            dois = self.get_allDOIs()
+            query = {'reference.doi': {'$ne': None}} if self.name is None else {'reference.doi': {'$in': dois}}
+        else:
+            query = {'reference.doi': {'$in': list(dois)}}
+
+        records = {doi: _newDOIRecord(doi) for doi in dois}
+        for e in self._fetch('doiSweep', query):
+            if e['reference']['doi'] in records:
+                _addToDOIRecord(records[e['reference']['doi']], e)
+
+        # Vectorize the unique formulas of all publications at once and then split the matrix between them
+        records = list(records.values())
+        compMatrix, els, _ = compStrs2fracMatrix([f for record in records for f in record.pop('uniqueFormulas')])
+        offset = 0
+        for record in records:
+            compVecs = compMatrix[offset:offset + len(record['formulas'])]
+            offset += len(record['formulas'])
+            # Restricting the columns to the elements present in the publication gives the same order as getCompVecs
+            presentEls = np.flatnonzero(compVecs.any(axis=0))
+            _completeDOIRecord(record, compVecs[:, presentEls], [els[i] for i in presentEls])
+
+        print(f'Analyzed {len(records)} DOIs with {offset} unique compositions in '
+              f'{round(time.perf_counter() - startTime, 2)}s.')
+        return records
+
+    async def iterDOIsAsync(self, dois: List[str] = None, concurrency: int = 16):
+        '''Asynchronous generator performing the nearest neighbor analysis of many publications with many DOI queries in
+        flight at once, which hides the latency of a remote database. The queries (issued with the regular, blocking
+        client of the collection in a pool of threads) are limited to concurrency at any time, and every publication
+        is analyzed as soon as its data arrives. The state of the analyzer (e.g., the current DOI) is not modified.
+
+        Args:
+            dois: List of DOIs to analyze. Defaults to None, in which case all DOIs returned by get_allDOIs() are used.
+            concurrency: Maximum number of queries in flight at once. Defaults to 16.
+
+        Yields:
+            Dictionaries with the results for each DOI (as described in analyzeAllDOIs) in the order of completion.
+        '''
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+
+        assert concurrency > 0, 'The concurrency has to be a positive integer.'
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        tasks = []
+        try:
+            if dois is None:
+                dois = await loop.run_in_executor(executor, self.get_allDOIs)
+
+            async def fetch(doi):
+                async with semaphore:
+                    return doi, await loop.run_in_executor(
+                        executor, lambda: list(self._fetch('compVecs', {'reference.doi': doi})))
+
+            tasks = [asyncio.ensure_future(fetch(doi)) for doi in dois]
+            for task in asyncio.as_completed(tasks):
+                doi, entries = await task
+                record = _newDOIRecord(doi)
+                for e in entries:
+                    _addToDOIRecord(record, e)
+                compVecs, els, _ = compStrs2fracMatrix(record.pop('uniqueFormulas'))
+                yield _completeDOIRecord(record, compVecs, els)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # When the consumer stops early (or is cancelled), this runs on the event loop thread, which must not be
+            # blocked until the queries in flight return, so they are left to finish in the background
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def analyzeDOIsAsync(self, dois: List[str] = None, concurrency: int = 16) -> List[dict]:
+        '''Asynchronous variant of analyzeAllDOIs for high-latency database connections, issuing one query per DOI with
+        up to concurrency of them in flight at once (see iterDOIsAsync). In a Jupyter notebook, it can be awaited
+        directly, i.e., `records = await sD.analyzeDOIsAsync()`, while in scripts it can be run with
+        `records = asyncio.run(sD.analyzeDOIsAsync())`.
+
+        Args:
+            dois: List of DOIs to analyze. Defaults to None, in which case all DOIs returned by get_allDOIs() are used.
+            concurrency: Maximum number of queries in flight at once. Defaults to 16.
+
+        Returns:
+            List of dictionaries with the results for each DOI (as described in analyzeAllDOIs) in the order of the DOIs.
+        '''
+        import asyncio
+        import time
+        startTime = time.perf_counter()
+        if dois is None:
+            dois = await asyncio.get_running_loop().run_in_executor(None, self.get_allDOIs)
+        records = {}
+        async for record in self.iterDOIsAsync(dois=dois, concurrency=concurrency):
+            records[record['doi']] = record
+        records = [records[doi] for doi in dois]
+        print(f'Analyzed {len(records)} DOIs with {sum(len(r["formulas"]) for r in records)} unique compositions in '
+              f'{round(time.perf_counter() - startTime, 2)}s.')
+        return records
+
+    def analyzeDOIsParallel(
+            self,
+            dois: List[str] = None,
+            workers: Union[int, None] = None,
+            nnOptions: dict = None,
+            pca: bool = True,
+            pcaOptions: dict = None,
+            printOut: bool = True
+        ) -> List[dict]:
+        '''Runs the complete per-publication pipeline (getCompVecs, analyze_nnDistances, print_nnDistances,
+        get_compVecs_2DPCA, and analyze_compVecs_2DPCA) for many DOIs in a pool of worker processes, each with its own
+        SingleDOIAnalyzer. If the analyzer is connected to the remote database, every worker opens its own connection.
+        Otherwise (collectionManualOverride, fromBSON, or snapshotCache), the workers share a read-only, in-process
+        snapshot of the fields needed by the analysis. The results are gathered in the order of the DOIs, so they do not
+        depend on the number of workers, and the state of this analyzer is not modified.
+
+        Args:
+            dois: List of DOIs to analyze. Defaults to None, in which case all DOIs returned by get_allDOIs() are used.
+            workers: Number of worker processes. If None (default), the number of CPUs is used. If 1, everything runs in
+                the current process.
+            nnOptions: Keyword arguments passed to print_nnDistances (e.g., minSamples or skipWellSeparated), other than
+                printOut. Defaults to None, meaning the defaults of print_nnDistances.
+            pca: If True (default), the 2D PCA analysis (including rendering of the figures) is performed. Otherwise,
+                only the nearest neighbor analysis is performed.
+            pcaOptions: Keyword arguments passed to analyze_compVecs_2DPCA (e.g., minDistance or minSamples), other than
+                showFigure and printOut. Defaults to None, meaning the defaults of analyze_compVecs_2DPCA. Passing
+                render=False defers the rendering, so that the plots are FigureSpecs to be rendered in a single batch,
+                e.g., by writeManyPlots.
+            printOut: If True, the printouts of every DOI are printed, DOI by DOI, after they have been gathered.
+                Defaults to True.
+
+        Returns:
+            List of dictionaries (one per DOI, in the order of the DOIs) with the doi, formulas, nnDistances,
+            compVecs_2DPCA, printLog, plot (the figure in BytesIO format, FigureSpec, or None, like the
+            analyze_compVecs_2DPCA return, or always None if pca is False), printOut (the captured console output), and error (the error message or None if the pipeline
+            completed) for the DOI.
+        '''
+        import os
+        import time
+        from concurrent.futures import ProcessPoolExecutor
+
+        startTime = time.perf_counter()
+        if dois is None:
+            dois = self.get_allDOIs()
+        dois = list(dois)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = max(1, min(workers, len(dois) or 1))
+
+        if not self.collectionManualOverrideSet and self.snapshotCache is None:
+            workerArgs = (self.name, None, {
+                'database': self.collection.database.name,
+                'collection': self.collection.name,
+                'credentialsFile': self.credentialsFile})
+        else:
+            from pyqalloy.curation.store import BSONCollection
+            snapshot = BSONCollection(self._fetch('doiSweep', {'reference.doi': {'$in': dois}}))
+            workerArgs = (self.name, snapshot, None)
+        print(f'Analyzing {len(dois)} DOIs with {workers} worker processes.')
+
+        options = (nnOptions or {}, (pcaOptions or {}) if pca else None)
+        if workers == 1:
+            analyzer = _initDOIWorker(*workerArgs)
+            records = [_analyzeDOIWorker(doi, *options, analyzer=analyzer) for doi in dois]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_initDOIWorker, initargs=workerArgs) as executor:
+                records = list(executor.map(
+                    _analyzeDOIWorker, dois, *[[option] * len(dois) for option in options],
+                    chunksize=max(1, len(dois) // (4 * workers))))
+
+        failed = [record['doi'] for record in records if record['error'] is not None]
+        for record in records:
+            if printOut:
+                print(record['printOut'], end='')
+            if record['error'] is not None:
+                print(f'Analysis of {record["doi"]} failed! ---> {record["error"]}')
+        print(f'Analyzed {len(dois) - len(failed)} of {len(dois)} DOIs in {round(time.perf_counter() - startTime, 2)}s.')
+        return records
+
     def print_nnDistances(
             self, 
             minSamples: int = 2, 
@@ -343,6 +932,7 @@ class SingleDOIAnalyzer(Analyzer):
             self.compVecs_2DPCA_minRangeInDim = 0
             return self.compVecs_2DPCA
         else:
+            from sklearn.decomposition import PCA
             pca = PCA(n_components=2)
             self.compVecs_2DPCA = pca.fit_transform(self.compVecs)
             self.compVecs_2DPCA_minRangeInDim = min([
@@ -357,12 +947,17 @@ class SingleDOIAnalyzer(Analyzer):
             minSamples: int = 3, 
             showFigure: bool = True,
             skipFailed: bool = False,
-            printOut: bool = True
-        ) -> BytesIO:
+            printOut: bool = True,
+            render: bool = True,
+            scale: float = 5
+        ) -> Union[BytesIO, 'FigureSpec']:
         '''Performs a 2D PCA on the composition vectors. The results are stored in the self.compVecs_2DPCA variable.
         The minimum range in both dimensions is stored in the self.compVecs_2DPCA_minRangeInDim variable.
         The results are plotted using plotly. The figure is also stored in the self.compVecs_2DPCA_plot variable as 
-        a BytesIO object that can be written to a file or stored in MongoDB as a binary object.
+        a BytesIO object that can be written to a file or stored in MongoDB as a binary object. The lightweight
+        specification of the figure (FigureSpec) is stored in the self.compVecs_2DPCA_figure variable, so that the
+        rendering can be deferred (render=False) and done later, for many figures at once, with renderFigures() or
+        writeManyPlots() at the resolution needed there.
 
         Args:
             minDistance: Minimum distance between two points in the 2D PCA space in any dimension to be considered
@@ -378,10 +973,13 @@ class SingleDOIAnalyzer(Analyzer):
                 to see anything change (any 2 points will always be linear) and discarded based on another rule. For 
                 practical purposes, it is recommended to set this to at least 4, so that breaks in the linearity (which
                 require at least 3 points to be meaningful) can be detected.
-
+            render: If True (default), the figure is rendered into a PNG image right away. Otherwise, rendering is
+                skipped and the FigureSpec is returned instead, which is much faster when many DOIs are analyzed.
+            scale: Scale factor of the rendered image relative to the figure size in pixels. Defaults to 5.
 
         Returns:
-            Figure in BytesIO format if name is matched and non-linear trends are detected.
+            Figure in BytesIO format (or FigureSpec if render is False) if name is matched and non-linear trends are
+            detected.
 
         '''
 
@@ -415,9 +1013,6 @@ class SingleDOIAnalyzer(Analyzer):
                 widths = [max(len(col) for col in column) for column in zip(*cols)]
                 limitedPrettyFStrings = [' | '.join(col.ljust(width) for col, width in zip(row, widths)) for row in cols]
 
-                # Resize width of the plot based on the number of characters in the legend
-                totalWidth = int(700 + 7.2 * sum(widths))
-
                 # Plot
                 title = f"<b>{self.doi}</b>"
                 if len(self.pointers) > 0:
@@ -425,24 +1020,20 @@ class SingleDOIAnalyzer(Analyzer):
                 title += f"<br>uploaded by {', '.join(self.names)}"
                 if len(self.parentDatabases) > 0:
                         title += f" (based on {', '.join(self.parentDatabases)})"
-                fig = px.scatter(
-                    x=self.compVecs_2DPCA[:, 0],
-                    y=self.compVecs_2DPCA[:, 1],
-                    color=limitedPrettyFStrings,
-                    hover_name=self.fStrings,
-                    color_discrete_sequence=px.colors.qualitative.Dark24,
-                    width=totalWidth, height=400,
+                self.compVecs_2DPCA_figure = FigureSpec(
+                    x=np.asarray(self.compVecs_2DPCA)[:, 0].tolist(),
+                    y=np.asarray(self.compVecs_2DPCA)[:, 1].tolist(),
+                    legend=limitedPrettyFStrings,
+                    hover=list(self.fStrings),
                     title=title,
-                    labels={'x': 'PCA1', 'y': 'PCA2', 'color': 'Alloy Reported (Parsed Formula)'},
-                    template='plotly_white')
-                fig.update_layout(
-                    font=dict(family='Consolas, monospace')
-                )
-                fig.update_traces(
-                    marker=dict(size=12, line=dict(width=2, color='DarkSlateGrey')), selector=dict(mode='markers'))
-                self.compVecs_2DPCA_plot = BytesIO(fig.to_image(format="png", scale=5))
+                    # Resize width of the plot based on the number of characters in the legend
+                    width=int(700 + 7.2 * sum(widths)),
+                    name=self.doi)
                 if showFigure:
-                    fig.show()
+                    self.compVecs_2DPCA_figure.toFigure().show()
+                if not render:
+                    return self.compVecs_2DPCA_figure
+                self.compVecs_2DPCA_plot = self.compVecs_2DPCA_figure.render(scale=scale)
                 return self.compVecs_2DPCA_plot
         else:
             if not skipFailed:
@@ -457,57 +1048,114 @@ class SingleDOIAnalyzer(Analyzer):
             workbookPath: str, 
             skipLines: int
         ) -> None:
-        '''Writes the plot to the specified report Excel workbook.
+        '''Writes the plot to the specified report Excel workbook. If the figure has not been rendered yet
+        (analyze_compVecs_2DPCA with render=False), it is rendered at the resolution it is displayed at in the workbook.
+        Note that a new workbook is created on every call, so to collect the plots of many DOIs in a single report, use
+        the ReportWriter.
 
         Args:
             workbookPath: Path to the report Excel workbook. Must be a .xlsx file and must not be open at the time of writing.
             skipLines: Number of lines to skip before writing the plot. It is critical to skip lines to avoid overwriting
                 existing data in the workbook.
         '''
-        assert isinstance(self.compVecs_2DPCA_plot, BytesIO), "The plot must be generated before writing it to the file."
+        assert isinstance(self.compVecs_2DPCA_plot, BytesIO) or isinstance(self.compVecs_2DPCA_figure, FigureSpec), \
+            "The plot must be generated before writing it to the file."
         assert workbookPath.endswith('.xlsx'), "The workbookPath must end with .xlsx extension (Excel file)."
 
+        import xlsxwriter
+        if isinstance(self.compVecs_2DPCA_plot, BytesIO):
+            image, imageScale = self.compVecs_2DPCA_plot, 0.2
+        else:
+            image, imageScale = self.compVecs_2DPCA_figure.render(scale=1), 1
         workbook = xlsxwriter.Workbook(workbookPath)
         worksheet = workbook.add_worksheet()
         cellIndex = f'A{1 + skipLines}'
         worksheet.insert_image(cellIndex, self.doi,
-                               {'image_data': self.compVecs_2DPCA_plot, 'x_scale': 0.2, 'y_scale': 0.2})
+                               {'image_data': image, 'x_scale': imageScale, 'y_scale': imageScale})
         workbook.close()
 
     def writeManyPlots(
             self, 
             toPlotList: list, 
             workbookPath: str,
-            printOut: bool = True
+            printOut: bool = True,
+            imageScale: float = 1
         ) -> None:
         '''Writes the plots to the specified report Excel workbook.
 
         Args:
-            toPlotList: List of plots to write. Each element of the list can be either a BytesIO object containing the plot
+            toPlotList: List of plots to write. Each element of the list can be either a BytesIO object containing the plot,
+                a FigureSpec of a plot which has not been rendered yet (analyze_compVecs_2DPCA with render=False),
                 or a string containing the text to write if no plot is available because of a linear trend in the data or
                 because the specified researcher is not present in the group reporting the data.
             workbookPath: Path to the report Excel workbook. Must be a .xlsx file and must not be open at the time of writing.
             printOut: If True, prints the feedback to the console. Defaults to True.
+            imageScale: Resolution at which the FigureSpec plots are rendered, relative to the size they are displayed
+                at in the workbook (the figure size in pixels). Defaults to 1. Set to 2 for sharp images on high-DPI
+                screens. They are rendered together in batches.
+
+        Note:
+            To write the report incrementally, as the DOIs are analyzed, without keeping all the plots in memory, use
+            the ReportWriter directly.
         '''
         if printOut: print(f'Initializing the workbook at {workbookPath}')
-        workbook = xlsxwriter.Workbook(workbookPath)
-        worksheet = workbook.add_worksheet()
-        skipLines = 0
-        
         if printOut: print(f'Writing {len(toPlotList)} plots to the workbook')
-        for tp in toPlotList:
-            cellIndex = f'A{1 + skipLines}'
-            if isinstance(tp, BytesIO):
-                worksheet.insert_image(cellIndex, self.doi,
-                                       {'image_data': tp, 'x_scale': 0.2, 'y_scale': 0.2})
-                skipLines += 21
-            elif isinstance(tp, str):
-                worksheet.write(cellIndex, tp)
-                skipLines += 1
-        workbook.close()
+        with ReportWriter(workbookPath, imageScale=imageScale, printOut=False) as report:
+            for tp in toPlotList:
+                if isinstance(tp, (BytesIO, FigureSpec)):
+                    report.addPlot(tp, label='')
+                elif isinstance(tp, str):
+                    report.addText(tp)
         if printOut: print(f'Plots written to the workbook successfully!', end='\n\n', flush=True)
 
 
+# Analyzer of the worker process in SingleDOIAnalyzer.analyzeDOIsParallel, set up once per process by _initDOIWorker
+_doiWorkerAnalyzer = None
+
+
+def _initDOIWorker(name: str, collection: 'Collection', connection: dict) -> SingleDOIAnalyzer:
+    '''Sets up the SingleDOIAnalyzer of the worker process either with the shared collection or with its own connection
+    to the database (if collection is None) described by the connection dictionary of SingleDOIAnalyzer arguments.'''
+    global _doiWorkerAnalyzer
+    from contextlib import redirect_stdout
+    from io import StringIO
+    with redirect_stdout(StringIO()):
+        if collection is not None:
+            _doiWorkerAnalyzer = SingleDOIAnalyzer(name=name, collectionManualOverride=collection)
+        else:
+            _doiWorkerAnalyzer = SingleDOIAnalyzer(name=name, **connection)
+    return _doiWorkerAnalyzer
+
+
+def _analyzeDOIWorker(doi: str, nnOptions: dict, pcaOptions: Union[dict, None],
+                      analyzer: SingleDOIAnalyzer = None) -> dict:
+    '''Runs the per-DOI pipeline of SingleDOIAnalyzer.analyzeDOIsParallel on the worker analyzer, capturing the printout,
+    so that the printouts of DOIs analyzed in parallel do not interleave.'''
+    from contextlib import redirect_stdout
+    from io import StringIO
+    sD = analyzer if analyzer is not None else _doiWorkerAnalyzer
+    record = {'doi': doi, 'plot': None, 'error': None}
+    output = StringIO()
+    with redirect_stdout(output):
+        try:
+            sD.setDOI(doi)
+            sD.analyze_nnDistances()
+            sD.print_nnDistances(**{**nnOptions, 'printOut': True})
+            if pcaOptions is not None:
+                sD.get_compVecs_2DPCA()
+                record['plot'] = sD.analyze_compVecs_2DPCA(**{**pcaOptions, 'showFigure': False, 'printOut': True})
+        except Exception as e:
+            # A DOI which cannot be analyzed does not stop the others from being analyzed
+            record['error'] = f'{type(e).__name__}: {e}'
+    record.update({
+        'formulas': list(sD.formulas),
+        'nnDistances': [float(d) for d in sD.nn_distances],
+        'compVecs_2DPCA': np.asarray(sD.compVecs_2DPCA).tolist(),
+        'printLog': sD.printLog,
+        'printOut': output.getvalue()})
+    return record
+
+
 class SingleCompositionAnalyzer(Analyzer):
     '''Class to analyze a single composition in the context of abnormal data detection.
 
@@ -521,15 +1169,19 @@ class SingleCompositionAnalyzer(Analyzer):
             [MontyDB](https://github.com/davidlatwe/MontyDB) Collection class or
             [Mongomock](https://github.com/mongomock/mongomock) Collection class. Defaults to None and has no effect
             in that case.
+        snapshotCache: If set, the analyses run on a local, incrementally synced snapshot of the collection. See the
+            Analyzer class for details. Defaults to None.
     '''
 
     def __init__(self,
                  name: str = None,
                  database: str = 'ULTERA_internal',
                  collection: str = 'CURATED_Dec2022',
-                 collectionManualOverride: Collection = None,
-                 credentialsFile: str = None):
-        super().__init__(database=database, collection=collection, collectionManualOverride=collectionManualOverride, credentialsFile=credentialsFile)
+                 collectionManualOverride: 'Collection' = None,
+                 credentialsFile: str = None,
+                 snapshotCache: Union[bool, str, 'SnapshotCache'] = None):
+        super().__init__(database=database, collection=collection, collectionManualOverride=collectionManualOverride,
+                         credentialsFile=credentialsFile, snapshotCache=snapshotCache)
         self.name = name
         self.formulas = set()
         self.printOuts = list()
@@ -567,15 +1219,14 @@ class SingleCompositionAnalyzer(Analyzer):
         query = {'reference.doi': {'$ne': None}}
         if self.name is not None:
             query.update({'meta.name': self.name})
-        for e in self.collection.find(query, limit=queryLimit):
+        for e in self._fetch('scanCompositions', query, limit=queryLimit):
             if len(self.printOuts) >= resultLimit:
                 break
 
             f = e['material']['formula']
             if f not in self.formulas:
                 self.formulas.add(f)
-                c = Composition(f)
-                fracs = list(c.get_el_amt_dict().values())
+                fracs = list(compStr2amounts(f).values())
                 fracsSum = round(sum(fracs), 3)
 
                 def printAlloy(self):
@@ -634,29 +1285,64 @@ class AllDataAnalyzer(Analyzer):
             [MontyDB](https://github.com/davidlatwe/MontyDB) Collection class or
             [Mongomock](https://github.com/mongomock/mongomock) Collection class. Defaults to None and has no effect
             in that case.
+        snapshotCache: If set, the analyses run on a local, incrementally synced snapshot of the collection. See the
+            Analyzer class for details. Defaults to None.
+        embeddingCache: If set, the TSNE embeddings calculated by getTSNE are cached on disk (see the EmbeddingCache in
+            the pyqalloy.curation.store) and loaded instead of recalculated for identical compositions and parameters.
+            It can be True to use the default cache directory, a path to the cache directory, or an EmbeddingCache
+            object. Defaults to None, in which case the embeddings are always calculated.
 
     Properties:
         allComps: List of all unique compositions in the database. It is automatically updated when the class is
             initialized.
-        els: Set of all unique elements in the database. It is automatically updated when the class is initialized and
+        allCompsMatrix: Array of composition vectors of all unique compositions in self.allComps (one row per composition),
+            used directly by the clustering and embedding methods.
+        els: List of all unique elements in the database. It is automatically updated when the class is initialized and
             it is used to determine common ordering of elements across methods.
         outliers: List of outliers in the database identified by the last used method (e.g. DBSCAN).
+        dbscanNoiseThresholds: Per-composition DBSCAN noise thresholds (see DistanceBackend.noiseThresholds) keyed by
+            min_samples, computed by getDBSCANautoEpsilon and reset when self.allComps is updated.
+        neighborGraph: Sparse graph of the distances between all compositions within neighborGraphEps of each other,
+            shared by the getDBSCAN calls (see getNeighborGraph) and reset when self.allComps is updated.
     '''
 
+    # Minimum radius of the neighbor graph cached by getNeighborGraph. By default, the graph covers only the requested
+    # eps, as larger radii approach all the pairs of compositions, but it can be raised to serve a range of eps values
+    # (e.g., a sweep from the largest one down) with a single neighbor search
+    neighborGraphRadius: float = 0.0
+
     def __init__(self,
                  database: str = 'ULTERA_internal',
                  collection: str = 'CURATED_Dec2022',
                  name: str = None,
-                 collectionManualOverride: Collection = None,
-                 credentialsFile: str = None):
-        super().__init__(database=database, collection=collection, collectionManualOverride=collectionManualOverride, credentialsFile=credentialsFile)
+                 collectionManualOverride: 'Collection' = None,
+                 credentialsFile: str = None,
+                 snapshotCache: Union[bool, str, 'SnapshotCache'] = None,
+                 embeddingCache: Union[bool, str, 'EmbeddingCache'] = None):
+        super().__init__(database=database, collection=collection, collectionManualOverride=collectionManualOverride,
+                         credentialsFile=credentialsFile, snapshotCache=snapshotCache)
         self.name = name
+        self.embeddingCache = None
+        if embeddingCache is not None and embeddingCache is not False:
+            from pyqalloy.curation.store import EmbeddingCache
+            if isinstance(embeddingCache, EmbeddingCache):
+                self.embeddingCache = embeddingCache
+            else:
+                self.embeddingCache = EmbeddingCache(cacheDir=None if embeddingCache is True else embeddingCache)
         self.outliers = list()
-        self.els = set()
+        self.els = list()
+        self.allCompsMatrix = np.empty((0, 0))
+        self.dbscanNoiseThresholds = dict()
+        self.neighborGraph = None
+        self.neighborGraphEps = 0.0
+        # High-water marks of the documents seen by updateAllComps, used by its incremental updates
+        self._allCompsLastId = None
+        self._allCompsLastTimeStamp = None
+        self._allCompsSeen = set()
 
         self.allComps = self.updateAllComps(printOut=False, printOutMinimal=True)
 
-    def updateAllComps(self, printOut: bool = False, printOutMinimal: bool = True) -> list:
+    def updateAllComps(self, printOut: bool = False, printOutMinimal: bool = True, incremental: bool = False) -> list:
         '''Identifies a list of all unique compositions in the database, updates the self.els property, and then converts
         the list of compositions into a list of dictionaries with the formula and a vector representation of the composition
         in the order of self.els. The vector representation is used for full-dimensional clustering analysis. Some other methods
@@ -666,31 +1352,46 @@ class AllDataAnalyzer(Analyzer):
             printOut: If True, prints out the list of all unique compositions. Defaults to False.
             printOutMinimal: If True, prints out the number of unique compositions and the list of unique elements. Defaults
                 to True.
+            incremental: If True, only the documents uploaded or changed since the last update (i.e., with _id above the
+                largest one seen so far or with meta.timeStamp at or after the latest one) are fetched. Their new unique
+                formulas are appended to self.allComps and self.allCompsMatrix, and new elements are appended to self.els
+                as new columns (zero for the existing compositions), so the element order can differ from the one of a
+                full update. Compositions which are no longer in the database (e.g., after a correction or deletion) are
+                only dropped by a full update. Defaults to False, meaning the whole collection is scanned.
 
         Returns:
             List of dictionaries with the formula and a vector representation of the composition in the order of self.els.
         '''
+        query = {'material.nComponents': {'$gte': 3}, 'reference.doi': {'$ne': None}}
+        if incremental and self._allCompsLastId is not None:
+            return self._updateAllCompsIncremental(query, printOut=printOut, printOutMinimal=printOutMinimal)
 
         print('Updating the list of all unique composition points...')
-        formulas = set()
-        for e in self.collection.find({
-            'material.nComponents': {'$gte': 3},
-            'reference.doi': {'$ne': None}}):
-            rf = e['material']['relationalFormula']
-            c = Composition(rf)
-            formulas.add(rf)
-            self.els.update(list(c.get_el_amt_dict().keys()))
+        formulas = dict()
+        entries = list(self._fetch('allComps', query))
+        for e in entries:
+            formulas[e['material']['relationalFormula']] = None
+        formulas = list(formulas)
+        self._allCompsLastId, self._allCompsLastTimeStamp = None, None
+        self._updateAllCompsHighWaterMark(entries)
 
         print(f'Number of unique formulas found: {len(formulas)}')
-        comps = list()
-
-        for f in formulas:
-            cd = dict(Composition(f).fractional_composition.get_el_amt_dict())
-            compVec = [cd[el] if el in cd else 0.0 for el in self.els]
-            comps.append({
-                'formula': f,
-                'compVec': compVec
-            })
+        compMatrix, self.els, parseErrors = compStrs2fracMatrix(formulas)
+        self._allCompsSeen = set(formulas)
+        if parseErrors.any():
+            print(f'Skipping {int(parseErrors.sum())} formulas which could not be parsed: '
+                  f'{[f for f, err in zip(formulas, parseErrors) if err]}')
+            formulas = [f for f, err in zip(formulas, parseErrors) if not err]
+            compMatrix = compMatrix[~parseErrors]
+        self.allCompsMatrix = compMatrix
+        self.dbscanNoiseThresholds = dict()
+        self.neighborGraph = None
+        self.neighborGraphEps = 0.0
+
+        comps = [{
+            'formula': f,
+            'compVec': compVec
+        } for f, compVec in zip(formulas, compMatrix.tolist())]
 
         if printOutMinimal:
             print(f'Elements Found: {self.els}')
@@ -702,9 +1403,77 @@ class AllDataAnalyzer(Analyzer):
 
         return comps
 
-    def getTSNE(self, perplexity: int = 2, init: str = 'pca') -> np.ndarray:
+    def _updateAllCompsHighWaterMark(self, entries: List[dict]) -> None:
+        '''Advances the largest _id and the latest meta.timeStamp seen by updateAllComps to the ones of the entries.'''
+        from bson import ObjectId
+        ids = [e['_id'] for e in entries if isinstance(e.get('_id'), ObjectId)]
+        timeStamps = [e.get('meta', {}).get('timeStamp') for e in entries]
+        timeStamps = [t for t in timeStamps if isinstance(t, datetime)]
+        if self._allCompsLastId is not None:
+            ids.append(self._allCompsLastId)
+        if self._allCompsLastTimeStamp is not None:
+            timeStamps.append(self._allCompsLastTimeStamp)
+        self._allCompsLastId = max(ids) if ids else None
+        self._allCompsLastTimeStamp = max(timeStamps) if timeStamps else None
+
+    def _updateAllCompsIncremental(self, query: dict, printOut: bool, printOutMinimal: bool) -> list:
+        '''Appends the new unique formulas of the documents uploaded or changed since the last update (see
+        updateAllComps with incremental=True) to self.allComps and self.allCompsMatrix.'''
+        conditions = [{'_id': {'$gt': self._allCompsLastId}}]
+        if self._allCompsLastTimeStamp is not None:
+            conditions.append({'meta.timeStamp': {'$gte': self._allCompsLastTimeStamp}})
+        entries = list(self._fetch('allComps', {'$and': [query, {'$or': conditions}]}))
+        self._updateAllCompsHighWaterMark(entries)
+
+        newFormulas = dict()
+        for e in entries:
+            f = e['material']['relationalFormula']
+            if f not in self._allCompsSeen:
+                newFormulas[f] = None
+        newFormulas = list(newFormulas)
+        self._allCompsSeen.update(newFormulas)
+        print(f'Fetched {len(entries)} new or changed documents with {len(newFormulas)} new unique formulas.')
+        if not newFormulas:
+            return self.allComps
+
+        newMatrix, newEls, parseErrors = compStrs2fracMatrix(newFormulas)
+        if parseErrors.any():
+            print(f'Skipping {int(parseErrors.sum())} formulas which could not be parsed: '
+                  f'{[f for f, err in zip(newFormulas, parseErrors) if err]}')
+            newFormulas = [f for f, err in zip(newFormulas, parseErrors) if not err]
+            newMatrix = newMatrix[~parseErrors]
+
+        # New elements get new columns at the end, so that the existing columns (and compVecs) only get zero-padded
+        addedEls = [el for el in newEls if el not in self.els]
+        if addedEls:
+            self.els.extend(addedEls)
+            self.allCompsMatrix = np.hstack([self.allCompsMatrix, np.zeros((len(self.allComps), len(addedEls)))])
+            for c in self.allComps:
+                c['compVec'].extend([0.0] * len(addedEls))
+        rows = np.zeros((len(newFormulas), len(self.els)))
+        rows[:, [self.els.index(el) for el in newEls]] = newMatrix
+        self.allCompsMatrix = np.vstack([self.allCompsMatrix, rows])
+        self.allComps.extend({'formula': f, 'compVec': compVec} for f, compVec in zip(newFormulas, rows.tolist()))
+
+        # As after a full update, the results calculated for the previous set of compositions are dropped
+        self.dbscanNoiseThresholds = dict()
+        self.neighborGraph = None
+        self.neighborGraphEps = 0.0
+        for c in self.allComps:
+            c.pop('compVec_TSNE2D', None)
+            c.pop('dbscanCluster', None)
+
+        if printOutMinimal:
+            print(f'Elements Found: {self.els}')
+        if printOut:
+            print(f'Formulas Added:\n{newFormulas}')
+        return self.allComps
+
+    def getTSNE(self, perplexity: int = 2, init: str = 'pca', random_state: int = 0) -> np.ndarray:
         '''Performs TSNE embedding on the list of compositions in self.allComps. The TSNE embedding is stored in the
         'compVec_TSNE2D' key of each dictionary in self.allComps. The TSNE embedding is also returned as a numpy array.
+        If the embeddingCache has been set, the embedding is loaded from it when the compositions, the element order,
+        and the parameters are identical to a previous run, and stored in it otherwise.
 
         Args:
             perplexity: Perplexity parameter for the TSNE embedding. Defaults to 2. This is the parameter that controls
@@ -714,14 +1483,29 @@ class AllDataAnalyzer(Analyzer):
                 default value of 5-10 is recommended. The value of 30, often used in the literature, is not recommended
                 for HEA datasets.
             init: Initialization method for the TSNE embedding. Defaults to 'pca'. The default value is recommended.
+            random_state: Seed of the TSNE optimization, fixed so that the embedding is reproducible (and cacheable).
+                Defaults to 0.
 
         Returns:
             Numpy array of the TSNE embedding.
         '''
-
-        tsne = TSNE(n_components=2, perplexity=perplexity, init=init)
-        X = np.array([c['compVec'] for c in self.allComps])
-        X_embedded = tsne.fit_transform(X)
+        X = self.allCompsMatrix
+        X_embedded, key = None, None
+        if self.embeddingCache is not None:
+            from importlib.metadata import version
+            key = self.embeddingCache.key(X, self.els, {
+                'method': 'TSNE', 'n_components': 2, 'perplexity': perplexity, 'init': init,
+                'random_state': random_state, 'scikit-learn': version('scikit-learn')})
+            X_embedded = self.embeddingCache.get(key)
+            if X_embedded is not None:
+                print('Loaded the TSNE embedding from the cache.')
+
+        if X_embedded is None:
+            from sklearn.manifold import TSNE
+            tsne = TSNE(n_components=2, perplexity=perplexity, init=init, random_state=random_state)
+            X_embedded = tsne.fit_transform(X)
+            if key is not None:
+                self.embeddingCache.put(key, X_embedded)
 
         for i, c in enumerate(self.allComps):
             c['compVec_TSNE2D'] = X_embedded[i]
@@ -740,6 +1524,7 @@ class AllDataAnalyzer(Analyzer):
         assert 'compVec_TSNE2D' in self.allComps[0]
         assert len(self.allComps[0]['compVec_TSNE2D']) == 2
 
+        import plotly.express as px
         fig = px.scatter(x=[c['compVec_TSNE2D'][0] for c in self.allComps],
                          y=[c['compVec_TSNE2D'][1] for c in self.allComps],
                          hover_name=[c['formula'] for c in self.allComps],
@@ -751,34 +1536,66 @@ class AllDataAnalyzer(Analyzer):
                          )
         fig.show()
 
-    def getDBSCAN(self, eps: float = 0.3, min_samples: int = 2, p: int = 1) -> Tuple[np.ndarray, int]:
+    def getNeighborGraph(self, eps: float, algorithm: str = None):
+        '''Returns the sparse graph of the (Euclidean, as in getDBSCAN) distances between the compositions in
+        self.allComps not exceeding eps, for DBSCAN with the 'precomputed' metric. The graph is calculated up to the
+        larger of eps and neighborGraphRadius, and cached in self.neighborGraph with the rows sorted by the distance,
+        so that the subsequent calls with any eps up to that radius only filter it instead of searching for the
+        neighbors again. It is rebuilt (grown) only for larger eps values, and after self.allComps is updated.
+
+        Args:
+            eps: Maximum distance between neighbors.
+            algorithm: Neighbor search algorithm used if the graph is (re)built. Defaults to None, meaning it is
+                selected by the distance backend.
+
+        Returns:
+            scipy.sparse.csr_matrix with the distances between the neighboring compositions.
+        '''
+        if self.neighborGraph is None or eps > self.neighborGraphEps:
+            from sklearn.neighbors import sort_graph_by_row_values
+            self.neighborGraphEps = max(eps, self.neighborGraphRadius)
+            self.neighborGraph = sort_graph_by_row_values(
+                distanceBackend.radiusGraph(self.allCompsMatrix, eps=self.neighborGraphEps, p=2, algorithm=algorithm),
+                warn_when_not_sorted=False)
+        if eps < self.neighborGraphEps:
+            return filterRadiusGraph(self.neighborGraph, eps)
+        return self.neighborGraph
+
+    def getDBSCAN(self, eps: float = 0.3, min_samples: int = 2, p: int = None, algorithm: str = None) -> Tuple[np.ndarray, int]:
         '''Performs DBSCAN clustering on the list of compositions in self.allComps. The DBSCAN clustering is stored in the
         'dbscanCluster' key of each dictionary in self.allComps. The DBSCAN clustering is also returned as a numpy array
         along with the number of outliers identified.
 
         Args:
             eps: Epsilon parameter for the DBSCAN clustering. Defaults to 0.3. This is the parameter that controls the
-                maximum distance between two points to be considered neighbors. With all other parameters at their
-                default values, this 0.3 value corresponds to a 30% atomic fraction difference by summing over differences
-                in all elements fractions. For example, for Fe0.5Ni0.5, up to Fe0.35Ni0.65 or Fe0.65Ni0.35 would be
-                considered neighbors.
+                maximum distance between two points to be considered neighbors, measured as the Euclidean distance
+                between the composition vectors (atomic fractions). For example, for Fe0.5Ni0.5, up to about
+                Fe0.29Ni0.71 or Fe0.71Ni0.29 would be considered neighbors at 0.3, as the difference of 0.21 in both
+                fractions gives the distance of 0.21*sqrt(2).
             min_samples: Minimum number of samples parameter for the DBSCAN clustering. Defaults to 2. This is the
                 parameter that controls the minimum number of neighbors required for a point to be considered a core
                 point. If it is not met, the point is considered an outlier and assigned to the -1 cluster.
-            p: p parameter for the DBSCAN clustering. Defaults to 1. This is the parameter that controls the metric used
-                to calculate the distance between two points. The default value of 1 corresponds to the Manhattan distance
-                with consequences described above for eps. The value of 2 would correspond to the Euclidean distance.
+            p: Deprecated and ignored. It was passed to scikit-learn's DBSCAN, which ignores it with its default
+                'euclidean' metric, so the Euclidean distance has always been used. Setting it only raises a
+                DeprecationWarning.
+            algorithm: Neighbor search algorithm ('brute', 'kd_tree', or 'ball_tree') used when the neighbor graph is
+                (re)built (see getNeighborGraph). Defaults to None, meaning it is selected by the distance backend (see
+                pyqalloy.curation.distances) based on the number of compositions and elements. The clustering does not
+                depend on it.
 
         Returns:
             Numpy array of the DBSCAN clustering and the number of outliers identified.
         '''
 
+        if p is not None:
+            warnings.warn('The p parameter of getDBSCAN is deprecated and ignored, as the Euclidean distance is always used.',
+                          DeprecationWarning, stacklevel=2)
         assert len(self.allComps) > 0
         assert 'compVec' in self.allComps[0]
 
-        dbscan = DBSCAN(eps=eps, min_samples=min_samples, p=p)
-        X = np.array([c['compVec'] for c in self.allComps])
-        dbscanClusters = dbscan.fit_predict(X)
+        from sklearn.cluster import DBSCAN
+        dbscan = DBSCAN(eps=eps, min_samples=min_samples, metric='precomputed')
+        dbscanClusters = dbscan.fit_predict(self.getNeighborGraph(eps=eps, algorithm=algorithm))
 
         outlierN = 0
         for i, c in enumerate(self.allComps):
@@ -791,30 +1608,48 @@ class AllDataAnalyzer(Analyzer):
 
         return dbscanClusters, outlierN
 
-    def getDBSCANautoEpsilon(self, outlierTargetN: int = 10) -> Tuple[np.ndarray, int]:
-        '''Performs DBSCAN clustering using getDBSCAN() with a range of epsilon values until the desired minimum number
-        of outliers is found. It efficiently allows user to find as many outliers as they can investigate independently
+    def getDBSCANautoEpsilon(self, outlierTargetN: int = 10, min_samples: int = 2) -> Tuple[np.ndarray, int]:
+        '''Performs DBSCAN clustering using getDBSCAN() with the largest epsilon value giving at least the desired number
+        of outliers. It efficiently allows user to find as many outliers as they can investigate independently
         of the number of alloys in the dataset. The DBSCAN clustering is stored in the 'dbscanCluster' key of each dictionary in
         self.allComps. The DBSCAN clustering is also returned as a numpy array along with the number of outliers
         identified.
 
+        Instead of refitting DBSCAN over a sweep of epsilon values, the epsilon below which each composition becomes an
+        outlier is calculated once (see DistanceBackend.noiseThresholds) and cached in self.dbscanNoiseThresholds, so that
+        the epsilon is found exactly by sorting these thresholds and DBSCAN is fitted only once, with it.
+
         Args:
             outlierTargetN: Minimum number of outliers to be identified. Defaults to 10.
+            min_samples: Minimum number of samples parameter for the DBSCAN clustering (see getDBSCAN). Defaults to 2.
 
         Returns:
             Numpy array of the DBSCAN clustering and the number of outliers identified.
         '''
         assert len(self.allComps) > outlierTargetN
-        outlierN = 0
-        eps = 1.00001
         assert outlierTargetN > 0
-        assert outlierN < outlierTargetN
-        while outlierN < outlierTargetN:
-            print(f'Running DBSCAN with eps={round(eps, 3)}...')
-            dbscanClusters, outlierN = self.getDBSCAN(eps=eps)
-            eps -= 0.025
-
-        return dbscanClusters, outlierN
+        if min_samples not in self.dbscanNoiseThresholds:
+            # Euclidean distance (p=2), as used by getDBSCAN
+            self.dbscanNoiseThresholds[min_samples] = distanceBackend.noiseThresholds(
+                self.allCompsMatrix, min_samples=min_samples, p=2)
+        thresholds = np.sort(self.dbscanNoiseThresholds[min_samples])[::-1]
+
+        # There are at least outlierTargetN outliers for any eps below the outlierTargetN-th largest threshold, and the
+        # same number of them down to the next smaller threshold. The eps is placed just below the former, but far enough
+        # from both for the distances calculated by DBSCAN to fall on the same side of it.
+        upper = thresholds[outlierTargetN - 1]
+        smaller = thresholds[thresholds < upper]
+        lower = smaller[0] if len(smaller) > 0 else 0
+        if not upper > 0:
+            raise ValueError(f'No epsilon gives {outlierTargetN} outliers with min_samples={min_samples}, since only '
+                             f'{int((thresholds > 0).sum())} compositions are not duplicates of core points.')
+        if np.isinf(upper):
+            # Fewer compositions than min_samples, so all of them are outliers for any eps
+            eps = 1.0
+        else:
+            eps = float(upper - min((upper - lower) / 2, 1e-9))
+        print(f'Running DBSCAN with eps={round(eps, 5)} (the largest giving at least {outlierTargetN} outliers)...')
+        return self.getDBSCAN(eps=eps, min_samples=min_samples)
 
     def showClustersDBSCAN(self):
         '''Plots the TSNE embedding of the compositions in self.allComps colored by the DBSCAN clustering. The plot is
@@ -830,6 +1665,7 @@ class AllDataAnalyzer(Analyzer):
         assert 'compVec_TSNE2D' in self.allComps[0]
         assert len(self.allComps[0]['compVec_TSNE2D']) == 2
 
+        import plotly.express as px
         fig = px.scatter(x=[c['compVec_TSNE2D'][0] for c in self.allComps],
                          y=[c['compVec_TSNE2D'][1] for c in self.allComps],
                          color=[str(c['dbscanCluster']) for c in self.allComps],
@@ -868,6 +1704,7 @@ class AllDataAnalyzer(Analyzer):
         assert 'compVec_TSNE2D' in self.allComps[0]
         assert len(self.allComps[0]['compVec_TSNE2D']) == 2
 
+        import plotly.express as px
         fig = px.scatter(x=[c['compVec_TSNE2D'][0] for c in self.allComps],
                          y=[c['compVec_TSNE2D'][1] for c in self.allComps],
                          color=['outlier' if c['dbscanCluster'] == -1 else 'clustered' for c in self.allComps],
@@ -890,7 +1727,8 @@ class AllDataAnalyzer(Analyzer):
                 Defaults to False.
 
         Returns:
-            List of dictionaries containing the data sources for the outliers.
+            List of dictionaries containing the data sources for the outliers. Only the _id and the fields listed under
+            'outlierSources' in self.analysisFields are included, so the _id should be used to retrieve whole documents.
         '''
         assert len(self.outliers) > 0
         assert 'formula' in self.outliers[0]
@@ -907,7 +1745,7 @@ class AllDataAnalyzer(Analyzer):
             print(out, '\n')
 
         for outlier in self.outliers:
-            e = self.collection.find_one({'material.relationalFormula': outlier['formula']})
+            e = self._fetchOne('outlierSources', {'material.relationalFormula': outlier['formula']})
             if e['meta']['name'] == self.name:
                 outlierSources.append(e)
                 printEntry(e)
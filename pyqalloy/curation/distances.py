@@ -0,0 +1,217 @@
+import time
+from typing import Dict, Union
+
+import numpy as np
+
+# Crossover points between the brute force (blocked scipy cdist) and the tree-based (scikit-learn) nearest neighbor
+# searches over composition vectors, measured for the nearest neighbor distances of random compositions. Building a tree
+# costs ~1 ms regardless of the size, while the brute force takes ~0.01 ms for the typical DOI with a few alloys. The
+# k-d tree only overtakes the brute force at ~1500 compositions in up to ~10 dimensions (elements), while in more
+# dimensions the brute force stays ~2-3 times faster than the ball tree (and ~3-5 times faster than the k-d tree) up
+# to at least 10000 compositions.
+LOW_DIMENSIONAL_MAX = 10
+LOW_DIMENSIONAL_BRUTE_MAX_N = 1500
+BRUTE_MAX_N = 20000
+
+
+def _cdistMetric(p: float) -> dict:
+    '''Returns the scipy cdist arguments of the Minkowski distance with the p parameter.'''
+    if p == 1:
+        return {'metric': 'cityblock'}
+    if p == 2:
+        return {'metric': 'euclidean'}
+    return {'metric': 'minkowski', 'p': p}
+
+
+def filterRadiusGraph(graph, eps: float):
+    '''Returns the sparse radius graph (see DistanceBackend.radiusGraph) restricted to the distances not exceeding eps,
+    keeping the order of the entries within each row (e.g., sorted by the distance), as well as the explicit zeros.'''
+    from scipy.sparse import csr_matrix
+    graph = graph.tocsr()
+    keep = graph.data <= eps
+    rows = np.repeat(np.arange(graph.shape[0]), np.diff(graph.indptr))[keep]
+    indptr = np.zeros(graph.shape[0] + 1, dtype=graph.indptr.dtype)
+    np.cumsum(np.bincount(rows, minlength=graph.shape[0]), out=indptr[1:])
+    return csr_matrix((graph.data[keep], graph.indices[keep], indptr), shape=graph.shape)
+
+
+class DistanceBackend:
+    '''Distance computation backend shared by the nearest neighbor (analyze_nnDistances, analyzeAllDOIs) and clustering
+    (getDBSCAN, getDBSCANautoEpsilon) analyses. It picks the vectorized brute force (scipy cdist over blocks of rows) for
+    small and medium numbers of compositions, where building a tree costs more than the whole search, and the k-d tree
+    or ball tree of scikit-learn for large ones, based on the measured crossover points.
+
+    Args:
+        algorithm: Algorithm used for all calls: 'auto' (default) selecting it based on the size of the data, or one of
+            'brute', 'kd_tree', or 'ball_tree' to force it, e.g., for benchmarking.
+        lowDimensionalMax: Maximum number of dimensions (elements) for which the k-d tree is used. Defaults to 10.
+        lowDimensionalBruteMaxN: Maximum number of compositions for the brute force in up to lowDimensionalMax
+            dimensions. Defaults to 1500.
+        bruteMaxN: Maximum number of compositions for the brute force in more dimensions, above which the ball tree
+            is used. Defaults to 20000.
+        maxBlockElements: Maximum number of elements of the distance matrix block computed at once by the brute force,
+            bounding its memory use. Defaults to 2**22 (32 MB).
+    '''
+
+    def __init__(self,
+                 algorithm: str = 'auto',
+                 lowDimensionalMax: int = LOW_DIMENSIONAL_MAX,
+                 lowDimensionalBruteMaxN: int = LOW_DIMENSIONAL_BRUTE_MAX_N,
+                 bruteMaxN: int = BRUTE_MAX_N,
+                 maxBlockElements: int = 2**22):
+        assert algorithm in ['auto', 'brute', 'kd_tree', 'ball_tree'], f'Unknown algorithm: {algorithm}'
+        self.algorithm = algorithm
+        self.lowDimensionalMax = lowDimensionalMax
+        self.lowDimensionalBruteMaxN = lowDimensionalBruteMaxN
+        self.bruteMaxN = bruteMaxN
+        self.maxBlockElements = maxBlockElements
+        # Algorithm used by the last call, exposed for benchmarking and logging
+        self.lastAlgorithm: Union[str, None] = None
+
+    def select(self, n: int, d: int, algorithm: str = None) -> str:
+        '''Returns the algorithm ('brute', 'kd_tree', or 'ball_tree') used for n compositions in d dimensions. The
+        algorithm argument (or the one set for the backend) other than 'auto' takes precedence.'''
+        algorithm = algorithm or self.algorithm
+        if algorithm != 'auto':
+            return algorithm
+        if d <= self.lowDimensionalMax:
+            return 'brute' if n <= self.lowDimensionalBruteMaxN else 'kd_tree'
+        return 'brute' if n <= self.bruteMaxN else 'ball_tree'
+
+    def _blocks(self, n: int):
+        '''Yields the (start, stop) ranges of rows of the brute force distance matrix blocks.'''
+        blockSize = max(1, self.maxBlockElements // max(n, 1))
+        for start in range(0, n, blockSize):
+            yield start, min(start + blockSize, n)
+
+    def nnDistances(self, X: np.ndarray, p: float = 1, algorithm: str = None) -> np.ndarray:
+        '''Returns the distance from each row of X to its nearest neighbor among the other rows (0 for a single row).
+
+        Args:
+            X: Matrix of composition vectors (one per row).
+            p: Parameter of the Minkowski distance. Defaults to 1, i.e., the L1 (Manhattan) distance.
+            algorithm: Overrides the algorithm selection for this call. Defaults to None.
+
+        Returns:
+            Array of the nearest neighbor distances aligned with the rows of X.
+        '''
+        X = np.asarray(X, dtype=np.float64)
+        n = len(X)
+        if n < 2:
+            self.lastAlgorithm = None
+            return np.zeros(n)
+        self.lastAlgorithm = self.select(n, X.shape[1], algorithm)
+        if self.lastAlgorithm == 'brute':
+            from scipy.spatial.distance import cdist
+            nnDistances = np.empty(n)
+            for start, stop in self._blocks(n):
+                block = cdist(X[start:stop], X, **_cdistMetric(p))
+                block[np.arange(stop - start), np.arange(start, stop)] = np.inf
+                nnDistances[start:stop] = block.min(axis=1)
+            return nnDistances
+        from sklearn.neighbors import NearestNeighbors
+        nn = NearestNeighbors(n_neighbors=2, algorithm=self.lastAlgorithm, p=p)
+        # With duplicates, the point itself may come second, but both distances are 0 then
+        return nn.fit(X).kneighbors(X)[0][:, 1]
+
+    def radiusGraph(self, X: np.ndarray, eps: float, p: float = 1, algorithm: str = None):
+        '''Returns the sparse graph of distances between all pairs of rows of X (including each row with itself) not
+        exceeding eps, with the zero distances stored explicitly, as used by DBSCAN with the 'precomputed' metric.
+
+        Args:
+            X: Matrix of composition vectors (one per row).
+            eps: Maximum distance between neighbors.
+            p: Parameter of the Minkowski distance. Defaults to 1, i.e., the L1 (Manhattan) distance.
+            algorithm: Overrides the algorithm selection for this call. Defaults to None.
+
+        Returns:
+            scipy.sparse.csr_matrix of shape (n, n) with the neighbor distances.
+        '''
+        from scipy.sparse import csr_matrix
+        X = np.asarray(X, dtype=np.float64)
+        n = len(X)
+        self.lastAlgorithm = self.select(n, X.shape[1] if X.ndim == 2 else 0, algorithm)
+        if self.lastAlgorithm == 'brute':
+            from scipy.spatial.distance import cdist
+            rows, cols, data = [], [], []
+            for start, stop in self._blocks(n):
+                block = cdist(X[start:stop], X, **_cdistMetric(p))
+                r, c = np.nonzero(block <= eps)
+                rows.append(r + start)
+                cols.append(c)
+                data.append(block[r, c])
+            rows, cols, data = [np.concatenate(a) if a else np.zeros(0) for a in (rows, cols, data)]
+            return csr_matrix((data, (rows.astype(np.int64), cols.astype(np.int64))), shape=(n, n))
+        from sklearn.neighbors import NearestNeighbors
+        nn = NearestNeighbors(radius=eps, algorithm=self.lastAlgorithm, p=p).fit(X)
+        distances, neighbors = nn.radius_neighbors(X, return_distance=True)
+        rows = np.repeat(np.arange(n), [len(nb) for nb in neighbors])
+        return csr_matrix((np.concatenate(distances), (rows, np.concatenate(neighbors))), shape=(n, n))
+
+    def noiseThresholds(self, X: np.ndarray, min_samples: int = 2, p: float = 1, algorithm: str = None) -> np.ndarray:
+        '''Returns, for each row of X, the DBSCAN epsilon below which it is noise (an outlier) for the given min_samples,
+        so that the number of outliers of DBSCAN(eps, min_samples) is the number of thresholds larger than eps, for all
+        eps at once. A point stops being noise as soon as it is within eps of a core point (possibly itself), i.e., the
+        threshold of the point i is the minimum over all points j of max(distance(i, j), coreDistance(j)), where the core
+        distance is the distance to the (min_samples - 1)-th nearest other point (as in OPTICS and HDBSCAN). Points
+        which cannot become core points (with fewer than min_samples points in total) get an infinite threshold.
+
+        Args:
+            X: Matrix of composition vectors (one per row).
+            min_samples: DBSCAN min_samples parameter, counting the point itself. Defaults to 2.
+            p: Parameter of the Minkowski distance. Defaults to 1, i.e., the L1 (Manhattan) distance.
+            algorithm: Overrides the algorithm selection for this call. Defaults to None.
+
+        Returns:
+            Array of the noise thresholds aligned with the rows of X.
+        '''
+        X = np.asarray(X, dtype=np.float64)
+        n = len(X)
+        if n < min_samples:
+            self.lastAlgorithm = None
+            return np.full(n, np.inf)
+        self.lastAlgorithm = self.select(n, X.shape[1], algorithm)
+        if self.lastAlgorithm == 'brute':
+            from scipy.spatial.distance import cdist
+            coreDistances = np.empty(n)
+            for start, stop in self._blocks(n):
+                block = cdist(X[start:stop], X, **_cdistMetric(p))
+                coreDistances[start:stop] = np.partition(block, min_samples - 1, axis=1)[:, min_samples - 1]
+            thresholds = np.empty(n)
+            for start, stop in self._blocks(n):
+                block = cdist(X[start:stop], X, **_cdistMetric(p))
+                thresholds[start:stop] = np.maximum(block, coreDistances[None, :]).min(axis=1)
+            return thresholds
+        from sklearn.neighbors import KDTree, BallTree
+        tree = (KDTree if self.lastAlgorithm == 'kd_tree' else BallTree)(X, metric='minkowski', p=p)
+        coreDistances = tree.query(X, k=min_samples)[0][:, -1]
+        # Only the points closer than its own core distance can lower the threshold of a point below the latter
+        neighbors, distances = tree.query_radius(X, r=coreDistances, return_distance=True)
+        thresholds = coreDistances.copy()
+        rows = np.repeat(np.arange(n), [len(nb) for nb in neighbors])
+        if len(rows) > 0:
+            neighbors = np.concatenate(neighbors)
+            np.minimum.at(thresholds, rows, np.maximum(np.concatenate(distances), coreDistances[neighbors]))
+        return thresholds
+
+    def benchmark(self, X: np.ndarray, p: float = 1, repeats: int = 3) -> Dict[str, float]:
+        '''Measures the time (in seconds, best of the repeats) of the nearest neighbor distances of X with each of the
+        algorithms, e.g., to tune the crossover points for a given machine and dataset.
+
+        Returns:
+            Dictionary of the times keyed by the algorithm, including the 'auto' selection under 'selected'.
+        '''
+        times = {}
+        for algorithm in ['brute', 'kd_tree', 'ball_tree']:
+            best = np.inf
+            for _ in range(repeats):
+                startTime = time.perf_counter()
+                self.nnDistances(X, p=p, algorithm=algorithm)
+                best = min(best, time.perf_counter() - startTime)
+            times[algorithm] = best
+        times['selected'] = self.select(len(X), np.shape(X)[1] if len(X) else 0, 'auto')
+        return times
+
+
+# Default backend used by the analyzers
+distanceBackend = DistanceBackend()
@@ -0,0 +1,234 @@
+import json
+from typing import List, Dict, Union, Any, Iterable
+
+import numpy as np
+
+from pyqalloy.core.utils import compStrs2fracMatrix
+
+
+class CompositionIndex:
+    '''Persistent, incrementally updatable nearest neighbor index over all unique compositions in a collection, using the
+    L1 distance between the atomic fraction vectors (like the analyze_nnDistances of the analyzers), i.e., 2.0 for
+    compositions without any common elements and 0.02 for a 1% difference in the content of a single element. Note that
+    the getDBSCAN of the AllDataAnalyzer uses the Euclidean distance instead, so its eps values are not comparable with
+    the distances reported by the index.
+    Each composition is stored once along with the DOIs of all publications it has been reported in, so that new
+    uploads (e.g., entries produced by pyqalloy.parseTemplate) can be scored against the whole database in milliseconds
+    to catch typos which landed near the alloy reported in another publication.
+
+    The index is built with CompositionIndex.fromCollection(), brought up to date with updateFromCollection() (which
+    only fetches the documents added since the last update), and persisted with save() and load() as a compressed
+    NumPy .npz file.
+    '''
+
+    def __init__(self):
+        self.formulas: List[str] = []
+        self.elements: List[str] = []
+        self.dois: List[List[str]] = []
+        self.matrix = np.zeros((0, 0), dtype=np.float64)
+        # String representation of the largest ObjectId indexed by updateFromCollection
+        self.lastId: Union[str, None] = None
+        self._rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.formulas)
+
+    def add(self, formulas: Iterable[str], dois: Iterable[Union[str, None]] = None) -> int:
+        '''Adds the compositions to the index. Formulas which are already indexed only have their DOIs updated and
+        formulas which cannot be parsed are skipped.
+
+        Args:
+            formulas: Composition formulas, ideally the (canonical) material.relationalFormula of the ULTERA entries.
+            dois: DOIs of the publications reporting the compositions, aligned with the formulas. Defaults to None,
+                meaning no DOIs are recorded.
+
+        Returns:
+            Number of compositions newly added to the index.
+        '''
+        formulas = list(formulas)
+        dois = [None] * len(formulas) if dois is None else list(dois)
+        assert len(formulas) == len(dois), 'The formulas and dois have to be of the same length.'
+
+        newFormulas, newDOIs = {}, []
+        for f, doi in zip(formulas, dois):
+            if f in self._rows:
+                row = self.dois[self._rows[f]]
+            else:
+                if f not in newFormulas:
+                    newFormulas[f] = len(newDOIs)
+                    newDOIs.append([])
+                row = newDOIs[newFormulas[f]]
+            if doi is not None and doi not in row:
+                row.append(doi)
+        if not newFormulas:
+            return 0
+
+        newMatrix, newElements, errors = compStrs2fracMatrix(list(newFormulas))
+        # New elements get new columns at the end, so that the existing columns never move
+        addedElements = [el for el in newElements if el not in self.elements]
+        if addedElements:
+            self.elements.extend(addedElements)
+            self.matrix = np.hstack([self.matrix, np.zeros((len(self), len(addedElements)))])
+        rows = np.zeros((int((~errors).sum()), len(self.elements)), dtype=np.float64)
+        rows[:, [self.elements.index(el) for el in newElements]] = newMatrix[~errors]
+        self.matrix = np.vstack([self.matrix, rows])
+
+        for (f, i), failed in zip(newFormulas.items(), errors):
+            if not failed:
+                self._rows[f] = len(self.formulas)
+                self.formulas.append(f)
+                self.dois.append(newDOIs[i])
+        return len(rows)
+
+    def addEntries(self, entries: Iterable[Dict[str, Any]]) -> int:
+        '''Adds the compositions of ULTERA entries (e.g., documents of the collection or the entries produced by
+        pyqalloy.parseTemplate) to the index. See add() for details.
+
+        Returns:
+            Number of compositions newly added to the index.
+        '''
+        formulas, dois = [], []
+        for entry in entries:
+            f = _entryFormula(entry)
+            if f is not None:
+                formulas.append(f)
+                dois.append(entry.get('reference', {}).get('doi'))
+        return self.add(formulas, dois)
+
+    @classmethod
+    def fromCollection(cls, collection: Any, query: dict = None) -> 'CompositionIndex':
+        '''Builds the index of all compositions in a MongoDB-compatible collection (pymongo, MontyDB, mongomock, or
+        BSONCollection).
+
+        Args:
+            collection: The collection with ULTERA entries.
+            query: Additional query filter limiting the indexed documents. Defaults to None, meaning all documents.
+
+        Returns:
+            CompositionIndex of the collection.
+        '''
+        index = cls()
+        index.updateFromCollection(collection, query=query)
+        return index
+
+    def updateFromCollection(self, collection: Any, query: dict = None) -> int:
+        '''Adds the compositions of the documents inserted into the collection since the last update, i.e., the ones
+        with _id (ObjectId) larger than the largest one seen so far. Documents changed in place are not picked up, so
+        the index should be rebuilt with fromCollection() after data corrections.
+
+        Args:
+            collection: The collection with ULTERA entries.
+            query: Additional query filter limiting the indexed documents. Defaults to None, meaning all documents.
+
+        Returns:
+            Number of compositions newly added to the index.
+        '''
+        from bson import ObjectId
+        query = dict(query or {})
+        if self.lastId is not None:
+            query = {'$and': [query, {'_id': {'$gt': ObjectId(self.lastId)}}]}
+        entries = list(collection.find(
+            query, {'material.relationalFormula': 1, 'material.formula': 1, 'reference.doi': 1}))
+        ids = [e['_id'] for e in entries if isinstance(e.get('_id'), ObjectId)]
+        if ids:
+            self.lastId = str(max(ids + ([ObjectId(self.lastId)] if self.lastId is not None else [])))
+        return self.addEntries(entries)
+
+    def query(self, formulas: Iterable[str], k: int = 1, excludeDOI: str = None) -> List[List[Dict[str, Any]]]:
+        '''Finds the k nearest indexed compositions of each of the formulas.
+
+        Args:
+            formulas: Composition formulas to look up.
+            k: Number of nearest neighbors to return for each formula. Defaults to 1.
+            excludeDOI: If set, compositions reported only in this publication are skipped, e.g., to score an upload
+                against all the other publications after it has already been indexed. Defaults to None.
+
+        Returns:
+            List (aligned with the formulas) of lists of up to k neighbors, ordered by the distance, each a dictionary
+            with the formula, distance (L1), and dois of the indexed composition. Formulas which cannot be parsed get
+            an empty list.
+        '''
+        formulas = list(formulas)
+        queryMatrix, queryElements, errors = compStrs2fracMatrix(formulas)
+        excluded = None
+        if excludeDOI is not None:
+            excluded = np.array([len(dois) > 0 and all(doi == excludeDOI for doi in dois) for dois in self.dois],
+                                dtype=bool)
+        rowSums = self.matrix.sum(axis=1)
+        columns = {el: i for i, el in enumerate(self.elements)}
+
+        results = []
+        for x, failed in zip(queryMatrix, errors):
+            if failed or len(self) == 0:
+                results.append([])
+                continue
+            # Since all the indexed rows sum up to 1, the L1 distance only needs the columns of the queried elements:
+            # |x - y|_1 = sum(y) + sum over elements in x of (|x_j - y_j| - y_j)
+            present = np.flatnonzero(x)
+            known = [j for j in present if queryElements[j] in columns]
+            extra = x[[j for j in present if queryElements[j] not in columns]].sum()
+            cols = [columns[queryElements[j]] for j in known]
+            distances = rowSums + extra + (np.abs(self.matrix[:, cols] - x[known]) - self.matrix[:, cols]).sum(axis=1)
+            distances = np.clip(distances, 0, None)
+            if excluded is not None:
+                distances[excluded] = np.inf
+            kk = min(k, int(np.isfinite(distances).sum()))
+            nearest = np.argpartition(distances, kk - 1)[:kk] if kk > 0 else np.array([], dtype=int)
+            nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+            results.append([{'formula': self.formulas[i], 'distance': float(distances[i]), 'dois': list(self.dois[i])}
+                            for i in nearest])
+        return results
+
+    def scoreEntries(self, entries: Iterable[Dict[str, Any]], k: int = 1) -> List[Dict[str, Any]]:
+        '''Scores ULTERA entries (e.g., produced by pyqalloy.parseTemplate before they are uploaded) against the whole
+        index, i.e., finds the nearest compositions reported in other publications than the entry itself.
+
+        Args:
+            entries: ULTERA entries to score.
+            k: Number of nearest neighbors to return for each entry. Defaults to 1.
+
+        Returns:
+            List (aligned with the entries) of dictionaries with the formula and doi of the entry, the distance to the
+            nearest composition from other publications (None if there is none), and the list of k neighbors (see
+            query()).
+        '''
+        entries = list(entries)
+        scores = [{'formula': _entryFormula(e), 'doi': e.get('reference', {}).get('doi')} for e in entries]
+        byDOI: Dict[Union[str, None], List[int]] = {}
+        for i, score in enumerate(scores):
+            byDOI.setdefault(score['doi'], []).append(i)
+        for doi, positions in byDOI.items():
+            neighbors = self.query([scores[i]['formula'] or '' for i in positions], k=k, excludeDOI=doi)
+            for i, n in zip(positions, neighbors):
+                scores[i]['neighbors'] = n
+                scores[i]['distance'] = n[0]['distance'] if n else None
+        return scores
+
+    def save(self, path: str) -> None:
+        '''Saves the index into a compressed NumPy .npz file.'''
+        np.savez_compressed(
+            path,
+            matrix=self.matrix,
+            formulas=np.array(self.formulas, dtype=str),
+            elements=np.array(self.elements, dtype=str),
+            dois=np.array(json.dumps(self.dois)),
+            lastId=np.array('' if self.lastId is None else self.lastId))
+
+    @classmethod
+    def load(cls, path: str) -> 'CompositionIndex':
+        '''Loads the index saved with save().'''
+        index = cls()
+        with np.load(path, allow_pickle=False) as data:
+            index.formulas = data['formulas'].tolist()
+            index.elements = data['elements'].tolist()
+            index.dois = json.loads(str(data['dois']))
+            index.matrix = data['matrix'].reshape(len(index.formulas), len(index.elements))
+            index.lastId = str(data['lastId']) or None
+        index._rows = {f: i for i, f in enumerate(index.formulas)}
+        return index
+
+
+def _entryFormula(entry: Dict[str, Any]) -> Union[str, None]:
+    '''Returns the relational formula of the ULTERA entry (or its formula, if the former is not present).'''
+    material = entry.get('material', {})
+    return material.get('relationalFormula', material.get('formula'))
@@ -0,0 +1,849 @@
+import datetime
+import mmap
+import re
+from typing import List, Dict, Tuple, Union, Any, Iterator, Iterable, Callable
+
+import bson
+import numpy as np
+from bson import ObjectId
+
+# Sentinel for the fields missing from a document, which MongoDB treats as null in most of the comparisons
+_MISSING = object()
+
+
+def _typeOrder(value: Any) -> int:
+    '''Rank of the BSON type of the value in the MongoDB comparison/sort order (null < numbers < strings < objects < arrays
+    < binary data < ObjectId < booleans < dates < regular expressions).'''
+    if value is None or value is _MISSING:
+        return 1
+    if isinstance(value, bool):
+        return 8
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, dict):
+        return 4
+    if isinstance(value, (list, tuple)):
+        return 5
+    if isinstance(value, bytes):
+        return 6
+    if isinstance(value, ObjectId):
+        return 7
+    if isinstance(value, datetime.datetime):
+        return 9
+    return 10
+
+
+def _sortKey(value: Any) -> Tuple[int, Any]:
+    '''Key sorting values of mixed types the way MongoDB does it. Arrays are ranked by their smallest element in ascending
+    sorts, which is a good approximation for the ULTERA data where the sorted fields are scalars.'''
+    if isinstance(value, (list, tuple)):
+        if len(value) == 0:
+            return (0, 0)
+        return min(_sortKey(v) for v in value)
+    order = _typeOrder(value)
+    if order == 1:
+        return (1, 0)
+    if order == 4:
+        return (4, str(sorted(value.items(), key=lambda kv: kv[0])))
+    if order == 9 and value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (order, value)
+
+
+def _resolve(doc: Any, path: List[str]) -> Any:
+    '''Resolves a dotted path (split into its parts) in a document. Returns _MISSING if the path does not exist. Arrays of
+    subdocuments along the path are traversed, returning the list of values found in them.'''
+    for i, part in enumerate(path):
+        if isinstance(doc, dict):
+            if part not in doc:
+                return _MISSING
+            doc = doc[part]
+        elif isinstance(doc, list):
+            if part.isdigit():
+                index = int(part)
+                if index >= len(doc):
+                    return _MISSING
+                doc = doc[index]
+            else:
+                values = [_resolve(d, path[i:]) for d in doc if isinstance(d, dict)]
+                values = [v for v in values if v is not _MISSING]
+                return values if values else _MISSING
+        else:
+            return _MISSING
+    return doc
+
+
+def _candidates(value: Any) -> List[Any]:
+    '''Values a query condition is compared against, i.e., the value itself and, for arrays, each of their elements.'''
+    if isinstance(value, list):
+        return [value] + value
+    return [value]
+
+
+def _equal(a: Any, b: Any) -> bool:
+    if a is _MISSING:
+        a = None
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    return _typeOrder(a) == _typeOrder(b) and a == b
+
+
+def _compare(a: Any, b: Any, op: Callable[[Any, Any], bool]) -> bool:
+    # Range comparisons only match the values of the same type (bracketing), like in MongoDB
+    if a is _MISSING or _typeOrder(a) != _typeOrder(b):
+        return False
+    return op(_sortKey(a), _sortKey(b))
+
+
+def _matchCondition(value: Any, condition: Any) -> bool:
+    '''Checks if the value of a field (possibly _MISSING) satisfies a query condition, i.e., either a plain value to be
+    matched or a dictionary of query operators.'''
+    if isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition):
+        for op, arg in condition.items():
+            if op == '$eq':
+                if not any(_equal(v, arg) for v in _candidates(value)):
+                    return False
+            elif op == '$ne':
+                if any(_equal(v, arg) for v in _candidates(value)):
+                    return False
+            elif op in ('$gt', '$gte', '$lt', '$lte'):
+                fn = {'$gt': lambda x, y: x > y, '$gte': lambda x, y: x >= y,
+                      '$lt': lambda x, y: x < y, '$lte': lambda x, y: x <= y}[op]
+                if not any(_compare(v, arg, fn) for v in _candidates(value)):
+                    return False
+            elif op == '$in':
+                if not any(_equal(v, a) for v in _candidates(value) for a in arg):
+                    return False
+            elif op == '$nin':
+                if any(_equal(v, a) for v in _candidates(value) for a in arg):
+                    return False
+            elif op == '$exists':
+                if (value is not _MISSING) != bool(arg):
+                    return False
+            elif op == '$regex':
+                pattern = re.compile(arg, _regexFlags(condition.get('$options', '')))
+                if not any(isinstance(v, str) and pattern.search(v) for v in _candidates(value)):
+                    return False
+            elif op == '$options':
+                continue
+            elif op == '$size':
+                if not (isinstance(value, list) and len(value) == arg):
+                    return False
+            elif op == '$not':
+                if _matchCondition(value, arg):
+                    return False
+            elif op == '$elemMatch':
+                if not (isinstance(value, list) and any(
+                        _matchDocument(v, arg) if isinstance(v, dict) else _matchCondition(v, arg) for v in value)):
+                    return False
+            else:
+                raise NotImplementedError(f'Query operator {op} is not supported by the BSONCollection.')
+        return True
+    elif isinstance(condition, re.Pattern):
+        return any(isinstance(v, str) and condition.search(v) for v in _candidates(value))
+    else:
+        return any(_equal(v, condition) for v in _candidates(value))
+
+
+def _regexFlags(options: str) -> int:
+    flags = 0
+    for option, flag in zip('imsx', [re.IGNORECASE, re.MULTILINE, re.DOTALL, re.VERBOSE]):
+        if option in options:
+            flags |= flag
+    return flags
+
+
+def _matchDocument(doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    '''Checks if a document matches a MongoDB query filter.'''
+    for key, condition in query.items():
+        if key == '$and':
+            if not all(_matchDocument(doc, q) for q in condition):
+                return False
+        elif key == '$or':
+            if not any(_matchDocument(doc, q) for q in condition):
+                return False
+        elif key == '$nor':
+            if any(_matchDocument(doc, q) for q in condition):
+                return False
+        elif key.startswith('$'):
+            raise NotImplementedError(f'Query operator {key} is not supported by the BSONCollection.')
+        elif not _matchCondition(_resolve(doc, key.split('.')), condition):
+            return False
+    return True
+
+
+def _project(doc: Dict[str, Any], projection: Union[Dict[str, Any], List[str], None]) -> Dict[str, Any]:
+    '''Applies a MongoDB projection (inclusion or exclusion of dotted paths) to a document, returning a new document.'''
+    if projection is None:
+        return doc
+    if isinstance(projection, (list, tuple)):
+        projection = {k: 1 for k in projection}
+    includeId = bool(projection.get('_id', 1))
+    fields = {k: v for k, v in projection.items() if k != '_id'}
+    if fields and all(not v for v in fields.values()):
+        # Exclusion projection
+        result = _excludePaths(doc, [k.split('.') for k in fields])
+        if not includeId:
+            result.pop('_id', None)
+        return result
+    result = {}
+    if includeId and '_id' in doc:
+        result['_id'] = doc['_id']
+    for key in fields:
+        _includePath(doc, result, key.split('.'))
+    return result
+
+
+def _includePath(source: Any, target: Dict[str, Any], path: List[str]) -> None:
+    if not isinstance(source, dict) or path[0] not in source:
+        return
+    value = source[path[0]]
+    if len(path) == 1:
+        target[path[0]] = value
+    elif isinstance(value, dict):
+        _includePath(value, target.setdefault(path[0], {}), path[1:])
+    elif isinstance(value, list):
+        subdocuments = target.setdefault(path[0], [{} for _ in value])
+        for v, t in zip(value, subdocuments):
+            _includePath(v, t, path[1:])
+
+
+def _excludePaths(doc: Dict[str, Any], paths: List[List[str]]) -> Dict[str, Any]:
+    excluded = {p[0] for p in paths if len(p) == 1}
+    nested = {}
+    for p in paths:
+        if len(p) > 1:
+            nested.setdefault(p[0], []).append(p[1:])
+    result = {}
+    for k, v in doc.items():
+        if k in excluded:
+            continue
+        if k in nested and isinstance(v, dict):
+            v = _excludePaths(v, nested[k])
+        result[k] = v
+    return result
+
+
+def _sortDocuments(docs: List[Dict[str, Any]], sortSpec: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+    '''Sorts documents by a list of (dotted path, direction) pairs, with stable sorts applied from the last key to the first.'''
+    for key, direction in reversed(sortSpec):
+        path = key.split('.')
+        docs = sorted(docs, key=lambda d: _sortKey(_resolve(d, path)), reverse=direction < 0)
+    return docs
+
+
+def _normalizeSort(keyOrList: Union[str, List[Tuple[str, int]], Dict[str, int]], direction: int = None) -> List[Tuple[str, int]]:
+    if isinstance(keyOrList, str):
+        return [(keyOrList, 1 if direction is None else direction)]
+    if isinstance(keyOrList, dict):
+        return list(keyOrList.items())
+    return [(k, d) for k, d in keyOrList]
+
+
+class BSONCursor:
+    '''Lazy cursor over the results of a BSONCollection query, following the pymongo Cursor interface for the commonly used
+    sort(), skip(), limit(), and batch_size() modifiers, which can be chained before iteration starts.'''
+
+    def __init__(self,
+                 collection: 'BSONCollection',
+                 filter: Dict[str, Any] = None,
+                 projection: Union[Dict[str, Any], List[str]] = None,
+                 skip: int = 0,
+                 limit: int = 0,
+                 sort: List[Tuple[str, int]] = None):
+        self._collection = collection
+        self._filter = filter or {}
+        self._projection = projection
+        self._skip = skip
+        self._limit = limit
+        self._sort = _normalizeSort(sort) if sort is not None else None
+        self._iterator = None
+
+    def sort(self, keyOrList: Union[str, List[Tuple[str, int]]], direction: int = None) -> 'BSONCursor':
+        self._sort = _normalizeSort(keyOrList, direction)
+        return self
+
+    def skip(self, skip: int) -> 'BSONCursor':
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> 'BSONCursor':
+        self._limit = limit
+        return self
+
+    def batch_size(self, batchSize: int) -> 'BSONCursor':
+        # Documents are already in memory, so batching does not apply
+        return self
+
+    def _iterate(self) -> Iterator[Dict[str, Any]]:
+        docs = self._collection._matching(self._filter)
+        if self._sort:
+            docs = iter(_sortDocuments(list(docs), self._sort))
+        n = 0
+        for i, doc in enumerate(docs):
+            if i < self._skip:
+                continue
+            if self._limit and n >= self._limit:
+                break
+            n += 1
+            yield _project(doc, self._projection)
+
+    def __iter__(self) -> 'BSONCursor':
+        return self
+
+    def __next__(self) -> Dict[str, Any]:
+        if self._iterator is None:
+            self._iterator = self._iterate()
+        return next(self._iterator)
+
+    def close(self) -> None:
+        self._iterator = iter(())
+
+
+class BSONCollection:
+    '''Fast, read-only, in-process store of ULTERA (or any other) documents with a MongoDB-compatible query interface, covering
+    the subset of the pymongo Collection API used by the analyzers: find() (with filter, projection, sort, skip, limit, and
+    batch size), find_one(), count_documents(), estimated_document_count(), distinct(), and aggregate() with the $match,
+    $group, $sort, $set/$addFields, $project, $unset, $limit, $skip, and $count stages. Documents are kept decoded in memory
+    and plain equality conditions are served from hash indexes built lazily on the first query on a given field, so repeated
+    queries (e.g., one per DOI) do not scan the whole dataset. It is typically created from a BSON dump (e.g., produced by
+    mongodump or pyqalloy.parseTemplateToBSON) with BSONCollection.fromBSON() and passed as the collectionManualOverride of
+    the analyzers, or created with the Analyzer.fromBSON() classmethod.
+
+    Documents returned without a projection are the stored ones (not copies) and must not be modified.
+
+    Args:
+        documents: Iterable of documents (dictionaries) to store.
+        name: Name of the collection. Defaults to 'BSONCollection'.
+    '''
+
+    def __init__(self, documents: Iterable[Dict[str, Any]], name: str = 'BSONCollection'):
+        self.name = name
+        self.full_name = name
+        self._documents = list(documents)
+        self._indexes = dict()
+
+    @classmethod
+    def fromBSON(cls, path: str, name: str = None) -> 'BSONCollection':
+        '''Loads a BSON dump file (concatenated BSON documents, as produced by mongodump or pyqalloy.parseTemplateToBSON) by
+        memory-mapping it and decoding the documents one by one, without reading the whole file into a separate buffer.
+
+        Args:
+            path: Path to the BSON file.
+            name: Name of the collection. Defaults to the file path.
+
+        Returns:
+            BSONCollection with all the documents from the file.
+        '''
+        with open(path, 'rb') as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be memory-mapped
+                return cls([], name=name or path)
+            with buffer:
+                documents = list(bson.decode_file_iter(buffer))
+        return cls(documents, name=name or path)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _index(self, key: str) -> Dict[Any, List[int]]:
+        '''Returns the hash index of the field (built on the first use), mapping each hashable value (and each element of
+        array values) to the ascending list of positions of documents holding it.'''
+        if key not in self._indexes:
+            path = key.split('.')
+            index = dict()
+            for i, doc in enumerate(self._documents):
+                value = _resolve(doc, path)
+                values = set()
+                for v in _candidates(None if value is _MISSING else value):
+                    try:
+                        values.add((_typeOrder(v), v))
+                    except TypeError:
+                        continue
+                for v in values:
+                    index.setdefault(v, []).append(i)
+            self._indexes[key] = index
+        return self._indexes[key]
+
+    def _matching(self, query: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        '''Iterates over the documents matching the query, in the stored order. The most selective plain equality condition
+        on a scalar value (if any) is served from the index and only the remaining conditions are checked document by
+        document.'''
+        positions = None
+        for key, condition in query.items():
+            if key.startswith('$'):
+                continue
+            if isinstance(condition, dict) and set(condition) == {'$eq'}:
+                condition = condition['$eq']
+            if isinstance(condition, (dict, list, re.Pattern)):
+                continue
+            try:
+                found = self._index(key).get((_typeOrder(condition), condition), [])
+            except TypeError:
+                continue
+            if positions is None or len(found) < len(positions):
+                positions = found
+        if positions is None:
+            return (doc for doc in self._documents if _matchDocument(doc, query))
+        return (self._documents[i] for i in positions if _matchDocument(self._documents[i], query))
+
+    def find(self,
+             filter: Dict[str, Any] = None,
+             projection: Union[Dict[str, Any], List[str]] = None,
+             skip: int = 0,
+             limit: int = 0,
+             sort: List[Tuple[str, int]] = None,
+             batch_size: int = 0,
+             **kwargs) -> BSONCursor:
+        '''Queries the documents matching the filter. Follows the pymongo Collection.find() signature.'''
+        return BSONCursor(self, filter=filter, projection=projection, skip=skip, limit=limit, sort=sort)
+
+    def find_one(self,
+                 filter: Dict[str, Any] = None,
+                 projection: Union[Dict[str, Any], List[str]] = None,
+                 **kwargs) -> Union[Dict[str, Any], None]:
+        '''Returns the first document matching the filter or None if there is no match.'''
+        for doc in self.find(filter, projection, limit=1, **kwargs):
+            return doc
+        return None
+
+    def count_documents(self, filter: Dict[str, Any], **kwargs) -> int:
+        '''Counts the documents matching the filter.'''
+        if not filter:
+            return len(self._documents)
+        return sum(1 for _ in self._matching(filter))
+
+    def estimated_document_count(self, **kwargs) -> int:
+        return len(self._documents)
+
+    def distinct(self, key: str, filter: Dict[str, Any] = None, **kwargs) -> List[Any]:
+        '''Returns the list of distinct values of the field (with array values unwound) in the order of first occurrence.'''
+        path = key.split('.')
+        seen, values = set(), []
+        for doc in self._matching(filter or {}):
+            value = _resolve(doc, path)
+            if value is _MISSING:
+                continue
+            for v in (value if isinstance(value, list) else [value]):
+                try:
+                    marker = (_typeOrder(v), v)
+                    if marker in seen:
+                        continue
+                    seen.add(marker)
+                except TypeError:
+                    if v in values:
+                        continue
+                values.append(v)
+        return values
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs) -> Iterator[Dict[str, Any]]:
+        '''Runs an aggregation pipeline built from the supported stages: $match, $group (with the $max, $min, $sum, $avg,
+        $first, $last, $push, and $addToSet accumulators), $sort, $set/$addFields, $project, $unset, $limit, $skip, and
+        $count. Returns an iterator over the resulting documents.'''
+        docs = None
+        for i, stage in enumerate(pipeline):
+            (op, spec), = stage.items()
+            if op == '$match':
+                docs = list(self._matching(spec)) if docs is None else [d for d in docs if _matchDocument(d, spec)]
+                continue
+            if docs is None:
+                docs = self._documents
+            if op == '$group':
+                docs = _group(docs, spec)
+            elif op == '$sort':
+                docs = _sortDocuments(list(docs), _normalizeSort(spec))
+            elif op in ('$set', '$addFields'):
+                docs = [_setFields(d, spec) for d in docs]
+            elif op == '$project':
+                if any(not isinstance(v, (int, bool)) for v in spec.values()):
+                    computed = {k: v for k, v in spec.items() if not isinstance(v, (int, bool))}
+                    docs = [_setFields(d, computed) for d in docs]
+                    spec = {k: (1 if k in computed else v) for k, v in spec.items()}
+                docs = [_project(d, spec) for d in docs]
+            elif op == '$unset':
+                docs = [_project(d, {k: 0 for k in ([spec] if isinstance(spec, str) else spec)}) for d in docs]
+            elif op == '$limit':
+                docs = list(docs)[:spec]
+            elif op == '$skip':
+                docs = list(docs)[spec:]
+            elif op == '$count':
+                docs = [{spec: len(list(docs))}]
+            else:
+                raise NotImplementedError(f'Aggregation stage {op} is not supported by the BSONCollection.')
+        return iter(list(docs if docs is not None else self._documents))
+
+
+def _evaluate(doc: Dict[str, Any], expression: Any) -> Any:
+    '''Evaluates a (minimal) aggregation expression: field paths ("$a.b"), the $$ROOT and $$REMOVE variables, and literals.'''
+    if isinstance(expression, str) and expression.startswith('$$'):
+        if expression == '$$ROOT':
+            return doc
+        if expression == '$$REMOVE':
+            return _MISSING
+        raise NotImplementedError(f'Aggregation variable {expression} is not supported by the BSONCollection.')
+    if isinstance(expression, str) and expression.startswith('$'):
+        return _resolve(doc, expression[1:].split('.'))
+    if isinstance(expression, dict):
+        if len(expression) == 1 and next(iter(expression)).startswith('$'):
+            op, arg = next(iter(expression.items()))
+            if op == '$literal':
+                return arg
+            raise NotImplementedError(f'Aggregation expression {op} is not supported by the BSONCollection.')
+        return {k: _evaluate(doc, v) for k, v in expression.items()}
+    return expression
+
+
+def _setFields(doc: Dict[str, Any], spec: Dict[str, Any]) -> Dict[str, Any]:
+    result = dict(doc)
+    for key, expression in spec.items():
+        value = _evaluate(doc, expression)
+        path = key.split('.')
+        target = result
+        for part in path[:-1]:
+            target[part] = dict(target.get(part, {})) if isinstance(target.get(part), dict) else {}
+            target = target[part]
+        if value is _MISSING:
+            target.pop(path[-1], None)
+        else:
+            target[path[-1]] = value
+    return result
+
+
+def _group(docs: Iterable[Dict[str, Any]], spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    groups = dict()
+    for doc in docs:
+        groupId = _evaluate(doc, spec['_id'])
+        groupId = None if groupId is _MISSING else groupId
+        marker = (_typeOrder(groupId), bson.encode({'k': groupId}) if isinstance(groupId, (dict, list)) else groupId)
+        if marker not in groups:
+            groups[marker] = {'_id': groupId, **{k: [] for k in spec if k != '_id'}}
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            (op, expression), = accumulator.items()
+            groups[marker][field].append(_evaluate(doc, expression))
+
+    results = []
+    for group in groups.values():
+        result = {'_id': group['_id']}
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            op = next(iter(accumulator))
+            values = group[field]
+            present = [v for v in values if v is not _MISSING and v is not None]
+            if op == '$max':
+                result[field] = max(present, key=_sortKey) if present else None
+            elif op == '$min':
+                result[field] = min(present, key=_sortKey) if present else None
+            elif op == '$sum':
+                result[field] = sum(v for v in present if isinstance(v, (int, float)) and not isinstance(v, bool))
+            elif op == '$avg':
+                numbers = [v for v in present if isinstance(v, (int, float)) and not isinstance(v, bool)]
+                result[field] = sum(numbers) / len(numbers) if numbers else None
+            elif op == '$first':
+                result[field] = None if values[0] is _MISSING else values[0]
+            elif op == '$last':
+                result[field] = None if values[-1] is _MISSING else values[-1]
+            elif op == '$push':
+                result[field] = [v for v in values if v is not _MISSING]
+            elif op == '$addToSet':
+                unique = []
+                for v in values:
+                    if v is not _MISSING and v not in unique:
+                        unique.append(v)
+                result[field] = unique
+            else:
+                raise NotImplementedError(f'Accumulator {op} is not supported by the BSONCollection.')
+        results.append(result)
+    return results
+
+
+class SnapshotCache:
+    '''Opt-in, on-disk cache of snapshots of (remote) MongoDB-compatible collections, keyed by the server, database, and
+    collection names. Each snapshot is stored as a BSON dump with a JSON sidecar holding its metadata. After the first full
+    download, sync() fetches only the documents uploaded or changed since the last sync, i.e., with meta.timeStamp at or
+    after the latest one in the snapshot or with _id above the latest one, and merges them (by _id) into the snapshot. If the
+    remote collection turns out to have fewer documents than the merged snapshot (i.e., some were deleted), the snapshot is
+    downloaded again in full. Changes to documents which do not update their meta.timeStamp cannot be detected, so the
+    snapshots should be invalidated explicitly with invalidate() after such edits.
+
+    Args:
+        cacheDir: Directory where the snapshots are stored. Defaults to the PYQALLOY_CACHE_DIR environment variable if set,
+            or to ~/.cache/pyqalloy otherwise.
+    '''
+
+    def __init__(self, cacheDir: str = None):
+        import os
+        if cacheDir is None:
+            cacheDir = os.environ.get('PYQALLOY_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'pyqalloy'))
+        self.cacheDir = cacheDir
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+    @staticmethod
+    def key(server: str, database: str, collection: str) -> str:
+        '''Returns the file name stem of the snapshot of the collection, which is human-readable but unique for the server.'''
+        import hashlib
+        digest = hashlib.sha1(f'{server}/{database}/{collection}'.encode('utf-8')).hexdigest()[:12]
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', f'{database}.{collection}') + f'.{digest}'
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        import os
+        return os.path.join(self.cacheDir, key + '.bson'), os.path.join(self.cacheDir, key + '.json')
+
+    def _readMeta(self, key: str) -> Union[Dict[str, Any], None]:
+        import json
+        import os
+        dataPath, metaPath = self._paths(key)
+        if not (os.path.isfile(dataPath) and os.path.isfile(metaPath)):
+            return None
+        with open(metaPath, 'r') as f:
+            return json.load(f)
+
+    def _writeMeta(self, key: str, meta: Dict[str, Any]) -> None:
+        import json
+        import os
+        _, metaPath = self._paths(key)
+        with open(metaPath + '.tmp', 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(metaPath + '.tmp', metaPath)
+
+    def sync(self,
+             collection: Any,
+             server: str,
+             database: str,
+             collectionName: str,
+             printOut: bool = True) -> BSONCollection:
+        '''Brings the snapshot of the collection up to date and returns it as a BSONCollection.
+
+        Args:
+            collection: The source MongoDB-compatible Collection object (pymongo, MontyDB, or mongomock).
+            server: Name of the server (e.g., its address) used in the snapshot key. Credentials should not be included.
+            database: Name of the database used in the snapshot key.
+            collectionName: Name of the collection used in the snapshot key.
+            printOut: If True, prints a summary of the sync. Defaults to True.
+
+        Returns:
+            BSONCollection with the up-to-date snapshot of the collection.
+        '''
+        import os
+        startTime = datetime.datetime.now(datetime.timezone.utc)
+        key = self.key(server, database, collectionName)
+        dataPath, _ = self._paths(key)
+        meta = self._readMeta(key)
+
+        conditions = []
+        if meta is not None:
+            if meta['lastTimeStamp'] is not None:
+                conditions.append({'meta.timeStamp': {'$gte': datetime.datetime.fromisoformat(meta['lastTimeStamp'])}})
+            if meta['lastId'] is not None:
+                conditions.append({'_id': {'$gt': ObjectId(meta['lastId'])}})
+        fullSync = len(conditions) == 0
+        documents = [] if fullSync else BSONCollection.fromBSON(dataPath)._documents
+
+        fetched, added, replaced = self._merge(documents, collection.find({'$or': conditions} if conditions else {}))
+        if not fullSync and len(documents) > collection.count_documents({}):
+            # Documents have been deleted from the source collection since the last sync
+            documents = []
+            fetched, added, replaced = self._merge(documents, collection.find({}))
+            fullSync = True
+
+        if fullSync or replaced:
+            with open(dataPath + '.tmp', 'wb') as f:
+                for doc in documents:
+                    f.write(bson.encode(doc))
+            os.replace(dataPath + '.tmp', dataPath)
+        elif added:
+            with open(dataPath, 'ab') as f:
+                for doc in documents[-added:]:
+                    f.write(bson.encode(doc))
+
+        timeStamps = [_resolve(d, ['meta', 'timeStamp']) for d in documents]
+        timeStamps = [t for t in timeStamps if isinstance(t, datetime.datetime)]
+        ids = [d['_id'] for d in documents if isinstance(d.get('_id'), ObjectId)]
+        now = datetime.datetime.now(datetime.timezone.utc)
+        meta = {
+            'server': server,
+            'database': database,
+            'collection': collectionName,
+            'documents': len(documents),
+            'lastTimeStamp': max(timeStamps).isoformat() if timeStamps else None,
+            'lastId': str(max(ids)) if ids else None,
+            'created': now.isoformat() if fullSync or meta is None else meta['created'],
+            'lastSync': now.isoformat(),
+            'syncs': 1 if fullSync or meta is None else meta['syncs'] + 1,
+            'lastSyncFull': fullSync,
+            'lastSyncFetched': fetched,
+            'lastSyncAdded': added,
+            'lastSyncReplaced': replaced,
+            'lastSyncSeconds': (now - startTime).total_seconds(),
+        }
+        self._writeMeta(key, meta)
+        if printOut:
+            print(f'Snapshot of {database}.{collectionName} {"downloaded" if fullSync else "synced"}: {fetched} documents '
+                  f'fetched ({added} new, {replaced} changed), {len(documents)} in total.')
+        return BSONCollection(documents, name=f'{database}.{collectionName}')
+
+    @staticmethod
+    def _merge(documents: List[Dict[str, Any]], fetchedDocuments: Iterable[Dict[str, Any]]) -> Tuple[int, int, int]:
+        '''Merges the fetched documents into the list of documents (in place) by their _id. Returns the number of fetched,
+        added, and replaced (changed) documents.'''
+        positions = {d['_id']: i for i, d in enumerate(documents) if '_id' in d}
+        fetched, added, replaced = 0, 0, 0
+        for doc in fetchedDocuments:
+            fetched += 1
+            if doc.get('_id') in positions:
+                i = positions[doc['_id']]
+                if documents[i] != doc:
+                    documents[i] = doc
+                    replaced += 1
+            else:
+                positions[doc.get('_id')] = len(documents)
+                documents.append(doc)
+                added += 1
+        return fetched, added, replaced
+
+    def invalidate(self, server: str = None, database: str = None, collection: str = None) -> int:
+        '''Removes the snapshots matching the server, database, and collection names, where None matches any value, i.e.,
+        calling it without arguments removes all the snapshots. Returns the number of removed snapshots.'''
+        import os
+        removed = 0
+        for key, meta in self._allMeta().items():
+            if all(v is None or meta.get(field) == v for field, v in
+                   [('server', server), ('database', database), ('collection', collection)]):
+                for path in self._paths(key):
+                    if os.path.isfile(path):
+                        os.remove(path)
+                removed += 1
+        return removed
+
+    def _allMeta(self) -> Dict[str, Dict[str, Any]]:
+        import os
+        allMeta = dict()
+        for f in sorted(os.listdir(self.cacheDir)):
+            if f.endswith('.json'):
+                meta = self._readMeta(f[:-5])
+                if meta is not None:
+                    allMeta[f[:-5]] = meta
+        return allMeta
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        '''Returns the metadata of all the snapshots in the cache (keyed by the snapshot key), i.e., their source, number of
+        documents, size on disk in bytes, the time and the number of syncs, and the number of documents fetched, added, and
+        replaced during the last sync.'''
+        import os
+        allMeta = self._allMeta()
+        for key, meta in allMeta.items():
+            meta['bytes'] = os.path.getsize(self._paths(key)[0])
+        return allMeta
+
+
+class EmbeddingCache:
+    '''Opt-in, on-disk cache of low-dimensional embeddings (e.g., the TSNE of AllDataAnalyzer.getTSNE) keyed by a hash of
+    the composition matrix, the element order, and the parameters of the embedding, so that rerunning an identical
+    analysis (e.g., after reopening a notebook) loads the embedding instead of recomputing it. Each embedding is stored as
+    a NumPy .npy file. The total size of the cache is capped at maxBytes by removing the least recently used embeddings
+    (by the modification time of their files, which is refreshed on every hit).
+
+    Args:
+        cacheDir: Directory where the embeddings are stored. Defaults to the embeddings subdirectory of the
+            PYQALLOY_CACHE_DIR environment variable if set, or of ~/.cache/pyqalloy otherwise.
+        maxBytes: Maximum total size of the cached embeddings in bytes. Defaults to 256 MB.
+    '''
+
+    def __init__(self, cacheDir: str = None, maxBytes: int = 256 * 1024**2):
+        import os
+        if cacheDir is None:
+            cacheDir = os.path.join(
+                os.environ.get('PYQALLOY_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'pyqalloy')),
+                'embeddings')
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        os.makedirs(self.cacheDir, exist_ok=True)
+
+    @staticmethod
+    def key(matrix: np.ndarray, elements: List[str], parameters: Dict[str, Any]) -> str:
+        '''Returns the key of the embedding of the composition matrix (one row per composition, with columns ordered
+        as the elements) calculated with the parameters, which have to be JSON-serializable.'''
+        import hashlib
+        import json
+        matrix = np.ascontiguousarray(matrix, dtype=np.float64)
+        digest = hashlib.sha1()
+        digest.update(json.dumps([list(matrix.shape), list(elements), parameters], sort_keys=True).encode('utf-8'))
+        digest.update(matrix.tobytes())
+        return f'{parameters.get("method", "embedding")}.{digest.hexdigest()}'
+
+    def _path(self, key: str) -> str:
+        import os
+        return os.path.join(self.cacheDir, key + '.npy')
+
+    def get(self, key: str) -> Union[np.ndarray, None]:
+        '''Returns the cached embedding with the key, or None if it is not in the cache.'''
+        import os
+        path = self._path(key)
+        try:
+            embedding = np.load(path, allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        except (EOFError, ValueError, OSError):
+            # A truncated or otherwise unreadable file (e.g., written by an interrupted process outside of put) is
+            # discarded, so that the embedding is recalculated and stored again
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        os.utime(path)
+        return embedding
+
+    def put(self, key: str, embedding: np.ndarray) -> None:
+        '''Stores the embedding under the key and evicts the least recently used embeddings above maxBytes.'''
+        import os
+        path = self._path(key)
+        # Written to a temporary file of this process first, so that an interrupted save never leaves a truncated .npy
+        tmpPath = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(tmpPath, 'wb') as f:
+                np.save(f, np.asarray(embedding), allow_pickle=False)
+            os.replace(tmpPath, path)
+        finally:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+        self._evict(keep=path)
+
+    def _evict(self, keep: str = None) -> int:
+        '''Removes the least recently used embeddings until the cache fits in maxBytes, never removing the keep path.
+        Returns the number of removed embeddings.'''
+        import os
+        files = [os.path.join(self.cacheDir, f) for f in os.listdir(self.cacheDir) if f.endswith('.npy')]
+        files = sorted((os.stat(path).st_mtime_ns, os.path.getsize(path), path) for path in files)
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for _, size, path in files:
+            if total <= self.maxBytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total -= size
+                removed += 1
+        return removed
+
+    def invalidate(self) -> int:
+        '''Removes all the cached embeddings. Returns the number of removed embeddings.'''
+        import os
+        removed = 0
+        for f in os.listdir(self.cacheDir):
+            if f.endswith('.npy'):
+                os.remove(os.path.join(self.cacheDir, f))
+                removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        '''Returns the number of the cached embeddings, their total size on disk in bytes, and the size cap.'''
+        import os
+        sizes = [os.path.getsize(os.path.join(self.cacheDir, f)) for f in os.listdir(self.cacheDir) if f.endswith('.npy')]
+        return {'embeddings': len(sizes), 'bytes': sum(sizes), 'maxBytes': self.maxBytes}
@@ -49,7 +49,7 @@ class TestAllDataContextULTERA(unittest.TestCase):
         with self.subTest(msg='Automatic epsilon adjustment to find at least 5 outliers'):
             _, outlierN4 = self.allD.getDBSCANautoEpsilon(outlierTargetN=5)
 
-            self.assertGreater(outlierN4, 5)
+            self.assertGreaterEqual(outlierN4, 5)
 
         with self.subTest(msg='Update a list of outliers'):
             self.allD.updateOutliersList()
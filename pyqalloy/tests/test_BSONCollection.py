@@ -0,0 +1,244 @@
+import unittest
+import asyncio
+import datetime
+import threading
+import time
+from io import StringIO
+from contextlib import redirect_stdout
+
+from pyqalloy.curation import analysis
+from pyqalloy.curation.store import BSONCollection
+from montydb import MontyClient
+from montydb.types.bson import init as init_bson
+import bson
+import numpy as np
+
+
+class TestBSONCollection(unittest.TestCase):
+    '''Test the read-only BSONCollection store against MontyDB loaded with the same ULTERA samples, for the subset of the
+    MongoDB query interface used by the analyzers.
+    '''
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        init_bson(use_bson=True)
+        cls.montyCollection = MontyClient(":memory:").bsonStoreReference.test
+        with open('examples/ULTERA_sample.bson', 'rb') as f:
+            cls.montyCollection.insert_many(bson.decode_all(f.read()))
+        cls.store = BSONCollection.fromBSON('examples/ULTERA_sample.bson')
+
+    def test_Load(self):
+        self.assertEqual(len(self.store), 300)
+        self.assertEqual(self.store.estimated_document_count(), 300)
+        self.assertIsNotNone(self.store.find_one({'_id': bson.ObjectId('635997c429377cf4308b62b0')}))
+
+    def test_FindMatchesMontyDB(self):
+        queries = [
+            {},
+            {'reference.doi': '10.1016/j.actamat.2016.06.063'},
+            {'reference.doi': {'$ne': None}},
+            {'reference.doi': {'$ne': None}, 'meta.name': 'Adam Krajewski'},
+            {'material.nComponents': {'$gte': 3}, 'reference.doi': {'$ne': None}},
+            {'material.nComponents': {'$lt': 4}},
+            {'material.elements': 'Ni'},
+            {'material.elements': {'$in': ['W', 'Ta']}},
+            {'material.elements': {'$nin': ['Ni']}, 'material.nComponents': 5},
+            {'reference.pointer': {'$exists': True}},
+            {'$or': [{'material.elements': 'Hf'}, {'material.nComponents': {'$gt': 6}}]},
+            {'material.relationalFormula': 'Ti1 Ta1.33 Nb1.33 W1.33 Mo1.33'},
+            {'meta.name': 'Crazy Scientist'},
+        ]
+        for query in queries:
+            with self.subTest(msg=str(query)):
+                expected = [d['_id'] for d in self.montyCollection.find(query, {'_id': 1})]
+                found = [d['_id'] for d in self.store.find(query, {'_id': 1})]
+                self.assertListEqual(found, expected)
+                self.assertEqual(self.store.count_documents(query), self.montyCollection.count_documents(query))
+
+    def test_ProjectionSortLimit(self):
+        with self.subTest(msg='Inclusion projection'):
+            doc = self.store.find_one({}, {'material.formula': 1, 'reference.doi': 1, '_id': 0})
+            self.assertListEqual(list(doc), ['material', 'reference'])
+            self.assertListEqual(list(doc['material']), ['formula'])
+
+        with self.subTest(msg='Exclusion projection'):
+            doc = self.store.find_one({}, {'material': 0})
+            self.assertNotIn('material', doc)
+            self.assertIn('_id', doc)
+
+        with self.subTest(msg='Sort, skip, and limit'):
+            expected = [d['_id'] for d in self.montyCollection.find({}, {'_id': 1}).sort(
+                [('material.nComponents', -1), ('reference.doi', 1)]).skip(5).limit(20)]
+            found = [d['_id'] for d in self.store.find({}, {'_id': 1}).sort(
+                [('material.nComponents', -1), ('reference.doi', 1)]).skip(5).limit(20)]
+            self.assertListEqual(found, expected)
+            self.assertEqual(len(list(self.store.find({}, limit=7))), 7)
+
+    def test_DistinctAndAggregate(self):
+        with self.subTest(msg='Distinct'):
+            self.assertSetEqual(set(self.store.distinct('reference.doi')), set(self.montyCollection.distinct('reference.doi')))
+
+        with self.subTest(msg='Aggregation pipeline of Analyzer.get_allDOIs'):
+            pipeline = [
+                {'$match': {'meta.name': 'Adam Krajewski', 'reference.doi': {'$ne': None}}},
+                {'$group': {'_id': '$reference.doi', 'timeStamp': {'$max': '$meta.timeStamp'}, 'n': {'$sum': 1}}},
+                {'$sort': {'timeStamp': 1, '_id': 1}},
+                {'$set': {'doi': '$_id', '_id': '$$REMOVE'}},
+                {'$project': {'doi': 1, 'n': 1, '_id': 0}}]
+            result = list(self.store.aggregate(pipeline))
+            self.assertEqual(len(result), 107)
+            self.assertListEqual(list(result[0]), ['doi', 'n'])
+            self.assertEqual(sum(r['n'] for r in result),
+                             self.montyCollection.count_documents({'meta.name': 'Adam Krajewski', 'reference.doi': {'$ne': None}}))
+
+    def test_DatesAndMixedTypes(self):
+        store = BSONCollection([
+            {'_id': 1, 'meta': {'timeStamp': datetime.datetime(2024, 1, 2)}, 'v': 'a'},
+            {'_id': 2, 'meta': {'timeStamp': datetime.datetime(2023, 1, 2)}, 'v': 2},
+            {'_id': 3, 'v': None},
+            {'_id': 4, 'v': True},
+            {'_id': 5, 'v': [1, 3]}])
+        self.assertListEqual([d['_id'] for d in store.find().sort('meta.timeStamp', 1)], [3, 4, 5, 2, 1])
+        self.assertListEqual([d['_id'] for d in store.find({'v': None})], [3])
+        self.assertListEqual([d['_id'] for d in store.find({'v': {'$gt': 1}})], [2, 5])
+        self.assertListEqual([d['_id'] for d in store.find({'v': 1})], [5])
+        self.assertListEqual([d['_id'] for d in store.find({'meta.timeStamp': {'$gte': datetime.datetime(2024, 1, 1)}})], [1])
+
+
+class TestAnalyzerFromBSON(unittest.TestCase):
+    '''Test the analyzers created with Analyzer.fromBSON against the results obtained with the MontyDB collection override.
+    '''
+
+    def test_SingleDOIAnalyzer(self):
+        with redirect_stdout(StringIO()):
+            sD = analysis.SingleDOIAnalyzer.fromBSON('examples/ULTERA_sample.bson')
+        self.assertIsInstance(sD.collection, BSONCollection)
+        self.assertTrue(sD.collectionManualOverrideSet)
+
+        with self.subTest(msg='DOIs'):
+            self.assertEqual(len(sD.get_allDOIs()), 157)
+            sD.setName('Adam Krajewski')
+            self.assertEqual(len(sD.get_allDOIs()), 107)
+
+        with self.subTest(msg='Nearest neighbor analysis'):
+            sD.setDOI('10.1016/j.actamat.2016.06.063')
+            sD.analyze_nnDistances()
+            sD.print_nnDistances(printOut=False)
+            self.assertIn('0.1006    |  1.0        <-- F: Mo1 Cr12 Fe12 Co12 Ni12', sD.printLog)
+
+    def test_SingleCompositionAnalyzer(self):
+        with redirect_stdout(StringIO()):
+            sC = analysis.SingleCompositionAnalyzer.fromBSON('examples/ULTERA_sample.bson')
+            sC.scanCompositionsAround100(resultLimit=10, uncertainty=0.5)
+        self.assertEqual(len(sC.printOuts), 4)
+        self.assertTrue(sC.printOuts[0].startswith('DOI: 10.1016/j.actamat.2016.06.063\n'))
+
+    def test_AllDataAnalyzer(self):
+        with redirect_stdout(StringIO()):
+            aD = analysis.AllDataAnalyzer.fromBSON('examples/ULTERA_sample.bson')
+        self.assertEqual(len(aD.allComps), 169)
+        self.assertEqual(aD.allCompsMatrix.shape, (169, 27))
+
+
+class _LatencyCollection:
+    '''Local stand-in for a hosted database, adding an artificial round trip latency to every query of the wrapped
+    collection and recording the highest number of queries in flight at once.'''
+
+    def __init__(self, collection, latency: float):
+        self.collection = collection
+        self.latency = latency
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def _roundTrip(self, query, *args, **kwargs):
+        with self.lock:
+            self.inFlight += 1
+            self.maxInFlight = max(self.maxInFlight, self.inFlight)
+        time.sleep(self.latency)
+        with self.lock:
+            self.inFlight -= 1
+        return query(*args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        collection = self
+
+        class Cursor:
+            def __init__(self, cursor):
+                self.cursor = cursor
+
+            def __getattr__(self, name):
+                return lambda *a, **kw: Cursor(getattr(self.cursor, name)(*a, **kw))
+
+            def __iter__(self):
+                # Like with pymongo, the round trip happens when the results are first requested
+                return iter(collection._roundTrip(list, self.cursor))
+
+        return Cursor(self.collection.find(*args, **kwargs))
+
+    def find_one(self, *args, **kwargs):
+        return self._roundTrip(self.collection.find_one, *args, **kwargs)
+
+    def count_documents(self, *args, **kwargs):
+        return self._roundTrip(self.collection.count_documents, *args, **kwargs)
+
+
+class TestAsyncDOIFetching(unittest.TestCase):
+    '''Test the asynchronous per-DOI analysis of the SingleDOIAnalyzer against a collection with artificial latency.
+    '''
+
+    def setUp(self) -> None:
+        self.latency = 0.05
+        self.collection = _LatencyCollection(BSONCollection.fromBSON('examples/ULTERA_sample.bson'), self.latency)
+        with redirect_stdout(StringIO()):
+            self.sD = analysis.SingleDOIAnalyzer(collectionManualOverride=self.collection)
+            self.dois = self.sD.get_allDOIs()[:40]
+            self.reference = self.sD.analyzeAllDOIs(dois=self.dois)
+
+    def test_MatchesAnalyzeAllDOIs(self):
+        with redirect_stdout(StringIO()):
+            records = asyncio.run(self.sD.analyzeDOIsAsync(dois=self.dois, concurrency=8))
+        self.assertListEqual([r['doi'] for r in records], self.dois)
+        for record, reference in zip(records, self.reference):
+            with self.subTest(msg=record['doi']):
+                for key in ['formulas', 'fStrings', 'els', 'names', 'pointers', 'parentDatabases', 'nDatapoints']:
+                    self.assertEqual(record[key], reference[key])
+                np.testing.assert_allclose(record['nnDistances'], reference['nnDistances'])
+
+    def test_ConcurrencyHidesLatency(self):
+        startTime = time.perf_counter()
+        with redirect_stdout(StringIO()):
+            records = asyncio.run(self.sD.analyzeDOIsAsync(dois=self.dois, concurrency=8))
+        elapsed = time.perf_counter() - startTime
+        self.assertEqual(len(records), 40)
+        with self.subTest(msg='Concurrency limit is respected'):
+            self.assertLessEqual(self.collection.maxInFlight, 8)
+            self.assertGreater(self.collection.maxInFlight, 1)
+        with self.subTest(msg='Faster than one round trip per DOI in series'):
+            self.assertLess(elapsed, len(self.dois) * self.latency / 2)
+
+    def test_ResultsAsTheyArrive(self):
+        async def collect():
+            return [record['doi'] async for record in self.sD.iterDOIsAsync(dois=self.dois, concurrency=4)]
+        self.assertCountEqual(asyncio.run(collect()), self.dois)
+
+    def test_CancelDoesNotBlock(self):
+        self.collection.latency = 1.0
+
+        async def cancelWhileInFlight():
+            consumer = asyncio.ensure_future(self.sD.iterDOIsAsync(dois=self.dois, concurrency=4).__anext__())
+            await asyncio.sleep(0.2)
+            startTime = time.perf_counter()
+            consumer.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await consumer
+            return time.perf_counter() - startTime
+        # The queries in flight are not waited for on the event loop thread
+        self.assertLess(asyncio.run(cancelWhileInFlight()), self.collection.latency / 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
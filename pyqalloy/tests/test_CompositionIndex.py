@@ -0,0 +1,134 @@
+import unittest
+import os
+import shutil
+import tempfile
+from io import StringIO
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from pyqalloy.core import utils
+from pyqalloy.curation import analysis
+from pyqalloy.curation.index import CompositionIndex
+from pyqalloy.curation.store import BSONCollection
+
+
+class TestCompositionIndex(unittest.TestCase):
+    '''Test the whole-database composition nearest neighbor index built over the ULTERA samples against the brute force
+    L1 distances, including its incremental updates, persistence, and the scoring of new upload entries.
+    '''
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.collection = BSONCollection.fromBSON('examples/ULTERA_sample.bson')
+        cls.index = CompositionIndex.fromCollection(cls.collection)
+
+    def bruteForce(self, formula: str) -> np.ndarray:
+        matrix, elements, _ = utils.compStrs2fracMatrix(self.index.formulas + [formula])
+        return np.abs(matrix[:-1] - matrix[-1]).sum(axis=1)
+
+    def test_Build(self):
+        # Entries without the relational formula are indexed by their formula
+        formulas = {d['material'].get('relationalFormula', d['material']['formula']) for d in self.collection.find()}
+        self.assertEqual(len(self.index), len(formulas))
+        self.assertEqual(self.index.matrix.shape, (len(self.index), len(self.index.elements)))
+        np.testing.assert_allclose(self.index.matrix.sum(axis=1), 1)
+        with self.subTest(msg='DOIs of each composition'):
+            f = 'Ti1 Ta1.33 Nb1.33 W1.33 Mo1.33'
+            self.assertSetEqual(
+                set(self.index.dois[self.index.formulas.index(f)]),
+                set(self.collection.distinct('reference.doi', {'material.relationalFormula': f})))
+
+    def test_QueryMatchesBruteForce(self):
+        queries = ['Mo2 Cr24.5 Fe24.5 Co24.5 Ni24.5', 'Al0.5CoCrFeNi', 'Ni60 Cr20 Fe20', 'MoNbTaW', 'Ni50 Os50',
+                   'Zr35 Ti30 Nb20 Al10 Ta5', 'Os']
+        results = self.index.query(queries, k=3)
+        for formula, neighbors in zip(queries, results):
+            with self.subTest(msg=formula):
+                reference = np.sort(self.bruteForce(formula))[:3]
+                np.testing.assert_allclose([n['distance'] for n in neighbors], reference, atol=1e-12)
+        with self.subTest(msg='Exact match'):
+            f = self.index.formulas[10]
+            self.assertEqual(self.index.query([f])[0][0]['formula'], f)
+            self.assertAlmostEqual(self.index.query([f])[0][0]['distance'], 0)
+        with self.subTest(msg='Unparsable formula'):
+            self.assertListEqual(self.index.query(['amorphous']), [[]])
+
+    def test_ExcludeDOI(self):
+        f = 'Ti1 Ta1.33 Nb1.33 W1.33 Mo1.33'
+        dois = self.index.dois[self.index.formulas.index(f)]
+        nearest = self.index.query([f], k=1, excludeDOI=dois[0])[0][0]
+        if len(dois) == 1:
+            self.assertNotEqual(nearest['formula'], f)
+            self.assertGreater(nearest['distance'], 0)
+        else:
+            self.assertEqual(nearest['formula'], f)
+
+    def test_IncrementalUpdate(self):
+        documents = sorted(self.collection.find(), key=lambda d: d['_id'])
+        index = CompositionIndex.fromCollection(BSONCollection(documents[:150]))
+        added = index.updateFromCollection(BSONCollection(documents))
+        self.assertEqual(len(index), len(self.index))
+        self.assertEqual(added, len(self.index) - len(CompositionIndex.fromCollection(BSONCollection(documents[:150]))))
+        self.assertEqual(index.updateFromCollection(BSONCollection(documents)), 0)
+        with self.subTest(msg='Same results as the index built at once'):
+            for formula in ['Al0.5CoCrFeNi', 'Ni50 Os50', 'HfNbTaTiZr']:
+                self.assertAlmostEqual(index.query([formula])[0][0]['distance'], self.index.query([formula])[0][0]['distance'])
+        with self.subTest(msg='DOIs of the compositions match'):
+            for f, dois in zip(self.index.formulas, self.index.dois):
+                self.assertSetEqual(set(index.dois[index.formulas.index(f)]), set(dois))
+
+    def test_NewElementsAndPersistence(self):
+        index = CompositionIndex()
+        self.assertEqual(index.add(['Ni50 Cr50', 'Ni50 Cr50', 'amorphous'], ['a', 'b', 'c']), 1)
+        self.assertEqual(index.add(['Os50 Ir50', 'Ni50 Cr50'], ['d', 'e']), 1)
+        self.assertListEqual(index.elements[-2:], ['Ir', 'Os'] if index.elements.index('Ir') < index.elements.index('Os') else ['Os', 'Ir'])
+        self.assertListEqual(index.dois[0], ['a', 'b', 'e'])
+        self.assertAlmostEqual(index.query(['Ni50 Os50'])[0][0]['distance'], 1.0)
+
+        tempDir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempDir, 'index.npz')
+            self.index.save(path)
+            loaded = CompositionIndex.load(path)
+            self.assertListEqual(loaded.formulas, self.index.formulas)
+            self.assertListEqual(loaded.dois, self.index.dois)
+            self.assertEqual(loaded.lastId, self.index.lastId)
+            np.testing.assert_array_equal(loaded.matrix, self.index.matrix)
+            self.assertEqual(loaded.updateFromCollection(self.collection), 0)
+        finally:
+            shutil.rmtree(tempDir)
+
+    def test_ScoreEntries(self):
+        meta = {'source': 'test', 'name': 'Crazy Scientist', 'email': '', 'directFetch': 'Y', 'handFetch': 'N',
+                'comment': '', 'timeStamp': None, 'dataSheetName': 'test'}
+        # Typo of Co23Cr23Fe23Ni23Mo7 (DOI 10.1016/j.actamat.2016.06.063) with 33 instead of 23 for Ni
+        entries = [utils.datapoint2entry(meta, {'Composition': f, 'DOI': '10.0000/new'}, printOuts=False)
+                   for f in ['Co23Cr23Fe23Ni33Mo7', 'Os50 Ir50']]
+        scores = self.index.scoreEntries(entries, k=2)
+        self.assertEqual(scores[0]['doi'], '10.0000/new')
+        self.assertIn('10.1016/j.actamat.2016.06.063', scores[0]['neighbors'][0]['dois'])
+        self.assertLess(scores[0]['distance'], 0.2)
+        self.assertAlmostEqual(scores[1]['distance'], 2.0)
+        self.assertEqual(len(scores[0]['neighbors']), 2)
+
+
+class TestAnalyzerCompositionIndex(unittest.TestCase):
+    '''Test building, persisting, and updating the composition index through the analyzers.'''
+
+    def test_getCompositionIndex(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempDir, 'index.npz')
+            with redirect_stdout(StringIO()):
+                aD = analysis.SingleDOIAnalyzer.fromBSON('examples/ULTERA_sample.bson')
+                index = aD.getCompositionIndex(path)
+                self.assertTrue(os.path.isfile(path))
+                reloaded = aD.getCompositionIndex(path)
+            self.assertListEqual(reloaded.formulas, index.formulas)
+        finally:
+            shutil.rmtree(tempDir)
+
+
+if __name__ == '__main__':
+    unittest.main()
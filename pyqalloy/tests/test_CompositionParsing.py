@@ -0,0 +1,196 @@
+import unittest
+import json
+import numpy as np
+
+from pyqalloy.core import utils
+from pyqalloy.core import elements
+
+
+class TestCompositionCache(unittest.TestCase):
+    '''Test the bounded composition cache behind compStr2compList, i.e., that repeated formulas are served from the
+    cache, that the results are immutable and identical to the uncached parse, and that the size bound is respected.
+    '''
+
+    def setUp(self) -> None:
+        self.cache = utils.CompositionCache(maxSize=3)
+
+    def test_HitsAndMisses(self):
+        with self.subTest(msg='First parse is a miss'):
+            self.cache.get('Ni60 Cr20 Fe20')
+            self.assertEqual(self.cache.info()['misses'], 1)
+            self.assertEqual(self.cache.info()['hits'], 0)
+
+        with self.subTest(msg='Whitespace variants of the same formula are served from the cache'):
+            self.cache.get('Ni60  Cr20 Fe20 ')
+            self.cache.get(' Ni60 Cr20\tFe20')
+            self.assertEqual(self.cache.info()['misses'], 1)
+            self.assertEqual(self.cache.info()['hits'], 2)
+            self.assertEqual(len(self.cache), 1)
+
+        with self.subTest(msg='Unparsable formulas are cached too'):
+            self.assertFalse(self.cache.get('amorphous').valid)
+            self.assertFalse(self.cache.get('amorphous').valid)
+            self.assertEqual(self.cache.info()['hits'], 3)
+
+    def test_Eviction(self):
+        for f in ['Al0.5CoCrFeNi', 'MoNbTaW', 'HfNbTaTiZr', 'CoCrFeMnNi']:
+            self.cache.get(f)
+        with self.subTest(msg='Least recently used entry is evicted'):
+            self.assertEqual(len(self.cache), 3)
+            self.assertEqual(self.cache.info()['evictions'], 1)
+            self.cache.get('Al0.5CoCrFeNi')
+            self.assertEqual(self.cache.info()['misses'], 5)
+
+        with self.subTest(msg='Resizing evicts down to the new size'):
+            self.cache.resize(1)
+            self.assertEqual(len(self.cache), 1)
+            self.assertEqual(self.cache.info()['evictions'], 4)
+
+        with self.subTest(msg='Clearing resets the entries and counters'):
+            self.cache.clear()
+            self.assertDictEqual(
+                self.cache.info(),
+                {'size': 0, 'maxSize': 1, 'hits': 0, 'misses': 0, 'evictions': 0})
+
+    def test_ImmutableResults(self):
+        compList = utils.compStr2compList('Zr35 Ti30 Nb20 Al10 Ta5 ')
+        with self.subTest(msg='Cached composition dictionary cannot be modified'):
+            with self.assertRaises(TypeError):
+                utils.compositionCache.get('Zr35 Ti30 Nb20 Al10 Ta5 ').compList[1]['Zr'] = 1.0
+        with self.subTest(msg='Returned list is plain and modifying it does not affect the cache'):
+            self.assertIsInstance(compList, list)
+            self.assertIsInstance(compList[1], dict)
+            self.assertListEqual(compList[7], ['Al', 'Nb', 'Ta', 'Ti', 'Zr'])
+            self.assertEqual(json.loads(json.dumps(compList)), compList)
+            compList[1]['Zr'] = 1.0
+            compList[7].append('Fe')
+            compList[0] = 'modified'
+            self.assertEqual(utils.compStr2compList('Zr35 Ti30 Nb20 Al10 Ta5 ')[1]['Zr'], 0.35)
+            self.assertEqual(utils.compStr2compList('Zr35 Ti30 Nb20 Al10 Ta5 ')[7], ['Al', 'Nb', 'Ta', 'Ti', 'Zr'])
+            compList = utils.compStr2compList('Zr35 Ti30 Nb20 Al10 Ta5 ')
+        with self.subTest(msg='Values match the reference parse'):
+            self.assertEqual(compList[0], 'Zr7 Ti6 Ta1 Nb4 Al2')
+            self.assertDictEqual(dict(compList[1]), {'Zr': 0.35, 'Ti': 0.3, 'Nb': 0.2, 'Al': 0.1, 'Ta': 0.05})
+            self.assertEqual(compList[2], 'Zr35 Ti30 Ta5 Nb20 Al10')
+            self.assertEqual(compList[3], 'Zr7 Ti6 Ta1 Nb4 Al2')
+            self.assertEqual(compList[8], 5)
+        with self.subTest(msg='Entries built from the cached result are plain, mutable objects'):
+            entry = utils.datapoint2entry({}, {'Composition': 'Zr35 Ti30 Nb20 Al10 Ta5 '}, printOuts=False)
+            self.assertIsInstance(entry['material']['compositionDictionary'], dict)
+            self.assertIsInstance(entry['material']['elements'], list)
+
+    def test_PhaseNamesNotCached(self):
+        before = utils.compositionCache.info()
+        phases = utils.structStr2list('BCC+2fcc_a1+Laves+B2+NbCr2')[0]
+        self.assertListEqual(phases, ['B2', 'BCC', 'NbCr2', 'fcc_a1', 'fcc_a1', 'laves'])
+        self.assertDictEqual(utils.compositionCache.info(), before)
+
+    def test_UnparsableRaises(self):
+        with self.assertRaises(ValueError):
+            utils.compStr2compList('amorphous')
+        with self.assertRaises(ValueError):
+            utils.compStr2compList('amorphous')
+
+
+class TestNativeTokenizer(unittest.TestCase):
+    '''Test the native formula tokenizer by comparing all of its outputs against the pymatgen-based parsing and by
+    checking that exotic formulas are passed to pymatgen.'''
+
+    def test_ParsingPath(self):
+        for f in ['Al0.5CoCrFeNi', 'Ni60 Cr20 Fe20', 'Zr Nb Ta Hf0.2 Cr1', 'MoNbTaW', 'Ti.5Zr']:
+            with self.subTest(msg=f):
+                self.assertEqual(utils.compStrParsingPath(f), 'native')
+        for f in ['(FeNi)2Cr', 'CuSO4·5H2O', 'Fe1e-2Ni', 'Fe0Ni', 'O2', 'amorphous', 'D2O']:
+            with self.subTest(msg=f):
+                self.assertEqual(utils.compStrParsingPath(f), 'pymatgen')
+
+    def test_MatchesPymatgen(self):
+        formulas = [
+            'Al0.5CoCrFeNi', 'Ni60 Cr20 Fe20', 'Ti30 Zr30 Hf16 Nb24', 'Zr Nb Ta Hf0.2 Cr1', 'Zr35 Ti30 Nb20 Al10 Ta5',
+            'Co23Cr23Fe23Ni23Mo7', 'Al16Co16Cr16Fe16Ni34.4', 'Mo2 Cr24.5 Fe24.5 Co24.5 Ni24.5', 'Fe2O3', 'LiFePO4',
+            'Ni48Ti52', 'NbMoTaWV0.25', 'Al0.3CrFe1.5MnNi0.5', 'FeFeNi', 'Ni3Al', 'Co 1.5 Cr Fe Ni Ti0.5', 'H2']
+        for f in formulas:
+            with self.subTest(msg=f):
+                native = utils._nativeParseComposition(f)
+                reference = utils._parseComposition(f)
+                if native is None:
+                    continue
+                self.assertEqual(native.valid, reference.valid)
+                self.assertTupleEqual(native.compList[2:], reference.compList[2:])
+                self.assertEqual(native.compList[0], reference.compList[0])
+                self.assertListEqual(list(native.compList[1].items()), list(reference.compList[1].items()))
+                self.assertListEqual(list(native.amounts.items()), list(reference.amounts.items()))
+
+    def test_DisabledNativeParsing(self):
+        cache = utils.CompositionCache(nativeParsing=False)
+        self.assertEqual(cache.get('Al0.5CoCrFeNi').path, 'pymatgen')
+
+
+class TestBatchParsing(unittest.TestCase):
+    '''Test the compStrs2fracMatrix batch parser against the per-formula compStr2compList results.'''
+
+    def setUp(self) -> None:
+        self.formulas = ['Al0.5CoCrFeNi', 'MoNbTaW', 'amorphous', 'Ni60 Cr20 Fe20', 'MoNbTaW', 'Al0.5CoCrFeNi']
+
+    def test_MatrixMatchesSingleParse(self):
+        matrix, elements, errors = utils.compStrs2fracMatrix(self.formulas)
+        with self.subTest(msg='Shapes'):
+            self.assertEqual(matrix.shape, (6, len(elements)))
+            self.assertEqual(errors.shape, (6,))
+        with self.subTest(msg='Error flags'):
+            self.assertListEqual(errors.tolist(), [False, False, True, False, False, False])
+            self.assertTrue(np.all(matrix[2] == 0))
+        for i, f in enumerate(self.formulas):
+            if not errors[i]:
+                with self.subTest(msg=f'Row {i} ({f})'):
+                    cd = utils.compStr2compList(f)[1]
+                    self.assertListEqual(matrix[i].tolist(), [cd[el] if el in cd else 0 for el in elements])
+
+    def test_FixedElements(self):
+        matrix, elements, errors = utils.compStrs2fracMatrix(['Ni60 Cr20 Fe20', 'MoNbTaW'], elements=['Fe', 'Ni', 'Cr', 'Co'])
+        self.assertListEqual(elements, ['Fe', 'Ni', 'Cr', 'Co'])
+        self.assertListEqual(matrix[0].tolist(), [0.2, 0.6, 0.2, 0.0])
+        with self.subTest(msg='Elements outside of the index are flagged'):
+            self.assertListEqual(errors.tolist(), [False, True])
+
+    def test_Empty(self):
+        matrix, elements, errors = utils.compStrs2fracMatrix([])
+        self.assertEqual(matrix.shape, (0, 0))
+        self.assertEqual(len(errors), 0)
+
+
+class TestElementRegistry(unittest.TestCase):
+    '''Test the shared element registry, i.e., its stable layout, runtime extension, and the precomputed IUPAC ranks.'''
+
+    def test_Layout(self):
+        registry = elements.ElementRegistry()
+        with self.subTest(msg='Layout starts with the ULTERA V1 composition vector order'):
+            self.assertTupleEqual(registry.elements[:57], elements.ULTERA_V1_ELEMENTS)
+            self.assertEqual(registry.index('Ni'), 0)
+        with self.subTest(msg='Layout covers all elements'):
+            self.assertEqual(len(registry), 118)
+            self.assertSetEqual(set(registry.elements), set(elements.ELEMENTS_BY_Z))
+        with self.subTest(msg='Ordering does not depend on the input order'):
+            self.assertListEqual(registry.order(['Fe', 'Ni', 'H', 'Cr']), ['Ni', 'Cr', 'Fe', 'H'])
+            self.assertListEqual(registry.order({'H', 'Cr', 'Ni', 'Fe'}), ['Ni', 'Cr', 'Fe', 'H'])
+
+    def test_RuntimeExtension(self):
+        registry = elements.ElementRegistry()
+        registry.register(['D', 'Ni'])
+        self.assertEqual(registry.index('D'), 118)
+        self.assertEqual(registry.index('T'), 119)
+        self.assertEqual(registry.index('Ni'), 0)
+
+    def test_IUPACRanks(self):
+        from pymatgen.core.periodic_table import get_el_sp
+        for el in ['Ni', 'Co', 'Hf', 'Ta', 'B', 'C', 'La', 'U']:
+            with self.subTest(msg=el):
+                self.assertEqual(elements.iupacRank(el), get_el_sp(el).iupac_ordering)
+
+    def test_BatchParsingLayout(self):
+        _, els, _ = utils.compStrs2fracMatrix(['MoNbTaW', 'Al0.5CoCrFeNi'])
+        self.assertListEqual(els, ['Ni', 'Co', 'Cr', 'Fe', 'Al', 'Mo', 'Nb', 'W', 'Ta'])
+
+
+if __name__ == '__main__':
+    unittest.main()
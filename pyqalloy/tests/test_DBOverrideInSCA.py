@@ -1,8 +1,17 @@
 import unittest
+import os
+import pickle
+import shutil
+import tempfile
+import zipfile
+import datetime
+from io import BytesIO
+from unittest import mock
 from pyqalloy.curation import analysis
 from montydb import MontyClient
 from montydb.types.bson import init as init_bson
 import bson
+import numpy as np
 
 referenceResultPrintOuts = [
     'DOI: 10.1016/j.actamat.2016.06.063\nF:   Mo7 Cr23 Fe23 Co23 Ni23\n'
@@ -28,6 +37,29 @@ referencePrintoutDOI = [
     "0.1006    |  1.0        <-- F: Mo7 Cr23 Fe23 Co23 Ni23 | PF: Mo7.1 Cr23.2 Fe23.2 Co23.2 Ni23.2 | Raw: Co23Cr23Fe23Ni23Mo7 | RF: Mo1 Cr3.29 Fe3.29 Co3.29 Ni3.29"
 ]
 
+class _FakeKaleido:
+    '''Stand-in for the Kaleido renderer (which requires a Chrome installation) recording the rendering calls and
+    returning blank PNG images of the requested size.'''
+    instances = []
+
+    def __init__(self, n: int = 1, **kwargs):
+        self.calls = []
+        _FakeKaleido.instances.append(self)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def calc_fig(self, fig, opts=None, **kwargs):
+        from PIL import Image
+        self.calls.append(opts)
+        image = BytesIO()
+        Image.new('RGB', (int(opts['width'] * opts['scale']), int(opts['height'] * opts['scale']))).save(image, 'png')
+        return image.getvalue()
+
+
 class TestSCADA(unittest.TestCase):
     '''Test the SingleCompositionAnalyzer class in the curation module with the custom collection of ULTERA samples.
     '''
@@ -128,10 +160,299 @@ class TestSDOIADA(unittest.TestCase):
                 self.assertIn(line, self.sD.printLog, msg=f'Expected printout line {i} not in the reference')
         
 
+    def test_analyzeAllDOIs(self):
+        records = self.sD.analyzeAllDOIs()
+        with self.subTest(msg='One record per DOI in the get_allDOIs order'):
+            self.assertListEqual([r['doi'] for r in records], self.sD.get_allDOIs())
+        with self.subTest(msg='Analyzer state is not modified'):
+            self.assertIsNone(self.sD.doi)
+            self.assertListEqual(self.sD.nn_distances, [])
+
+        for record in records[:40] + [r for r in records if r['doi'] == '10.1016/j.actamat.2016.06.063']:
+            with self.subTest(msg=f'Matches analyze_nnDistances for {record["doi"]}'):
+                self.sD.setDOI(record['doi'])
+                self.sD.analyze_nnDistances()
+                self.assertListEqual(record['formulas'], self.sD.formulas)
+                self.assertListEqual(record['fStrings'], self.sD.fStrings)
+                self.assertListEqual(record['els'], self.sD.els)
+                self.assertListEqual(record['pointers'], sorted(self.sD.pointers))
+                self.assertListEqual(record['names'], sorted(self.sD.names))
+                self.assertEqual(record['nDatapoints'], self.customCollection.count_documents({'reference.doi': record['doi']}))
+                np.testing.assert_allclose(record['nnDistances'], self.sD.nn_distances)
+
+        with self.subTest(msg='Name and DOI filters'):
+            self.sD.setName('Adam Krajewski')
+            self.assertEqual(len(self.sD.analyzeAllDOIs()), 107)
+            records = self.sD.analyzeAllDOIs(dois=['10.1016/j.actamat.2016.06.063'])
+            self.assertEqual(len(records), 1)
+            self.assertAlmostEqual(records[0]['nnDistances'][0], 0.1006, places=4)
+
+    def test_analyzeDOIsParallel(self):
+        dois = self.sD.get_allDOIs()[:30]
+        # The minimum number of samples for the PCA figures is set high to skip the rendering
+        options = {'nnOptions': {'minSamples': 3}, 'pcaOptions': {'minSamples': 10000}}
+        serial = self.sD.analyzeDOIsParallel(dois=dois, workers=1, **options)
+        parallel = self.sD.analyzeDOIsParallel(dois=dois, workers=2, printOut=False, **options)
+
+        with self.subTest(msg='Results gathered in the DOI order'):
+            self.assertListEqual([r['doi'] for r in parallel], dois)
+            self.assertTrue(all(r['error'] is None for r in parallel))
+
+        with self.subTest(msg='Results do not depend on the number of workers'):
+            for key in ['formulas', 'printLog', 'printOut', 'compVecs_2DPCA']:
+                self.assertListEqual([r[key] for r in parallel], [r[key] for r in serial])
+
+        with self.subTest(msg='Results match the serial pipeline on a single analyzer'):
+            for record in parallel:
+                self.sD.setDOI(record['doi'])
+                self.sD.analyze_nnDistances()
+                self.sD.print_nnDistances(minSamples=3, printOut=False)
+                self.sD.get_compVecs_2DPCA()
+                self.sD.analyze_compVecs_2DPCA(minSamples=10000, showFigure=False, printOut=False)
+                self.assertEqual(record['printLog'], self.sD.printLog)
+                np.testing.assert_allclose(record['nnDistances'], self.sD.nn_distances)
+
+        with self.subTest(msg='Failed DOIs are reported'):
+            records = self.sD.analyzeDOIsParallel(dois=['10.0000/missing'], workers=1, pca=False, printOut=False)
+            self.assertIsNotNone(records[0]['error'])
+
+    def test_deferredRendering(self):
+        self.sD.setDOI('10.1016/j.actamat.2021.116800')
+        self.sD.get_compVecs_2DPCA()
+        spec = self.sD.analyze_compVecs_2DPCA(showFigure=False, render=False, printOut=False)
+
+        with self.subTest(msg='Figure specification instead of the rendered image'):
+            self.assertIsInstance(spec, analysis.FigureSpec)
+            self.assertIs(self.sD.compVecs_2DPCA_figure, spec)
+            self.assertIsNone(self.sD.compVecs_2DPCA_plot)
+            self.assertEqual(spec.name, '10.1016/j.actamat.2021.116800')
+            self.assertEqual(len(spec.x), len(self.sD.formulas))
+
+        with self.subTest(msg='Specification is picklable and builds the figure'):
+            fig = pickle.loads(pickle.dumps(spec)).toFigure()
+            self.assertIn('10.1016/j.actamat.2021.116800', fig.layout.title.text)
+            self.assertEqual(fig.layout.width, spec.width)
+            self.assertEqual(sum(len(trace.x) for trace in fig.data), len(self.sD.formulas))
+
+        with self.subTest(msg='Batch rendering at the resolution of the workbook'):
+            _FakeKaleido.instances.clear()
+            tempDir = tempfile.mkdtemp()
+            try:
+                with mock.patch('kaleido.Kaleido', _FakeKaleido):
+                    self.sD.writeManyPlots([spec, 'Skipped DOI', spec], os.path.join(tempDir, 'report.xlsx'), printOut=False)
+                self.assertEqual(len(_FakeKaleido.instances), 1)
+                self.assertListEqual([opts['scale'] for opts in _FakeKaleido.instances[0].calls], [1, 1])
+                self.assertListEqual([opts['width'] for opts in _FakeKaleido.instances[0].calls], [spec.width] * 2)
+                with zipfile.ZipFile(os.path.join(tempDir, 'report.xlsx')) as report:
+                    self.assertEqual(len([f for f in report.namelist() if f.startswith('xl/media/')]), 1)
+            finally:
+                shutil.rmtree(tempDir)
+
+    def test_reportWriter(self):
+        from PIL import Image
+        import openpyxl
+        import tracemalloc
+
+        self.sD.setDOI('10.1016/j.actamat.2021.116800')
+        self.sD.get_compVecs_2DPCA()
+        spec = self.sD.analyze_compVecs_2DPCA(showFigure=False, render=False, printOut=False)
+        rng = np.random.default_rng(0)
+
+        def noisePNG():
+            image = BytesIO()
+            Image.fromarray(rng.integers(0, 255, (150, 150, 3), dtype=np.uint8)).save(image, 'png')
+            return image
+
+        tempDir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tempDir, 'report.xlsx')
+            with self.subTest(msg='Memory stays bounded while adding many plots'):
+                images = (noisePNG() for _ in range(100))
+                with mock.patch('kaleido.Kaleido', _FakeKaleido):
+                    with analysis.ReportWriter(path, printOut=False) as report:
+                        report.addText('Skipped DOI')
+                        report.addPlot(spec)
+                        tracemalloc.start()
+                        for i, image in enumerate(images):
+                            report.addPlot(image, label=f'doi-{i}')
+                        _, peak = tracemalloc.get_traced_memory()
+                        tracemalloc.stop()
+                totalSize = 100 * len(noisePNG().getvalue())
+                self.assertLess(peak, totalSize / 3)
+
+            with self.subTest(msg='All plots are written in order with their labels'):
+                with zipfile.ZipFile(path) as workbook:
+                    self.assertEqual(len([f for f in workbook.namelist() if f.startswith('xl/media/')]), 101)
+                worksheet = openpyxl.load_workbook(path).active
+                self.assertEqual(worksheet['A1'].value, 'Skipped DOI')
+                self.assertEqual(worksheet['A2'].value, '10.1016/j.actamat.2021.116800')
+                self.assertEqual(worksheet['A24'].value, 'doi-0')
+                self.assertEqual(worksheet['A46'].value, 'doi-1')
+        finally:
+            shutil.rmtree(tempDir)
+
     def tearDown(self):
         del self.sD
         self.customCollection.drop()
         pass
 
+class _RecordingCollection:
+    '''Wraps a MontyDB collection, recording the projections of all queries and the encoded size of all the returned
+    documents, i.e., the volume which would be transferred and decoded from a remote database.'''
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.projections = []
+        self.transferredBytes = 0
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def _record(self, doc):
+        if doc is not None:
+            self.transferredBytes += len(bson.encode(doc))
+        return doc
+
+    def find(self, *args, **kwargs):
+        self.projections.append(args[1] if len(args) > 1 else kwargs.get('projection'))
+        recording = self
+
+        class Cursor:
+            def __init__(self, cursor):
+                self.cursor = cursor
+
+            def sort(self, *a):
+                return Cursor(self.cursor.sort(*a))
+
+            def limit(self, *a):
+                return Cursor(self.cursor.limit(*a))
+
+            def __iter__(self):
+                return (recording._record(doc) for doc in self.cursor)
+
+        return Cursor(self.collection.find(*args, **kwargs))
+
+    def find_one(self, *args, **kwargs):
+        self.projections.append(args[1] if len(args) > 1 else kwargs.get('projection'))
+        return self._record(self.collection.find_one(*args, **kwargs))
+
+
+class TestProjectedFetch(unittest.TestCase):
+    '''Test that the analyzers only request the fields they need from the collection, and that the results are the
+    same as the reference ones.
+    '''
+
+    def setUp(self) -> None:
+        init_bson(use_bson=True)
+        self.montyCollection = MontyClient(":memory:").projectedFetch.test
+        with open('examples/ULTERA_sample.bson', 'rb') as f:
+            documents = bson.decode_all(f.read())
+        self.montyCollection.insert_many(documents)
+        self.fullBytes = sum(len(bson.encode(doc)) for doc in documents)
+        self.customCollection = _RecordingCollection(self.montyCollection)
+
+    def assertProjected(self):
+        self.assertGreater(len(self.customCollection.projections), 0)
+        for projection in self.customCollection.projections:
+            self.assertIsNotNone(projection, msg='Query without a projection')
+
+    def test_SingleDOIAnalyzer(self):
+        sD = analysis.SingleDOIAnalyzer(collectionManualOverride=self.customCollection)
+        sD.get_allDOIs()
+        sD.setDOI('10.1016/j.actamat.2016.06.063')
+        sD.analyze_nnDistances()
+        sD.print_nnDistances(printOut=False)
+        for i, line in enumerate(referencePrintoutDOI):
+            with self.subTest(msg=f'Test {i}th line'):
+                self.assertIn(line, sD.printLog)
+        self.assertProjected()
+
+    def test_SingleCompositionAnalyzer(self):
+        sC = analysis.SingleCompositionAnalyzer(collectionManualOverride=self.customCollection)
+        sC.scanCompositionsAround100(resultLimit=10, uncertainty=0.5)
+        self.assertListEqual(sC.printOuts, referenceResultPrintOuts)
+        self.assertProjected()
+
+    def test_AllDataAnalyzer(self):
+        aD = analysis.AllDataAnalyzer(collectionManualOverride=self.customCollection)
+        self.assertEqual(aD.allCompsMatrix.shape, (169, 27))
+        with self.subTest(msg='Transferred volume is reduced by over an order of magnitude'):
+            self.assertProjected()
+            self.assertLess(self.customCollection.transferredBytes, self.fullBytes / 10)
+
+        with self.subTest(msg='Outlier data sources'):
+            aD.getDBSCAN(eps=0.05)
+            aD.updateOutliersList()
+            sources = aD.findOutlierDataSources()
+            self.assertEqual(len(sources), len(aD.outliers))
+            self.assertListEqual(sorted(sources[0]), ['_id', 'material', 'meta', 'reference'])
+            self.assertProjected()
+
+    def tearDown(self) -> None:
+        self.montyCollection.drop()
+
+
+class TestIncrementalAllComps(unittest.TestCase):
+    '''Test the incremental updateAllComps of the AllDataAnalyzer against a full update of a new analyzer after new and
+    changed documents are uploaded to the collection.
+    '''
+
+    def setUp(self) -> None:
+        init_bson(use_bson=True)
+        self.montyCollection = MontyClient(":memory:").incrementalAllComps.test
+        with open('examples/ULTERA_sample.bson', 'rb') as f:
+            self.montyCollection.insert_many(bson.decode_all(f.read()))
+        self.aD = analysis.AllDataAnalyzer(collectionManualOverride=self.montyCollection)
+
+    def upload(self, formula: str, nComponents: int, timeStamp: datetime.datetime, _id=None) -> None:
+        self.montyCollection.insert_one({
+            '_id': bson.ObjectId() if _id is None else _id,
+            'material': {'relationalFormula': formula, 'nComponents': nComponents},
+            'meta': {'name': 'New Contributor', 'timeStamp': timeStamp},
+            'reference': {'doi': '10.0000/incremental'}})
+
+    def test_IncrementalUpdate(self):
+        knownFormula = self.aD.allComps[0]['formula']
+        self.aD.getDBSCAN(eps=0.05)
+        with self.subTest(msg='Nothing new keeps all the results'):
+            self.aD.updateAllComps(incremental=True)
+            self.assertEqual(self.aD.allCompsMatrix.shape, (169, 27))
+            self.assertIsNotNone(self.aD.neighborGraph)
+            self.assertIn('dbscanCluster', self.aD.allComps[0])
+
+        timeStamp = datetime.datetime(2030, 1, 1)
+        self.upload('Fe1 Ni1 Co1 Cr1 Pd1', 5, timeStamp)
+        self.upload('Pt1 Pd1 Ni1', 3, timeStamp)
+        self.upload(knownFormula, 5, timeStamp)
+        self.upload('Au1 Ni1', 2, timeStamp)
+        with self.subTest(msg='New formulas and elements are appended'):
+            self.aD.updateAllComps(incremental=True)
+            self.assertEqual(self.aD.allCompsMatrix.shape, (171, 29))
+            self.assertListEqual(self.aD.els[-2:], ['Pd', 'Pt'])
+            self.assertListEqual(self.aD.allCompsMatrix[:169, 27:].tolist(), [[0, 0]] * 169)
+            self.assertListEqual(self.aD.allCompsMatrix.tolist(), [c['compVec'] for c in self.aD.allComps])
+            self.assertIsNone(self.aD.neighborGraph)
+            self.assertNotIn('dbscanCluster', self.aD.allComps[0])
+
+        with self.subTest(msg='Changed documents with a bumped timestamp are picked up'):
+            changed = self.montyCollection.find_one({'material.relationalFormula': knownFormula})
+            self.montyCollection.update_one({'_id': changed['_id']}, {'$set': {
+                'material.relationalFormula': 'Cr1 Mo1 W1', 'meta.timeStamp': datetime.datetime(2030, 1, 2)}})
+            self.aD.updateAllComps(incremental=True)
+            self.assertEqual(self.aD.allComps[-1]['formula'], 'Cr1 Mo1 W1')
+
+        with self.subTest(msg='Same compositions and clustering as a full update up to the element order'):
+            full = analysis.AllDataAnalyzer(collectionManualOverride=self.montyCollection)
+            incrementalFormulas = [c['formula'] for c in self.aD.allComps]
+            # Formulas no longer in the database would only be dropped by a full update, but the changed one is uploaded twice
+            self.assertSetEqual(set(incrementalFormulas), {c['formula'] for c in full.allComps})
+            rows = [incrementalFormulas.index(c['formula']) for c in full.allComps]
+            columns = [self.aD.els.index(el) for el in full.els]
+            np.testing.assert_array_equal(self.aD.allCompsMatrix[np.ix_(rows, columns)], full.allCompsMatrix)
+
+    def tearDown(self) -> None:
+        self.montyCollection.drop()
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
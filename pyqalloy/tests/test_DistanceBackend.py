@@ -0,0 +1,167 @@
+import unittest
+from io import StringIO
+from unittest import mock
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from pyqalloy.curation import analysis
+from pyqalloy.curation.distances import DistanceBackend, distanceBackend, filterRadiusGraph
+
+
+class TestDistanceBackend(unittest.TestCase):
+    '''Test that all the algorithms of the distance backend give the same results as the scikit-learn reference, so that
+    the automatic selection only affects the speed.
+    '''
+
+    def setUp(self) -> None:
+        rng = np.random.default_rng(0)
+        compVecs = rng.dirichlet(np.ones(5), size=200)
+        # Duplicated compositions have to give zero nearest neighbor distances with every algorithm
+        self.compVecs = np.vstack([compVecs, compVecs[:10]])
+
+    def test_Selection(self):
+        backend = DistanceBackend()
+        self.assertEqual(backend.select(5, 5), 'brute')
+        self.assertEqual(backend.select(5000, 5), 'kd_tree')
+        self.assertEqual(backend.select(5000, 27), 'brute')
+        self.assertEqual(backend.select(50000, 27), 'ball_tree')
+        self.assertEqual(backend.select(5, 5, 'ball_tree'), 'ball_tree')
+        self.assertEqual(DistanceBackend(algorithm='kd_tree').select(5, 27), 'kd_tree')
+
+    def test_nnDistances(self):
+        from sklearn.neighbors import NearestNeighbors
+        for p in [1, 2, 3]:
+            reference = NearestNeighbors(n_neighbors=2, p=p).fit(self.compVecs).kneighbors(self.compVecs)[0][:, 1]
+            self.assertListEqual(reference[-10:].tolist(), [0] * 10)
+            for algorithm in ['brute', 'kd_tree', 'ball_tree']:
+                for maxBlockElements in [1, 1000, 2**22]:
+                    with self.subTest(msg=f'p={p}, algorithm={algorithm}, maxBlockElements={maxBlockElements}'):
+                        backend = DistanceBackend(algorithm=algorithm, maxBlockElements=maxBlockElements)
+                        np.testing.assert_allclose(backend.nnDistances(self.compVecs, p=p), reference, atol=1e-12)
+                        self.assertEqual(backend.lastAlgorithm, algorithm)
+        self.assertListEqual(distanceBackend.nnDistances(self.compVecs[:1]).tolist(), [0])
+
+    def test_radiusGraph(self):
+        from scipy.spatial.distance import cdist
+        for p, eps in [(1, 0.1), (2, 0.05)]:
+            reference = cdist(self.compVecs, self.compVecs, 'minkowski', p=p)
+            for algorithm in ['brute', 'kd_tree', 'ball_tree']:
+                with self.subTest(msg=f'p={p}, algorithm={algorithm}'):
+                    graph = DistanceBackend(maxBlockElements=1000).radiusGraph(
+                        self.compVecs, eps=eps, p=p, algorithm=algorithm).tocoo()
+                    self.assertSetEqual(set(zip(graph.row.tolist(), graph.col.tolist())),
+                                        set(zip(*map(np.ndarray.tolist, np.nonzero(reference <= eps)))))
+                    np.testing.assert_allclose(graph.data, reference[graph.row, graph.col], atol=1e-12)
+
+    def test_noiseThresholds(self):
+        from sklearn.cluster import DBSCAN
+        for min_samples in [2, 3]:
+            thresholds = distanceBackend.noiseThresholds(self.compVecs, min_samples=min_samples, p=2)
+            for algorithm in ['kd_tree', 'ball_tree']:
+                with self.subTest(msg=f'min_samples={min_samples}, algorithm={algorithm}'):
+                    np.testing.assert_allclose(DistanceBackend(algorithm=algorithm).noiseThresholds(
+                        self.compVecs, min_samples=min_samples, p=2), thresholds, atol=1e-12)
+            for eps in [0.02, 0.05, 0.1]:
+                with self.subTest(msg=f'min_samples={min_samples}, eps={eps}'):
+                    labels = DBSCAN(eps=eps, min_samples=min_samples).fit_predict(self.compVecs)
+                    self.assertListEqual((labels == -1).tolist(), (thresholds > eps).tolist())
+        self.assertTrue(np.isinf(distanceBackend.noiseThresholds(self.compVecs[:2], min_samples=3)).all())
+
+    def test_filterRadiusGraph(self):
+        graph = distanceBackend.radiusGraph(self.compVecs, eps=0.1)
+        for eps in [0, 0.02, 0.05, 0.1]:
+            with self.subTest(msg=f'eps={eps}'):
+                filtered = filterRadiusGraph(graph, eps)
+                reference = distanceBackend.radiusGraph(self.compVecs, eps=eps)
+                self.assertEqual(filtered.nnz, reference.nnz)
+                self.assertEqual(abs(filtered - reference).max(), 0)
+
+    def test_benchmark(self):
+        times = distanceBackend.benchmark(self.compVecs, repeats=1)
+        self.assertListEqual(list(times), ['brute', 'kd_tree', 'ball_tree', 'selected'])
+        self.assertEqual(times['selected'], 'brute')
+
+    def test_DBSCANMatchesScikitLearn(self):
+        from sklearn.cluster import DBSCAN
+        with redirect_stdout(StringIO()):
+            aD = analysis.AllDataAnalyzer.fromBSON('examples/ULTERA_sample.bson')
+        for eps in [0.05, 0.3]:
+            reference = DBSCAN(eps=eps, min_samples=2).fit_predict(aD.allCompsMatrix)
+            for algorithm in [None, 'brute', 'kd_tree', 'ball_tree']:
+                with self.subTest(msg=f'eps={eps}, algorithm={algorithm}'):
+                    # Drop the cached neighbor graph, so that it is rebuilt with the algorithm
+                    aD.neighborGraph = None
+                    with redirect_stdout(StringIO()):
+                        clusters, outlierN = aD.getDBSCAN(eps=eps, algorithm=algorithm)
+                    self.assertListEqual(clusters.tolist(), reference.tolist())
+                    self.assertEqual(outlierN, int((reference == -1).sum()))
+
+    def test_DBSCANNeighborGraphCache(self):
+        from sklearn.cluster import DBSCAN
+        with redirect_stdout(StringIO()):
+            aD = analysis.AllDataAnalyzer.fromBSON('examples/ULTERA_sample.bson')
+        with mock.patch.object(distanceBackend, 'radiusGraph', wraps=distanceBackend.radiusGraph) as radiusGraph:
+            with self.subTest(msg='The graph covers only the requested eps'):
+                with redirect_stdout(StringIO()):
+                    aD.getDBSCAN(eps=0.05)
+                self.assertEqual(radiusGraph.call_count, 1)
+                self.assertEqual(aD.neighborGraphEps, 0.05)
+
+            with self.subTest(msg='Larger eps grows the graph, which is reused for any smaller eps'):
+                for eps, min_samples in [(0.3, 2), (0.05, 2), (0.01, 3), (0.1, 4), (0.3, 2)]:
+                    with redirect_stdout(StringIO()):
+                        clusters, _ = aD.getDBSCAN(eps=eps, min_samples=min_samples)
+                    reference = DBSCAN(eps=eps, min_samples=min_samples).fit_predict(aD.allCompsMatrix)
+                    self.assertListEqual(clusters.tolist(), reference.tolist())
+                self.assertEqual(radiusGraph.call_count, 2)
+                self.assertEqual(aD.neighborGraphEps, 0.3)
+
+            with self.subTest(msg='Updating the compositions invalidates the graph'):
+                with redirect_stdout(StringIO()):
+                    aD.updateAllComps()
+                self.assertIsNone(aD.neighborGraph)
+                with redirect_stdout(StringIO()):
+                    aD.getDBSCAN(eps=0.05)
+                self.assertEqual(radiusGraph.call_count, 3)
+
+            with self.subTest(msg='The minimum radius of the graph is opt-in'):
+                aD.neighborGraph = None
+                aD.neighborGraphRadius = 0.3
+                with redirect_stdout(StringIO()):
+                    aD.getDBSCAN(eps=0.05)
+                    clusters, _ = aD.getDBSCAN(eps=0.25)
+                self.assertListEqual(clusters.tolist(), DBSCAN(eps=0.25, min_samples=2).fit_predict(aD.allCompsMatrix).tolist())
+                self.assertEqual(radiusGraph.call_count, 4)
+                self.assertEqual(aD.neighborGraphEps, 0.3)
+
+    def test_DBSCANpDeprecated(self):
+        with redirect_stdout(StringIO()):
+            aD = analysis.AllDataAnalyzer.fromBSON('examples/ULTERA_sample.bson')
+            with self.assertWarns(DeprecationWarning):
+                clusters, _ = aD.getDBSCAN(eps=0.05, p=1)
+            reference, _ = aD.getDBSCAN(eps=0.05)
+        self.assertListEqual(clusters.tolist(), reference.tolist())
+
+    def test_DBSCANautoEpsilon(self):
+        from sklearn.cluster import DBSCAN
+        with redirect_stdout(StringIO()):
+            aD = analysis.AllDataAnalyzer.fromBSON('examples/ULTERA_sample.bson')
+        for min_samples in [2, 3]:
+            for outlierTargetN in [1, 5, 20, 100]:
+                with self.subTest(msg=f'min_samples={min_samples}, outlierTargetN={outlierTargetN}'):
+                    printOut = StringIO()
+                    with redirect_stdout(printOut):
+                        clusters, outlierN = aD.getDBSCANautoEpsilon(outlierTargetN, min_samples=min_samples)
+                    self.assertEqual(printOut.getvalue().count('Running DBSCAN'), 1)
+                    self.assertGreaterEqual(outlierN, outlierTargetN)
+                    eps = np.sort(aD.dbscanNoiseThresholds[min_samples])[::-1][outlierTargetN - 1]
+                    # The same labels as a plain DBSCAN fit just below the selected threshold and fewer outliers above it
+                    reference = DBSCAN(eps=eps * (1 - 1e-7), min_samples=min_samples).fit_predict(aD.allCompsMatrix)
+                    self.assertListEqual(clusters.tolist(), reference.tolist())
+                    above = DBSCAN(eps=eps * (1 + 1e-7), min_samples=min_samples).fit_predict(aD.allCompsMatrix)
+                    self.assertLess(int((above == -1).sum()), outlierTargetN)
+
+
+if __name__ == '__main__':
+    unittest.main()
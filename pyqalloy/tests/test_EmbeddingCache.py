@@ -0,0 +1,118 @@
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from contextlib import redirect_stdout
+from unittest import mock
+
+import numpy as np
+
+from pyqalloy.curation import analysis
+from pyqalloy.curation.store import EmbeddingCache
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    '''Test the on-disk embedding cache, i.e., its keys, the LRU eviction above the size cap, and the reuse of the TSNE
+    embeddings of the AllDataAnalyzer across analyzer instances.
+    '''
+
+    def setUp(self) -> None:
+        self.cacheDir = tempfile.mkdtemp()
+
+    def test_Key(self):
+        matrix = np.random.default_rng(0).dirichlet(np.ones(3), size=10)
+        parameters = {'method': 'TSNE', 'perplexity': 2}
+        key = EmbeddingCache.key(matrix, ['Cr', 'Fe', 'Ni'], parameters)
+        self.assertEqual(key, EmbeddingCache.key(matrix.copy(), ['Cr', 'Fe', 'Ni'], dict(parameters)))
+        self.assertTrue(key.startswith('TSNE.'))
+        self.assertNotEqual(key, EmbeddingCache.key(matrix, ['Fe', 'Cr', 'Ni'], parameters))
+        self.assertNotEqual(key, EmbeddingCache.key(matrix, ['Cr', 'Fe', 'Ni'], {'method': 'TSNE', 'perplexity': 3}))
+        changed = matrix.copy()
+        changed[3, 1] += 1e-12
+        self.assertNotEqual(key, EmbeddingCache.key(changed, ['Cr', 'Fe', 'Ni'], parameters))
+
+    def test_LRUEviction(self):
+        embedding = np.zeros((100, 2))
+        size = len(embedding.tobytes()) + 128
+        cache = EmbeddingCache(self.cacheDir, maxBytes=3 * size)
+        for key in ['a', 'b', 'c']:
+            cache.put(key, embedding)
+            time.sleep(0.01)
+        self.assertEqual(cache.stats()['embeddings'], 3)
+        # Reading 'a' makes 'b' the least recently used one
+        self.assertIsNotNone(cache.get('a'))
+        time.sleep(0.01)
+        cache.put('d', embedding)
+        self.assertIsNone(cache.get('b'))
+        for key in ['a', 'c', 'd']:
+            self.assertIsNotNone(cache.get(key))
+        self.assertLessEqual(cache.stats()['bytes'], cache.maxBytes)
+        with self.subTest(msg='An embedding larger than the cap is kept until the next one is stored'):
+            cache.put('large', np.zeros((1000, 2)))
+            self.assertIsNotNone(cache.get('large'))
+            self.assertEqual(cache.stats()['embeddings'], 1)
+        self.assertEqual(cache.invalidate(), 1)
+        self.assertEqual(cache.stats()['embeddings'], 0)
+
+    def test_TruncatedFile(self):
+        cache = EmbeddingCache(self.cacheDir)
+        embedding = np.random.default_rng(0).normal(size=(100, 2))
+        cache.put('a', embedding)
+        self.assertListEqual(os.listdir(self.cacheDir), ['a.npy'])
+        for size in [0, 50, 500]:
+            with self.subTest(msg=f'Truncated to {size} bytes'):
+                path = os.path.join(self.cacheDir, 'a.npy')
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+                self.assertIsNone(cache.get('a'))
+                self.assertFalse(os.path.exists(path))
+                cache.put('a', embedding)
+                np.testing.assert_array_equal(cache.get('a'), embedding)
+
+        with self.subTest(msg='getTSNE recalculates a truncated embedding'):
+            with redirect_stdout(StringIO()):
+                aD = analysis.AllDataAnalyzer.fromBSON('examples/ULTERA_sample.bson', embeddingCache=self.cacheDir)
+                embedding = aD.getTSNE()
+            path = [os.path.join(self.cacheDir, f) for f in os.listdir(self.cacheDir) if f.startswith('TSNE.')][0]
+            with open(path, 'r+b') as f:
+                f.truncate(os.path.getsize(path) // 2)
+            with redirect_stdout(StringIO()):
+                np.testing.assert_allclose(aD.getTSNE(), embedding)
+            np.testing.assert_array_equal(np.load(path), aD.getTSNE())
+
+    def test_TSNEReuse(self):
+        with redirect_stdout(StringIO()):
+            aD = analysis.AllDataAnalyzer.fromBSON('examples/ULTERA_sample.bson', embeddingCache=self.cacheDir)
+            embedding = aD.getTSNE()
+        self.assertEqual(embedding.shape, (169, 2))
+        self.assertEqual(len(os.listdir(self.cacheDir)), 1)
+
+        with self.subTest(msg='Identical rerun in a new analyzer loads the embedding without TSNE'):
+            printOut = StringIO()
+            with redirect_stdout(printOut):
+                aD2 = analysis.AllDataAnalyzer.fromBSON('examples/ULTERA_sample.bson', embeddingCache=self.cacheDir)
+                with mock.patch('sklearn.manifold.TSNE', side_effect=AssertionError('TSNE should not run')):
+                    cached = aD2.getTSNE()
+            self.assertIn('Loaded the TSNE embedding from the cache.', printOut.getvalue())
+            np.testing.assert_array_equal(cached, embedding)
+            np.testing.assert_array_equal(aD2.allComps[5]['compVec_TSNE2D'], embedding[5])
+
+        with self.subTest(msg='Different parameters are calculated and cached separately'):
+            with redirect_stdout(StringIO()):
+                aD2.getTSNE(perplexity=5)
+            self.assertEqual(len(os.listdir(self.cacheDir)), 2)
+
+        with self.subTest(msg='Without the cache, the fixed random state still reproduces the embedding'):
+            with redirect_stdout(StringIO()):
+                aD3 = analysis.AllDataAnalyzer.fromBSON('examples/ULTERA_sample.bson')
+                np.testing.assert_allclose(aD3.getTSNE(), embedding)
+            self.assertIsNone(aD3.embeddingCache)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.cacheDir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import subprocess
+import sys
+import json
+
+heavyModules = ['sklearn', 'scipy', 'plotly', 'pandas', 'pymatgen', 'montydb', 'pymongo', 'requests', 'xlsxwriter',
+                'openpyxl', 'kaleido', 'pyarrow']
+
+
+def measureImport(module: str) -> dict:
+    '''Imports the module in a fresh interpreter and reports the wall time of the import (in seconds), the cumulative
+    import time reported by "-X importtime" (in seconds), and which of the heavy modules got loaded along the way.'''
+    code = (
+        'import sys, time, json\n'
+        't0 = time.perf_counter()\n'
+        f'import {module}\n'
+        't1 = time.perf_counter()\n'
+        f'print(json.dumps({{"wallTime": t1 - t0, "loaded": [m for m in {heavyModules} if m in sys.modules]}}))\n'
+    )
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    cumulative = 0
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module:
+            cumulative = int(fields[1]) / 1e6
+    report['cumulativeTime'] = cumulative
+    return report
+
+
+class TestImportTime(unittest.TestCase):
+    '''Benchmark of the import time of PyQAlloy modules guarding against regressions, i.e., against heavy dependencies
+    being imported eagerly at the module level instead of inside the functions and methods using them.'''
+
+    def test_ImportTime(self):
+        for module in ['pyqalloy', 'pyqalloy.core.utils', 'pyqalloy.core.pyqalloy', 'pyqalloy.curation.analysis']:
+            with self.subTest(msg=module):
+                report = measureImport(module)
+                print(f'{module:<30} imported in {report["wallTime"]:.3f}s (cumulative: {report["cumulativeTime"]:.3f}s)')
+                self.assertListEqual(
+                    report['loaded'], [],
+                    msg=f'Importing {module} eagerly loaded heavy dependencies: {report["loaded"]}')
+
+
+if __name__ == '__main__':
+    unittest.main()
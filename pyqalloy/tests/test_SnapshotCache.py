@@ -0,0 +1,129 @@
+import unittest
+import os
+import shutil
+import tempfile
+import datetime
+from io import StringIO
+from contextlib import redirect_stdout
+
+from pyqalloy.curation import analysis
+from pyqalloy.curation.store import SnapshotCache, BSONCollection
+from montydb import MontyClient
+from montydb.types.bson import init as init_bson
+import bson
+
+
+class TestSnapshotCache(unittest.TestCase):
+    '''Test the local snapshot cache with a MontyDB collection of ULTERA samples standing in for the remote collection, i.e.,
+    the full first download, the incremental syncs of new and changed documents, and the invalidation.
+    '''
+
+    def setUp(self) -> None:
+        init_bson(use_bson=True)
+        self.client = MontyClient(":memory:")
+        self.source = self.client.snapshotSource.test
+        with open('examples/ULTERA_sample.bson', 'rb') as f:
+            self.source.insert_many(bson.decode_all(f.read()))
+        self.cacheDir = tempfile.mkdtemp()
+        self.cache = SnapshotCache(self.cacheDir)
+
+    def sync(self) -> BSONCollection:
+        with redirect_stdout(StringIO()):
+            return self.cache.sync(self.source, 'testServer', 'snapshotSource', 'test')
+
+    def lastSync(self) -> dict:
+        return self.cache.stats()[SnapshotCache.key('testServer', 'snapshotSource', 'test')]
+
+    def test_IncrementalSync(self):
+        with self.subTest(msg='First sync downloads everything'):
+            snapshot = self.sync()
+            self.assertEqual(len(snapshot), 300)
+            self.assertTrue(self.lastSync()['lastSyncFull'])
+            self.assertEqual(self.lastSync()['lastSyncFetched'], 300)
+
+        with self.subTest(msg='Second sync fetches only the documents at the latest timestamp'):
+            snapshot = self.sync()
+            self.assertEqual(len(snapshot), 300)
+            self.assertFalse(self.lastSync()['lastSyncFull'])
+            latest = next(self.source.find({}, {'meta.timeStamp': 1}).sort('meta.timeStamp', -1).limit(1))['meta']['timeStamp']
+            self.atLatest = self.source.count_documents({'meta.timeStamp': latest})
+            self.assertEqual(self.lastSync()['lastSyncFetched'], self.atLatest)
+            self.assertLess(self.atLatest, 300)
+            self.assertEqual(self.lastSync()['lastSyncAdded'], 0)
+            self.assertEqual(self.lastSync()['lastSyncReplaced'], 0)
+
+        with self.subTest(msg='New and changed documents are merged and become the latest'):
+            newTimeStamp = datetime.datetime(2030, 1, 1)
+            newDoc = {'_id': bson.ObjectId(), 'meta': {'name': 'New Contributor', 'timeStamp': newTimeStamp},
+                      'material': {'formula': 'Ni50 Cr50'}, 'reference': {'doi': '10.0000/new'}}
+            self.source.insert_one(newDoc)
+            changedId = bson.ObjectId('635997c429377cf4308b62b0')
+            self.source.update_one({'_id': changedId}, {'$set': {'meta.timeStamp': newTimeStamp, 'reference.doi': '10.0000/fixed'}})
+            snapshot = self.sync()
+            self.assertEqual(len(snapshot), 301)
+            self.assertEqual(self.lastSync()['lastSyncFetched'], self.atLatest + 2)
+            self.assertEqual(self.lastSync()['lastSyncAdded'], 1)
+            self.assertEqual(self.lastSync()['lastSyncReplaced'], 1)
+            self.assertEqual(snapshot.find_one({'_id': changedId})['reference']['doi'], '10.0000/fixed')
+
+        with self.subTest(msg='Snapshot persisted on disk matches the source'):
+            onDisk = BSONCollection.fromBSON(os.path.join(self.cacheDir, SnapshotCache.key('testServer', 'snapshotSource', 'test') + '.bson'))
+            self.assertEqual(len(onDisk), 301)
+            self.assertEqual(onDisk.count_documents({'reference.doi': '10.0000/fixed'}), 1)
+            self.assertEqual(self.lastSync()['documents'], 301)
+            self.assertEqual(self.lastSync()['syncs'], 3)
+            self.assertGreater(self.lastSync()['bytes'], 0)
+
+        with self.subTest(msg='Deletions trigger a full download'):
+            self.source.delete_one({'_id': changedId})
+            snapshot = self.sync()
+            self.assertEqual(len(snapshot), 300)
+            self.assertTrue(self.lastSync()['lastSyncFull'])
+
+    def test_Invalidate(self):
+        self.sync()
+        with redirect_stdout(StringIO()):
+            self.cache.sync(self.source, 'otherServer', 'snapshotSource', 'test')
+        self.assertEqual(len(self.cache.stats()), 2)
+        self.assertEqual(self.cache.invalidate(server='testServer'), 1)
+        self.assertListEqual([s['server'] for s in self.cache.stats().values()], ['otherServer'])
+        self.assertEqual(self.cache.invalidate(), 1)
+        self.assertDictEqual(self.cache.stats(), {})
+
+    def test_Analyzer(self):
+        with redirect_stdout(StringIO()):
+            sD = analysis.SingleDOIAnalyzer(collectionManualOverride=self.source, snapshotCache=self.cacheDir)
+        self.assertIsInstance(sD.collection, BSONCollection)
+        self.assertIs(sD.sourceCollection, self.source)
+        self.assertEqual(len(sD.get_allDOIs()), 157)
+
+        self.source.insert_one({'_id': bson.ObjectId(), 'meta': {'name': 'New Contributor', 'timeStamp': datetime.datetime(2030, 1, 1)},
+                                'material': {'formula': 'Ni50 Cr50'}, 'reference': {'doi': '10.0000/new'}})
+        with redirect_stdout(StringIO()):
+            sD.syncSnapshot()
+        self.assertEqual(len(sD.get_allDOIs()), 158)
+        self.assertEqual(sD.get_allDOIs()[-1], '10.0000/new')
+
+    def test_AnalyzerFromBSON(self):
+        with redirect_stdout(StringIO()):
+            sD = analysis.SingleDOIAnalyzer.fromBSON('examples/ULTERA_sample.bson', snapshotCache=self.cacheDir)
+        self.assertIsInstance(sD.collection, BSONCollection)
+        self.assertIsNot(sD.collection, sD.sourceCollection)
+        self.assertEqual(len(sD.get_allDOIs()), 157)
+        key = SnapshotCache.key('pyqalloy', 'BSONCollection', 'examples/ULTERA_sample.bson')
+        self.assertListEqual(list(self.cache.stats()), [key])
+
+        with self.subTest(msg='A new analyzer of the same file syncs the same snapshot'):
+            with redirect_stdout(StringIO()):
+                analysis.SingleDOIAnalyzer.fromBSON('examples/ULTERA_sample.bson', snapshotCache=self.cacheDir)
+            self.assertListEqual(list(self.cache.stats()), [key])
+            self.assertEqual(self.cache.stats()[key]['syncs'], 2)
+            self.assertFalse(self.cache.stats()[key]['lastSyncFull'])
+
+    def tearDown(self) -> None:
+        self.client.drop_database('snapshotSource')
+        shutil.rmtree(self.cacheDir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,10 @@
 import unittest
 import json
+import gzip
+import importlib.util
+import os
+import shutil
+import tempfile
 from io import StringIO
 from contextlib import redirect_stdout
 
@@ -8,6 +13,7 @@ from pyqalloy.curation import analysis
 from montydb import MontyClient
 from montydb.types.bson import init as init_bson
 import bson
+import bson.json_util
 
 
     
@@ -32,21 +38,23 @@ class TestTemplateParsingIntoJSON(unittest.TestCase):
         ]
         """
         
+        self.templateDir = tempfile.mkdtemp()
+        self.jsonPath = os.path.join(self.templateDir, 'data.json')
         with self.subTest('Runtime execution of the parsing (plus output capture.)'):
             output = StringIO()
             with redirect_stdout(output):
-                pyqalloy.parseTemplateToJSON('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', 'data.json')
+                pyqalloy.parseTemplateToJSON('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', self.jsonPath)
             self.parsingPrintout = output.getvalue()
 
     def test_JSON_present(self):
         with self.subTest('Check if the JSON file was created (even if it is empty).'):
-            with open('data.json', 'r') as f:
+            with open(self.jsonPath, 'r') as f:
                 self.jsonData = f.read()
             self.assertGreater(len(self.jsonData), 0)
             
 
         with self.subTest('Check if the JSON file has the data payload (json loadable).'):
-            with open('data.json', 'r') as f:
+            with open(self.jsonPath, 'r') as f:
                 self.jsonData = f.read()
             self.assertIsInstance(json.loads(self.jsonData), list)
                 
@@ -59,7 +67,7 @@ class TestTemplateParsingIntoJSON(unittest.TestCase):
             self.assertIn('Reading the metadata.', self.parsingPrintout, msg='Metadata reading not found.')
             self.assertIn('L10  [x]', self.parsingPrintout, msg='Line 10 successful upload (first data line in the template) was expected but not found.')
             self.assertIn('MoNbTaW', self.parsingPrintout, msg='MoNbTaW on template example line 10 was expected but not found.')
-            self.assertIn('Persisted the data to the target file:  data.json', self.parsingPrintout)
+            self.assertIn(f'Persisted the data to the target file:  {self.jsonPath}', self.parsingPrintout)
 
         with self.subTest('Check if the error message is present in the printout.'):
             self.assertIn('Upload failed! --->', self.parsingPrintout)
@@ -69,7 +77,7 @@ class TestTemplateParsingIntoJSON(unittest.TestCase):
                 self.assertIn(f'L{line:<3} [ ]', self.parsingPrintout, msg=f'Error on line {line} not found.')
 
     def test_references(self):
-        with open('data.json', 'r') as f:
+        with open(self.jsonPath, 'r') as f:
             self.jsonData = f.read()
         dataDicts = json.loads(self.jsonData)
         for i, entry in enumerate(dataDicts):
@@ -95,15 +103,15 @@ class TestTemplateParsingIntoJSON(unittest.TestCase):
 
     def test_NoIndentationJSON(self):
         with self.subTest('Runtime execution of the parsing with no-indentation JSON output.'):
-            pyqalloy.parseTemplateToJSON('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', 'data-ni.json', indent=None, verbose=False)
+            pyqalloy.parseTemplateToJSON('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', os.path.join(self.templateDir, 'data-ni.json'), indent=None, verbose=False)
         
         with self.subTest('Check if the JSON file was created (even if it is empty).'):
-            with open('data-ni.json', 'r') as f:
+            with open(os.path.join(self.templateDir, 'data-ni.json'), 'r') as f:
                 self.jsonData = f.read()
             self.assertGreater(len(self.jsonData), 0)
 
         with self.subTest('Check that the JSON can be loaded without errors.'):
-            with open('data-ni.json', 'r') as f:
+            with open(os.path.join(self.templateDir, 'data-ni.json'), 'r') as f:
                 self.jsonData = f.read()
             loadedData = json.loads(self.jsonData)
             self.assertIsInstance(loadedData, list)
@@ -113,7 +121,7 @@ class TestTemplateParsingIntoJSON(unittest.TestCase):
             self.assertEqual(self.jsonData.count('\n') - 2, self.expectedEntries)
 
     def tearDown(self):
-        pass
+        shutil.rmtree(self.templateDir)
 
 
 class TestTemplateParsingIntoBSON(unittest.TestCase):
@@ -137,15 +145,17 @@ class TestTemplateParsingIntoBSON(unittest.TestCase):
         ]
         """
         
+        self.templateDir = tempfile.mkdtemp()
+        self.bsonPath = os.path.join(self.templateDir, 'data.bson')
         with self.subTest('Runtime execution of the parsing (plus output capture.)'):
             output = StringIO()
             with redirect_stdout(output):
-                pyqalloy.parseTemplateToBSON('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', 'data.bson')
+                pyqalloy.parseTemplateToBSON('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', self.bsonPath)
             self.parsingPrintout = output.getvalue()
 
     def test_BSON_present(self):
         with self.subTest('Check if the BSON file was created (even if it is empty).'):
-            with open('data.bson', 'rb') as f:
+            with open(self.bsonPath, 'rb') as f:
                 self.bsonData = f.read()
             self.assertGreater(len(self.bsonData), 0)
 
@@ -158,7 +168,7 @@ class TestTemplateParsingIntoBSON(unittest.TestCase):
             self.assertIn('Reading the metadata.', self.parsingPrintout, msg='Metadata reading not found.')
             self.assertIn('L10  [x]', self.parsingPrintout, msg='Line 10 successful upload (first data line in the template) was expected but not found.')
             self.assertIn('MoNbTaW', self.parsingPrintout, msg='MoNbTaW on template example line 10 was expected but not found.')
-            self.assertIn('Persisted the data to the target file:  data.bson', self.parsingPrintout)
+            self.assertIn(f'Persisted the data to the target file:  {self.bsonPath}', self.parsingPrintout)
 
         with self.subTest('Check if the error message is present in the printout.'):
             self.assertIn('Upload failed! --->', self.parsingPrintout)
@@ -167,11 +177,25 @@ class TestTemplateParsingIntoBSON(unittest.TestCase):
             for line in self.errorLines:
                 self.assertIn(f'L{line:<3} [ ]', self.parsingPrintout, msg=f'Error on line {line} not found.')
 
+    def test_layout(self):
+        with open(self.bsonPath, 'rb') as f:
+            raw = f.read()
+        docs = bson.decode_all(raw)
+
+        with self.subTest('Check if the documents are stored the way MongoDB stores them, with the "_id" first.'):
+            for d in docs:
+                self.assertEqual(list(d.keys())[:2], ['_id', 'meta'])
+                self.assertIsInstance(d['_id'], bson.ObjectId)
+            self.assertEqual(len(set(d['_id'] for d in docs)), self.expectedEntries)
+
+        with self.subTest('Check if the file is a plain concatenation of the BSON documents.'):
+            self.assertEqual(b''.join(bson.encode(d) for d in docs), raw)
+
     def test_references(self):
         init_bson(use_bson=True)
         tempCollection = MontyClient(":memory:").db.test
 
-        with open('data.bson', 'rb+') as f:
+        with open(self.bsonPath, 'rb+') as f:
             tempCollection.insert_many(bson.decode_all(f.read()))
 
         with self.subTest('Check if the collection has been populated with the expected number of entries.'):
@@ -197,7 +221,366 @@ class TestTemplateParsingIntoBSON(unittest.TestCase):
                 )
 
     def tearDown(self):
-        pass
+        shutil.rmtree(self.templateDir)
     
+class TestTemplateParsingIntoJSONL(unittest.TestCase):
+    """Tests the parsing of the template provided in the examples folder into the JSON Lines format, both plain and gzip-compressed,
+    against the entries exported into the regular JSON format.
+    """
+
+    def setUp(self):
+        self.expectedEntries = 82
+        self.templateDir = tempfile.mkdtemp()
+        output = StringIO()
+        with redirect_stdout(output):
+            pyqalloy.parseTemplateToJSON('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', os.path.join(self.templateDir, 'data.json'), indent=None)
+            pyqalloy.parseTemplateToJSONL('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', os.path.join(self.templateDir, 'data.jsonl'))
+            pyqalloy.parseTemplateToJSONL('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', os.path.join(self.templateDir, 'data.jsonl.gz'))
+        self.parsingPrintout = output.getvalue()
+        with open(os.path.join(self.templateDir, 'data.json'), 'r') as f:
+            self.referenceEntries = json.load(f)
+        for entry in self.referenceEntries:
+            entry.pop('_id')
+            entry['meta'].pop('timeStamp')
+
+    def compareEntries(self, lines):
+        with self.subTest('Check if there is exactly one entry per line.'):
+            self.assertEqual(len(lines), self.expectedEntries)
+        entries = [bson.json_util.loads(line) for line in lines]
+        with self.subTest('Check if the entries have MongoDB types.'):
+            self.assertIsInstance(entries[0]['_id'], bson.ObjectId)
+        for entry in entries:
+            entry.pop('_id')
+            entry['meta'].pop('timeStamp')
+        with self.subTest('Check if the entries match the JSON export.'):
+            self.assertListEqual(json.loads(bson.json_util.dumps(entries)), self.referenceEntries)
+
+    def test_JSONL(self):
+        with open(os.path.join(self.templateDir, 'data.jsonl'), 'r') as f:
+            self.compareEntries(f.read().splitlines())
+        self.assertIn(f'Persisted the data to the target file:  {os.path.join(self.templateDir, "data.jsonl")}', self.parsingPrintout)
+
+    def test_JSONLgzip(self):
+        with gzip.open(os.path.join(self.templateDir, 'data.jsonl.gz'), 'rt') as f:
+            self.compareEntries(f.read().splitlines())
+
+    def tearDown(self):
+        shutil.rmtree(self.templateDir)
+
+
+@unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'The optional pyarrow dependency is not installed.')
+class TestTemplateParsingIntoParquet(unittest.TestCase):
+    """Tests the parsing of the template provided in the examples folder into the columnar Parquet and Arrow IPC formats against
+    the entries exported into the JSON Lines format.
+    """
+
+    def setUp(self):
+        self.templateDir = tempfile.mkdtemp()
+        output = StringIO()
+        with redirect_stdout(output):
+            pyqalloy.parseTemplateToJSONL('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', os.path.join(self.templateDir, 'data.jsonl'))
+            pyqalloy.parseTemplateToParquet('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', os.path.join(self.templateDir, 'data.parquet'), batchSize=25)
+            pyqalloy.parseTemplateToParquet('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', os.path.join(self.templateDir, 'data.arrow'))
+            pyqalloy.parseTemplateToParquet('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', os.path.join(self.templateDir, 'narrow.parquet'), elements=['Nb', 'Mo', 'Ta', 'W', 'Ti', 'V'])
+        self.parsingPrintout = output.getvalue()
+        with open(os.path.join(self.templateDir, 'data.jsonl'), 'r') as f:
+            self.referenceEntries = [bson.json_util.loads(line) for line in f]
+
+    def compareEntries(self, table):
+        self.assertEqual(table.num_rows, len(self.referenceEntries))
+        elements = json.loads(table.schema.metadata[b'elements'])
+        fractions = table['compositionFractions'].combine_chunks().flatten().to_numpy().reshape(table.num_rows, len(elements))
+        rows = table.drop_columns(['compositionFractions']).to_pylist()
+        for i, (row, entry) in enumerate(zip(rows, self.referenceEntries)):
+            with self.subTest(f'Check the row {i} against the JSON Lines entry.'):
+                self.assertEqual(row['formula'], entry['material']['formula'])
+                self.assertEqual(row['propertyName'], entry['property'].get('name'))
+                self.assertEqual(row['propertyValue'], entry['property'].get('value'))
+                self.assertEqual(row['propertyTemperature'], entry['property'].get('temperature'))
+                self.assertEqual(row['doi'], entry['reference'].get('doi'))
+                self.assertEqual(row['pointer'], entry['reference'].get('pointer'))
+                self.assertDictEqual(
+                    {el: f for el, f in zip(elements, fractions[i]) if f > 0}, entry['material']['compositionDictionary'])
+
+    def test_Parquet(self):
+        import pyarrow.parquet as pq
+        parquetFile = pq.ParquetFile(os.path.join(self.templateDir, 'data.parquet'))
+        with self.subTest('Check if the data is written in row groups of the batch size.'):
+            self.assertEqual(parquetFile.metadata.num_row_groups, 4)
+        self.compareEntries(parquetFile.read())
+
+    def test_Arrow(self):
+        import pyarrow as pa
+        with pa.memory_map(os.path.join(self.templateDir, 'data.arrow'), 'r') as source:
+            self.compareEntries(pa.ipc.open_file(source).read_all())
+
+    def test_FixedElements(self):
+        import pyarrow.parquet as pq
+        table = pq.read_table(os.path.join(self.templateDir, 'narrow.parquet'))
+        with self.subTest('Check if the entries with elements outside of the matrix are rejected.'):
+            self.assertEqual(table.schema.field('compositionFractions').type.list_size, 6)
+            self.assertGreater(table.num_rows, 0)
+            self.assertLess(table.num_rows, len(self.referenceEntries))
+            self.assertIn('is not among the elements of the composition fraction matrix', self.parsingPrintout)
+
+    def test_NumericStringCells(self):
+        import pyarrow.parquet as pq
+        from openpyxl import load_workbook
+        # The formula cells are saved with their calculated values, so that the template copy parses the same way
+        workbook = load_workbook('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', data_only=True)
+        sheet = workbook.worksheets[0]
+        sheet['G10'], sheet['L10'] = 1, 2.5
+        sheet['G11'] = sheet['L11'] = 3
+        template = os.path.join(self.templateDir, 'numeric.xlsx')
+        workbook.save(template)
+        with redirect_stdout(StringIO()):
+            pyqalloy.parseTemplateToParquet(template, os.path.join(self.templateDir, 'numeric.parquet'), batchSize=25)
+        table = pq.read_table(os.path.join(self.templateDir, 'numeric.parquet'))
+        self.assertEqual(table.num_rows, len(self.referenceEntries))
+        rows = table.select(['propertySource', 'propertyUnit']).to_pylist()
+        self.assertDictEqual(rows[0], {'propertySource': '1', 'propertyUnit': '2.5'})
+        self.assertDictEqual(rows[1], {'propertySource': '3', 'propertyUnit': '3'})
+
+    def test_InvalidEntryRejectedAlone(self):
+        import copy
+        import pyarrow.parquet as pq
+        from pyqalloy.core.pyqalloy import _ArrowEntryWriter
+        invalid = copy.deepcopy(self.referenceEntries[1])
+        invalid['property']['temperature'] = 'room temperature'
+        target = os.path.join(self.templateDir, 'invalid.parquet')
+        with _ArrowEntryWriter(target, 'parquet', batchSize=2) as writer:
+            writer.write(self.referenceEntries[0])
+            with self.assertRaisesRegex(ValueError, "property temperature value 'room temperature' is not a number"):
+                writer.write(invalid)
+            for entry in self.referenceEntries[1:5]:
+                writer.write(entry)
+        table = pq.read_table(target)
+        self.assertEqual(table.num_rows, 5)
+        self.assertListEqual(table['rawFormula'].to_pylist(), [e['material']['rawFormula'] for e in self.referenceEntries[:5]])
+
+    def tearDown(self):
+        shutil.rmtree(self.templateDir)
+
+
+class TestParallelTemplateParsing(unittest.TestCase):
+    """Tests the parallel parsing of many templates into a single collection or file, i.e., that the result does not depend on
+    the number of workers, that the per-template error reports are merged, and that unreadable templates do not stop the others.
+    """
+
+    def setUp(self):
+        self.templateDir = tempfile.mkdtemp()
+        self.templates = []
+        for i in range(3):
+            self.templates.append(os.path.join(self.templateDir, f'template{i}.xlsx'))
+            shutil.copy('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', self.templates[-1])
+
+    def test_IntoCollection(self):
+        init_bson(use_bson=True)
+        collection = MontyClient(":memory:").parallelUpload.test
+        output = StringIO()
+        with redirect_stdout(output):
+            summary = pyqalloy.parseTemplates(self.templateDir, collection, workers=2, batchSize=100)
+
+        with self.subTest('Check the merged summary.'):
+            self.assertEqual(summary['datapoints'], 3*83)
+            self.assertEqual(summary['inserted'], 3*82)
+            self.assertDictEqual(summary['errors'], {t: [81] for t in self.templates})
+            self.assertEqual(collection.count_documents({}), 3*82)
+
+        with self.subTest('Check the per-template summaries.'):
+            for t in self.templates:
+                self.assertEqual(summary['templates'][t]['inserted'], 82)
+                self.assertEqual(collection.count_documents({'meta.dataSheetName': t}), 82)
+
+    def test_IntoFile(self):
+        output = StringIO()
+        with redirect_stdout(output):
+            serial = pyqalloy.parseTemplates(self.templates, os.path.join(self.templateDir, 'serial.jsonl'), workers=1)
+            parallel = pyqalloy.parseTemplates(self.templates + ['missing.xlsx'], os.path.join(self.templateDir, 'parallel.jsonl'), workers=3)
+
+        with self.subTest('Check if unreadable templates are reported.'):
+            self.assertListEqual(list(parallel['failedTemplates']), ['missing.xlsx'])
+            self.assertEqual(serial['inserted'], parallel['inserted'])
+
+        with self.subTest('Check if the order of the entries does not depend on the number of workers.'):
+            entries = []
+            for f in ['serial.jsonl', 'parallel.jsonl']:
+                with open(os.path.join(self.templateDir, f), 'r') as fp:
+                    docs = [bson.json_util.loads(line) for line in fp]
+                entries.append([(d['meta']['dataSheetName'], d['material']['rawFormula']) for d in docs])
+            self.assertEqual(len(entries[0]), 3*82)
+            self.assertListEqual(entries[0], entries[1])
+
+    @unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'The optional pyarrow dependency is not installed.')
+    def test_IntoParquetBatchSize(self):
+        import pyarrow.parquet as pq
+        with redirect_stdout(StringIO()):
+            pyqalloy.parseTemplates(self.templates, os.path.join(self.templateDir, 'small.parquet'), workers=1, batchSize=50)
+            pyqalloy.parseTemplates(self.templates, os.path.join(self.templateDir, 'default.parquet'), workers=1)
+        with self.subTest('Check if the requested batch size is used for the row groups.'):
+            self.assertEqual(pq.ParquetFile(os.path.join(self.templateDir, 'small.parquet')).metadata.num_row_groups, 5)
+        with self.subTest('Check if the columnar default batch size is used otherwise.'):
+            self.assertEqual(pq.ParquetFile(os.path.join(self.templateDir, 'default.parquet')).metadata.num_row_groups, 1)
+
+    def test_WorkerIsPicklable(self):
+        import pickle
+        from pyqalloy.core.workers import parseTemplateWorker
+        self.assertIs(pickle.loads(pickle.dumps(parseTemplateWorker)), parseTemplateWorker)
+
+    def tearDown(self):
+        shutil.rmtree(self.templateDir)
+
+
+class TestLargeTemplateParsing(unittest.TestCase):
+    """Tests the streaming reader on a template longer than the 10,000 rows previously read from the templates, with
+    blank lines and missing values in the middle of the data block.
+    """
+
+    def setUp(self):
+        from openpyxl import load_workbook
+        self.templateDir = tempfile.mkdtemp()
+        self.template = os.path.join(self.templateDir, 'large.xlsx')
+        # The cached values of the formulas are kept, as openpyxl does not compute them when saving
+        workbook = load_workbook('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', data_only=True)
+        sheet = workbook.worksheets[0]
+        # The example template data ends on line 92
+        for l in range(94, 10200):
+            sheet.cell(row=l, column=2, value=f'Ni{l % 50 + 50} Cr{50 - l % 50}')
+            sheet.cell(row=l, column=6, value='hardness')
+            sheet.cell(row=l, column=10, value=1e9)
+            sheet.cell(row=l, column=13, value='N/A' if l % 2 else 'F1')
+        for l in range(10200, 10210):
+            sheet.cell(row=l, column=2, value=None)
+        sheet.cell(row=10210, column=2, value='MoNbTaW')
+        workbook.save(self.template)
+
+    def test_StreamingReader(self):
+        output = StringIO()
+        with redirect_stdout(output):
+            pyqalloy.parseTemplateToJSONL(self.template, os.path.join(self.templateDir, 'large.jsonl'), verbose=False)
+        with open(os.path.join(self.templateDir, 'large.jsonl'), 'r') as f:
+            entries = [bson.json_util.loads(line) for line in f]
+
+        with self.subTest('Check if all the rows past the 10,000th are read and the blank lines are skipped.'):
+            self.assertEqual(len(entries), 82 + 10200 - 94 + 1)
+            self.assertIn('Imported 10190 datapoints.', output.getvalue())
+            self.assertEqual(entries[-1]['material']['rawFormula'], 'MoNbTaW')
+
+        with self.subTest('Check the values of the added rows.'):
+            self.assertEqual(entries[82]['material']['rawFormula'], 'Ni94 Cr6')
+            self.assertEqual(entries[82]['property']['value'], 1e9)
+
+    def test_LineNumbers(self):
+        reader = pyqalloy.core.pyqalloy._readTemplate(self.template, verbose=False)
+        with redirect_stdout(StringIO()):
+            metaData = next(reader)
+            rows = dict(reader)
+        lines = list(rows)
+        self.assertEqual(metaData['name'], 'Adam Krajewski')
+        with self.subTest('Check if the missing values are recognized.'):
+            self.assertEqual(rows[94]['Pointer'], 'F1')
+            self.assertIsNone(rows[95]['Pointer'])
+            self.assertIsNone(rows[10210]['Name'])
+        self.assertEqual(lines[0], 10)
+        self.assertEqual(lines[-1], 10210)
+        self.assertNotIn(93, lines)
+
+    @unittest.skipIf(importlib.util.find_spec('xlrd') is not None, 'The optional xlrd dependency is installed.')
+    def test_LegacyXLSWithoutXlrd(self):
+        legacyTemplate = os.path.join(self.templateDir, 'legacy.xls')
+        shutil.copy('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', legacyTemplate)
+        with self.assertRaisesRegex(ValueError, r'legacy Excel 97-2003 \(\.xls\) file.*save the template as \.xlsx'):
+            with redirect_stdout(StringIO()):
+                pyqalloy.parseTemplateToJSONL(legacyTemplate, os.path.join(self.templateDir, 'legacy.jsonl'))
+
+    def test_LegacyXLS(self):
+        import sys
+        from unittest import mock
+        import pandas as pd
+        # No .xls writer is available, so the legacy template is an .xlsx file read by pandas with openpyxl instead of xlrd
+        legacyTemplate = os.path.join(self.templateDir, 'legacy.xls')
+        shutil.copy('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', legacyTemplate)
+        readExcel = pd.read_excel
+        with mock.patch.dict(sys.modules, {'xlrd': mock.MagicMock()}), \
+                mock.patch('pandas.read_excel', lambda *args, **kwargs: readExcel(*args, engine='openpyxl', **kwargs)):
+            with redirect_stdout(StringIO()):
+                legacy = pyqalloy.parseTemplateToJSONL(legacyTemplate, os.path.join(self.templateDir, 'legacy.jsonl'))
+        with redirect_stdout(StringIO()):
+            reference = pyqalloy.parseTemplateToJSONL(
+                'examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', os.path.join(self.templateDir, 'reference.jsonl'))
+        self.assertEqual(legacy, reference)
+        entries = []
+        for f in ['legacy.jsonl', 'reference.jsonl']:
+            with open(os.path.join(self.templateDir, f), 'r') as fp:
+                entries.append([bson.json_util.loads(line) for line in fp])
+        for entry in entries[0] + entries[1]:
+            del entry['_id'], entry['meta']['timeStamp'], entry['meta']['dataSheetName']
+        self.assertListEqual(entries[0], entries[1])
+
+    def tearDown(self):
+        shutil.rmtree(self.templateDir)
+
+
+class _FailingCollection:
+    """Minimal stand-in for a MongoDB-compatible collection rejecting every other document of each ``insert_many`` batch
+    the way pymongo reports it, i.e., through the ``details`` of a ``BulkWriteError``."""
+
+    class BulkWriteError(Exception):
+        def __init__(self, details):
+            super().__init__('batch op errors occurred')
+            self.details = details
+
+    def __init__(self):
+        self.documents = []
+        self.calls = 0
+
+    def insert_many(self, documents, ordered=True):
+        self.calls += 1
+        self.documents += documents[1::2]
+        raise self.BulkWriteError({
+            'writeErrors': [{'index': i, 'errmsg': 'E11000 duplicate key error'} for i in range(0, len(documents), 2)],
+            'nInserted': len(documents[1::2])})
+
+
+class TestTemplateParsingIntoCollection(unittest.TestCase):
+    """Tests the batched upload of the parsed template entries into a MongoDB-compatible collection, i.e., the returned summary,
+    the number of ``insert_many`` round trips, and the mapping of the per-document write errors back to the template lines.
+    """
+
+    def test_BatchedUpload(self):
+        init_bson(use_bson=True)
+        collection = MontyClient(":memory:").templateUpload.test
+        output = StringIO()
+        with redirect_stdout(output):
+            summary = pyqalloy.parseTemplate('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', collection, batchSize=25)
+
+        with self.subTest('Check the summary against the collection.'):
+            self.assertEqual(summary['datapoints'], 83)
+            self.assertEqual(summary['inserted'], 82)
+            self.assertListEqual(summary['errors'], [81])
+            self.assertEqual(collection.count_documents({}), 82)
+            self.assertGreater(summary['elapsed'], 0)
+
+        with self.subTest('Check if the entries keep the template order.'):
+            self.assertEqual(collection.find_one({})['material']['rawFormula'], 'MoNbTaW ')
+
+    def test_WriteErrors(self):
+        collection = _FailingCollection()
+        output = StringIO()
+        with redirect_stdout(output):
+            summary = pyqalloy.parseTemplate('examples/ExampleTemplateULTERA_ErrorsAdded.xlsx', collection, batchSize=40)
+        printout = output.getvalue()
+
+        with self.subTest('Check the number of round trips.'):
+            self.assertEqual(collection.calls, 3)
+
+        with self.subTest('Check if the write errors are mapped to the template lines.'):
+            self.assertEqual(summary['inserted'], len(collection.documents))
+            self.assertEqual(summary['inserted'] + len(summary['errors']), 83)
+            self.assertListEqual(summary['errors'][:3], [10, 12, 14])
+            self.assertIn(81, summary['errors'])
+            self.assertIn('L12  [ ] Upload failed! ---> E11000 duplicate key error', printout)
+
+
 if __name__ == '__main__':
     unittest.main()